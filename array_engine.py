@@ -0,0 +1,262 @@
+"""
+Replay matches with ratings kept in flat arrays instead of Player objects.
+
+Matches are first encoded into parallel arrays of integer player indices and
+score results, then replayed in a single tight loop. The arithmetic is the
+same as Player.calculateWin followed by Player.calculateLoss, so the
+resulting elos are identical to the object-based path.
+
+Tournaments read from a match_store file are encoded straight from its
+columns, without making a match object or a datetime for each match.
+"""
+
+import math
+from array import array
+from player import classify_score, match_ref
+import match_store
+
+
+class EncodedMatches:
+    """
+    Matches encoded as parallel arrays, in the order they are replayed.
+
+    Fields include:
+    winners         array of int (index of the winner in the player list)
+    losers          array of int (index of the loser in the player list)
+    winresults      array of float (result used for the winner)
+    lossresults     array of float (result used for the loser)
+    valid           array of int (0 if the set should not be counted)
+    positions       array of int (index of the match among all those given
+                    to encode, including the ones that were dropped)
+    matches         list of match json objects, for head-to-head records,
+                    or of indices in store
+    store           match_store.MatchStore the matches were read from, if
+                    any
+    """
+
+    def __init__(self):
+        self.winners = array("l")
+        self.losers = array("l")
+        self.winresults = array("d")
+        self.lossresults = array("d")
+        self.valid = array("b")
+        self.positions = array("q")
+        self.matches = []
+        self.store = None
+        # Number of matches given to encode
+        self.total = 0
+
+    def __len__(self):
+        return len(self.winners)
+
+    def ref(self, n):
+        """
+        Return match_ref of the nth encoded match.
+        """
+        match = self.matches[n]
+        if self.store is not None:
+            return self.store.ref(match)
+        return match_ref(match)
+
+    def started(self, n):
+        """
+        Return the started-at of the nth encoded match, as a timestamp if
+        it was read from a store.
+        """
+        match = self.matches[n]
+        if self.store is not None:
+            started = self.store.started(match)
+            return None if math.isnan(started) else started
+        return match["started-at"]
+
+
+def encode(all_matches, names_by_id, index_by_name):
+    """
+    Encode matches grouped by tournament into an EncodedMatches.
+
+    Matches without a winner are dropped. Matches with an unrecognized score
+    are kept with valid set to 0, matching what Player.calculateWin does.
+
+    Args:
+        all_matches (list of lists): matches grouped by tournament
+        names_by_id (dict): participant id to player name
+        index_by_name (dict): player name to index in the player list
+    """
+    encoded = EncodedMatches()
+    if isinstance(all_matches, match_store.MatchStore):
+        encoded.store = all_matches
+    elif all_matches and all(isinstance(tournament,
+                                        match_store.TournamentMatches)
+                             for tournament in all_matches):
+        encoded.store = all_matches[0].store
+        if any(tournament.store is not encoded.store
+               for tournament in all_matches):
+            encoded.store = None
+    if encoded.store is not None:
+        _encode_columns(encoded, all_matches, names_by_id, index_by_name)
+        return encoded
+    for tournament in all_matches:
+        for match in tournament:
+            encoded.total += 1
+            if match["winner-id"] is None:
+                continue
+            encoded.positions.append(encoded.total - 1)
+            results = classify_score(match["scores-csv"])
+            encoded.winners.append(
+                index_by_name[names_by_id[match["winner-id"]]])
+            encoded.losers.append(
+                index_by_name[names_by_id[match["loser-id"]]])
+            if results is None:
+                encoded.winresults.append(0)
+                encoded.lossresults.append(0)
+                encoded.valid.append(0)
+            else:
+                encoded.winresults.append(results[0])
+                encoded.lossresults.append(results[1])
+                encoded.valid.append(1)
+            encoded.matches.append(match)
+    return encoded
+
+
+def _encode_columns(encoded, all_matches, names_by_id, index_by_name):
+    """
+    Encode the tournaments of a match store from its columns.
+    """
+    store = encoded.store
+    winners = store.winners
+    losers = store.losers
+    scores = store.scores
+    # Results of every distinct score, then of a missing one, which is
+    # where MISSING (-1) points
+    results = [classify_score(score) for score in store.strings]
+    results.append(classify_score(None))
+    for tournament in all_matches:
+        for index in range(tournament.start, tournament.stop):
+            encoded.total += 1
+            winner = winners[index]
+            if winner == match_store.MISSING:
+                continue
+            encoded.positions.append(encoded.total - 1)
+            result = results[scores[index]]
+            encoded.winners.append(index_by_name[names_by_id[winner]])
+            encoded.losers.append(
+                index_by_name[names_by_id[losers[index]]])
+            if result is None:
+                encoded.winresults.append(0)
+                encoded.lossresults.append(0)
+                encoded.valid.append(0)
+            else:
+                encoded.winresults.append(result[0])
+                encoded.lossresults.append(result[1])
+                encoded.valid.append(1)
+            encoded.matches.append(index)
+
+
+def replay(elos, won, played, kconsts, encoded, after=None):
+    """
+    Apply every encoded match to the rating arrays, in order.
+
+    Args:
+        elos (array of float): elo of each player, updated in place
+        won (array of int): sets won by each player, updated in place
+        played (array of int): sets played by each player, updated in place
+        kconsts (array of float): k constant of each player
+        encoded (EncodedMatches): matches to apply
+        after (array of float): if given, the new elos of the winner and
+                                loser of every counted match are appended
+    """
+    # 10**(elo/400) for each player, only recomputed when an elo changes
+    powers = array("d", [10**(elo/400) for elo in elos])
+    for w, l, winresult, lossresult, valid in zip(
+            encoded.winners, encoded.losers, encoded.winresults,
+            encoded.lossresults, encoded.valid):
+        if not valid:
+            continue
+        R1 = powers[w]
+        R2 = powers[l]
+        elo = elos[w] + kconsts[w]*(winresult - R1/(R1+R2))
+        elos[w] = elo
+        # The loser's expectation uses the winner's updated elo,
+        # same as calling calculateWin then calculateLoss
+        R1 = 10**(elo/400)
+        powers[w] = R1
+        if l == w:
+            R2 = R1
+        elo = elos[l] + kconsts[l]*(lossresult - R2/(R1+R2))
+        elos[l] = elo
+        powers[l] = 10**(elo/400)
+        if after is not None:
+            after.append(elos[w])
+            after.append(elo)
+        won[w] += 1
+        played[w] += 1
+        played[l] += 1
+
+
+def replay_matches(players_by_name, names_by_id, all_matches,
+                   history=None, start=0):
+    """
+    Replay matches grouped by tournament onto a dictionary of players.
+
+    Drop-in replacement for calling EloCalculator.parse_match on each match.
+    Elos, win/play counts and head-to-head records of the Player objects are
+    updated exactly as the object-based path would.
+
+    Args:
+        history (RatingHistory): if given, every rating change is recorded
+        start (int): index of the first match, for the history
+
+    Returns:
+        EncodedMatches: the matches that were replayed; total is the number
+                        read, including those without a winner
+    """
+    players = list(players_by_name.values())
+    index_by_name = {name: i for i, name in enumerate(players_by_name)}
+    encoded = encode(all_matches, names_by_id, index_by_name)
+    elos = array("d", [player.elo for player in players])
+    won = array("l", [player.won for player in players])
+    played = array("l", [player.played for player in players])
+    # Player.kconst() does not depend on the rating, so it is read once
+    kconsts = array("d", [player.kconst() for player in players])
+    after = None if history is None else array("d")
+    replay(elos, won, played, kconsts, encoded, after)
+    for player, elo, wins, games in zip(players, elos, won, played):
+        player.elo = elo
+        player.won = wins
+        player.played = games
+    if history is not None:
+        counted = 0
+        for n, (w, l, valid, position) in enumerate(zip(
+                encoded.winners, encoded.losers, encoded.valid,
+                encoded.positions)):
+            if not valid:
+                continue
+            history.record_match(players[w].id, after[counted],
+                                 players[l].id, after[counted + 1],
+                                 encoded.started(n), start + position)
+            counted += 2
+    record_h2h(players, encoded)
+    return encoded
+
+
+def record_h2h(players, encoded):
+    """
+    Add every counted match to the head-to-head records of its players.
+
+    Args:
+        players (list of Players): players, indexed as in encoded
+        encoded (EncodedMatches): matches that were replayed
+    """
+    for n, (w, l, valid) in enumerate(zip(encoded.winners, encoded.losers,
+                                          encoded.valid)):
+        if not valid:
+            continue
+        winner = players[w]
+        loser = players[l]
+        ref = encoded.ref(n)
+        if loser.id not in winner.h2hwins:
+            winner.h2hwins[loser.id] = []
+        winner.h2hwins[loser.id].append(ref)
+        if winner.id not in loser.h2hlosses:
+            loser.h2hlosses[winner.id] = []
+        loser.h2hlosses[winner.id].append(ref)
@@ -0,0 +1,144 @@
+#!/usr/bin/python3
+"""
+Compare rating tournaments as Glicko-2 periods with replaying every match
+with Elo.
+
+Tournaments are generated with synthetic.py, then rated two ways:
+
+    read        EloCalculator.read_matches with the object and array Elo
+                engines and the glicko engine, which includes encoding the
+                matches and recording head-to-heads
+    rate        only the rating updates on matches encoded beforehand:
+                array_engine.replay, one match at a time, against
+                glicko.rate, one period at a time
+
+Glicko-2 is run as numpy arrays if numpy is installed, and one player at a
+time without. The fastest of a few runs is kept. Both Glicko-2 runs must
+give the same ratings, to within rounding.
+
+Usage: benchmarks/glicko_periods.py [players] [tournaments] [runs]
+"""
+
+import os
+import sys
+import time
+from array import array
+
+SCRIPTDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPTDIR)
+import synthetic  # noqa: E402
+import glicko  # noqa: E402
+import array_engine  # noqa: E402
+from elo_calculator import EloCalculator  # noqa: E402
+
+# Ways of running Glicko-2, and the numpy module each uses
+MODES = [("numpy", glicko.numpy), ("one player at a time", None)]
+
+
+def best_time(setup, run, runs):
+    """
+    Return the fastest of runs calls to run(setup()), and its result.
+    """
+    best = None
+    for _ in range(runs):
+        state = setup()
+        begin = time.perf_counter()
+        result = run(state)
+        seconds = time.perf_counter() - begin
+        if best is None or seconds < best:
+            best = seconds
+    return best, result
+
+
+def calculator(data, engine):
+    # A calculator that has read everything but the matches
+    calc = EloCalculator(engine)
+    calc.read_tournaments(data[0])
+    calc.read_participants(data[1])
+    return calc
+
+
+def read(data, runs):
+    """
+    Time EloCalculator.read_matches with every engine.
+
+    Returns:
+        list of tuples: (label, seconds, elos) of every run
+    """
+    results = []
+    for engine in ("object", "array"):
+        seconds, calc = best_time(lambda: calculator(data, engine),
+                                  lambda calc: calc.read_matches(data[2])
+                                  or calc, runs)
+        results.append(("elo, " + engine, seconds,
+                        [player.elo for player in calc.roster]))
+    for label, module in MODES:
+        if label == "numpy" and module is None:
+            continue
+        glicko.numpy = module
+        seconds, calc = best_time(lambda: calculator(data, "glicko"),
+                                  lambda calc: calc.read_matches(data[2])
+                                  or calc, runs)
+        results.append(("glicko, " + label, seconds,
+                        [player.elo for player in calc.roster]))
+    glicko.numpy = MODES[0][1]
+    return results
+
+
+def rate(data, runs):
+    """
+    Time only the rating updates, on matches encoded once beforehand.
+
+    Returns:
+        list of tuples: (label, seconds, elos) of every run
+    """
+    calc = calculator(data, "array")
+    index_by_name = {name: player.id
+                     for name, player in calc.players_by_name.items()}
+    encoded = array_engine.encode(data[2], calc.names_by_id, index_by_name)
+    bounds = glicko.periods(data[2], encoded)
+    size = len(calc.roster)
+    start = array("d", [player.elo for player in calc.roster])
+    kconsts = array("d", [player.kconst() for player in calc.roster])
+
+    def elo(elos):
+        array_engine.replay(elos, array("l", [0]) * size,
+                            array("l", [0]) * size, kconsts, encoded)
+        return elos
+
+    seconds, elos = best_time(lambda: array("d", start), elo, runs)
+    results = [("elo, array", seconds, list(elos))]
+    for label, module in MODES:
+        if label == "numpy" and module is None:
+            continue
+        glicko.numpy = module
+        seconds, elos = best_time(
+            lambda: array("d", start),
+            lambda elos: glicko.rate(elos, glicko.GlickoState(), encoded,
+                                     bounds) or elos, runs)
+        results.append(("glicko, " + label, seconds, list(elos)))
+    glicko.numpy = MODES[0][1]
+    return results
+
+
+def main(numplayers=40000, numtournaments=2000, runs=3):
+    data = synthetic.generate(numplayers, numtournaments)
+    print("{} players, {} tournaments, {} matches".format(
+        numplayers, numtournaments,
+        sum(len(matches) for matches in data[2])))
+    print("{:6s} {:28s} {:>10s}".format("STEP", "ENGINE", "SECONDS"))
+    for step in (read, rate):
+        results = step(data, runs)
+        for label, seconds, elos in results:
+            print("{:6s} {:28s} {:>10.3f}".format(step.__name__, label,
+                                                  seconds))
+        rated = [elos for label, seconds, elos in results
+                 if label.startswith("glicko")]
+        worst = max((abs(a - b) for a, b in zip(rated[0], rated[-1])),
+                    default=0)
+        if worst > 1e-6:
+            raise AssertionError("Glicko-2 ratings differ by " + str(worst))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:4]])
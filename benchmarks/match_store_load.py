@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+"""
+Compare reading matches from matches.pkl with reading them from a match
+store (see match_store.py), each in a fresh interpreter.
+
+Tournaments are generated (see synthetic.py) and saved both ways, then
+each way of reading the matches is run on its own, and again followed by
+a replay with the array engine. The fastest wall time and the peak
+resident memory of each are printed.
+
+Usage: benchmarks/match_store_load.py [players] [tournaments] [runs]
+"""
+
+import os
+import sys
+import time
+import tempfile
+import subprocess
+
+SCRIPTDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPTDIR)
+import synthetic  # noqa: E402
+
+# Reads the matches one way, replays them if asked, and prints the peak
+# resident memory in kilobytes. ru_maxrss is kept across exec on Linux, so
+# it would include this process; VmHWM is the child's own
+CHILD = """
+import sys
+import pickle
+import resource
+objdir, how, replay = sys.argv[1:4]
+if how == "pickle":
+    with open(objdir + "/matches.pkl", "rb") as f:
+        matches = pickle.load(f)
+else:
+    import match_store
+    matches = match_store.MatchStore(objdir + "/matches.cols")
+if replay == "replay":
+    from elo_calculator import EloCalculator
+    calculator = EloCalculator("array")
+    with open(objdir + "/tournaments.pkl", "rb") as f:
+        calculator.read_tournaments(pickle.load(f))
+    with open(objdir + "/participants.pkl", "rb") as f:
+        calculator.read_participants(pickle.load(f))
+    calculator.read_matches(matches)
+try:
+    with open("/proc/self/status") as f:
+        print([line.split()[1] for line in f
+               if line.startswith("VmHWM:")][0])
+except OSError:
+    print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def best_run(command, runs, env):
+    """
+    Return the fastest wall time, in seconds, and the largest peak
+    resident memory, in MB, of running a command.
+    """
+    times = []
+    memory = 0
+    for _ in range(runs):
+        begin = time.perf_counter()
+        output = subprocess.run(command, env=env, check=True,
+                                stdout=subprocess.PIPE).stdout
+        times.append(time.perf_counter() - begin)
+        memory = max(memory, int(output) / 1024)
+    return min(times), memory
+
+
+def main(numplayers=20000, numtournaments=1000, runs=3):
+    env = dict(os.environ, PYTHONPATH=SCRIPTDIR + os.pathsep
+               + os.environ.get("PYTHONPATH", ""))
+    with tempfile.TemporaryDirectory() as tempdir:
+        data = synthetic.generate(numplayers, numtournaments)
+        synthetic.write(data, tempdir)
+        objdir = os.path.join(tempdir, "obj")
+        print("{} tournaments, {} matches; matches.pkl {:.1f} MB,"
+              " matches.cols {:.1f} MB, best of {}".format(
+                  numtournaments, sum(len(matches) for matches in data[2]),
+                  os.path.getsize(os.path.join(objdir, "matches.pkl")) / 2**20,
+                  os.path.getsize(os.path.join(objdir, "matches.cols"))
+                  / 2**20, runs))
+        print("{:24s} {:>10s} {:>10s}".format("", "SECONDS", "PEAK MB"))
+        for replay in ("load", "replay"):
+            for how in ("pickle", "store"):
+                seconds, memory = best_run(
+                    [sys.executable, "-c", CHILD, objdir, how, replay], runs,
+                    env)
+                print("{:24s} {:>10.3f} {:>10.1f}".format(
+                    "{} from {}".format(replay, how), seconds, memory))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:4]])
@@ -0,0 +1,62 @@
+#!/usr/bin/python3
+"""
+Time EloList.export_spreadsheet on a large generated player pool.
+
+Each player gets head-to-heads against a handful of random opponents, which
+is what real data looks like: almost every pair has never played.
+
+Usage: benchmarks/mu_chart.py [players] [opponents per player] [tile]
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+import resource
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from player import Player  # noqa: E402
+from elo_list import EloList  # noqa: E402
+
+
+def make_players(numplayers, opponents, seed=0):
+    """
+    Generate players with random elos and sparse head-to-head records.
+    """
+    rng = random.Random(seed)
+    roster = []
+    for i in range(numplayers):
+        player = Player("PLAYER %d" % i, i, roster)
+        player.elo = rng.gauss(Player.DEFAULT_ELO, 100)
+        roster.append(player)
+    ref = ("2017-01-01", "2-0")
+    for player in roster:
+        for pid in rng.sample(range(numplayers), opponents):
+            if pid == player.id:
+                continue
+            for _ in range(rng.randint(1, 3)):
+                player.h2hwins.setdefault(pid, []).append(ref)
+                roster[pid].h2hlosses.setdefault(player.id, []).append(ref)
+    return roster
+
+
+def main(numplayers=5000, opponents=20, tile=0):
+    elos = EloList()
+    elos.elolist = make_players(numplayers, opponents)
+    with tempfile.TemporaryDirectory() as tempdir:
+        wbpath = os.path.join(tempdir, "MU Chart.xlsx")
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        begin = time.perf_counter()
+        elos.export_spreadsheet(tile=tile or None, wbpath=wbpath)
+        seconds = time.perf_counter() - begin
+        after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        size = os.path.getsize(wbpath)
+    print("{} players, {} opponents each, tile {}".format(
+        numplayers, opponents, tile or "none"))
+    print("export: {:.2f} s, peak RSS grew by {:,d} KiB, file {:,d} bytes"
+          .format(seconds, after - before, size))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:4]])
@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+"""
+Compare replaying matches in one process with replaying groups of players
+who never meet in several (see components.py).
+
+Tournaments are generated for several regions whose players never enter
+the same tournament (see synthetic.py), then the matches are replayed
+with the array engine in one process and split over 2, 4, ... processes,
+up to the number of CPUs. The time includes starting the processes,
+sending each its batch of players and matches, and sending the players
+back. Every run must give exactly the same players.
+
+The serial replay is also timed phase by phase. Only the rating loop runs
+in other processes; encoding matches and adding head-to-heads stay in
+this one, so the share of the rating loop bounds any speedup, however
+many CPUs there are.
+
+Usage: benchmarks/parallel_replay.py [players] [tournaments] [regions] [runs]
+"""
+
+import os
+import sys
+import time
+from array import array
+
+SCRIPTDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPTDIR)
+import synthetic  # noqa: E402
+import components  # noqa: E402
+import array_engine  # noqa: E402
+from elo_calculator import EloCalculator  # noqa: E402
+
+
+def calculator(data):
+    # A calculator that has read everything but the matches
+    calc = EloCalculator("array")
+    calc.read_tournaments(data[0])
+    calc.read_participants(data[1])
+    return calc
+
+
+def state(calc):
+    return [(player.name, player.elo, player.won, player.played,
+             player.h2hwins, player.h2hlosses) for player in calc.roster]
+
+
+def best_time(data, jobs, runs):
+    """
+    Return the fastest time to replay every match, and the players after.
+    """
+    times = []
+    for _ in range(runs):
+        calc = calculator(data)
+        begin = time.perf_counter()
+        components.replay_matches(calc.players_by_name, calc.names_by_id,
+                                  data[2], jobs=jobs)
+        times.append(time.perf_counter() - begin)
+    return min(times), state(calc)
+
+
+def phases(data):
+    """
+    Return the time taken to encode, rate and add head-to-heads in a serial
+    replay with the array engine.
+    """
+    calc = calculator(data)
+    players = calc.roster
+    index_by_name = {name: i for i, name in enumerate(calc.players_by_name)}
+    begin = time.perf_counter()
+    encoded = array_engine.encode(data[2], calc.names_by_id, index_by_name)
+    encoding = time.perf_counter()
+    array_engine.replay(array("d", [player.elo for player in players]),
+                        array("l", [0]) * len(players),
+                        array("l", [0]) * len(players),
+                        array("d", [player.kconst() for player in players]),
+                        encoded)
+    rating = time.perf_counter()
+    array_engine.record_h2h(players, encoded)
+    end = time.perf_counter()
+    return encoding - begin, rating - encoding, end - rating
+
+
+def main(numplayers=40000, numtournaments=2000, regions=8, runs=3):
+    data = synthetic.generate(numplayers, numtournaments, regions=regions)
+    calc = calculator(data)
+    begin = time.perf_counter()
+    groups = components.components(calc.players_by_name, calc.names_by_id,
+                                   data[2])
+    grouping = time.perf_counter() - begin
+    print("{} players, {} tournaments, {} regions, {} matches, {} CPUs"
+          .format(len(calc.roster), numtournaments, regions,
+                  sum(len(matches) for matches in data[2]), os.cpu_count()))
+    print("{} groups found in {:.1f} ms".format(len(groups),
+                                                 grouping * 1000))
+    encoding, rating, h2h = phases(data)
+    share = rating / (encoding + rating + h2h)
+    print("encode {:.3f} s, rate {:.3f} s, head-to-heads {:.3f} s: at most"
+          " {:.2f}x faster with any number of processes"
+          .format(encoding, rating, h2h, 1 / (1 - share)))
+    serial, expected = best_time(data, 1, runs)
+    print("{:>4s} {:>10s} {:>8s}".format("JOBS", "SECONDS", "SPEEDUP"))
+    print("{:>4d} {:>10.3f} {:>8.2f}".format(1, serial, 1))
+    jobs = 2
+    while jobs <= max(2, os.cpu_count() or 1):
+        seconds, players = best_time(data, jobs, runs)
+        if players != expected:
+            raise AssertionError(str(jobs) + " jobs gave different players")
+        print("{:>4d} {:>10.3f} {:>8.2f}".format(jobs, seconds,
+                                                 serial / seconds))
+        jobs *= 2
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:5]])
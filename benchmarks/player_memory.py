@@ -0,0 +1,128 @@
+#!/usr/bin/python3
+"""
+Compare the memory footprint of head-to-head storage before and after
+Player switched to integer ids and compact match references.
+
+The "before" model keeps what Player used to keep: dictionaries keyed by
+opponent Player objects holding every full match json object.
+
+Usage: benchmarks/player_memory.py [players] [matches]
+"""
+
+import os
+import sys
+import time
+import pickle
+import random
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from player import Player  # noqa: E402
+
+
+class LegacyPlayer:
+    """
+    Player as it was before: no slots, h2h dicts of full match objects.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.elo = float(Player.DEFAULT_ELO)
+        self.won = 0
+        self.played = 0
+        self.winnings = 0
+        self.placings = []
+        self.h2hwins = {}
+        self.h2hlosses = {}
+
+    def record(self, loser, match):
+        self.won += 1
+        self.played += 1
+        loser.played += 1
+        self.h2hwins.setdefault(loser, []).append(match)
+        loser.h2hlosses.setdefault(self, []).append(match)
+
+
+def make_matches(numplayers, nummatches, seed=0):
+    """
+    Generate match json objects shaped like the ones Challonge returns.
+    """
+    rng = random.Random(seed)
+    start = datetime(2017, 1, 1, tzinfo=timezone(timedelta(hours=-5)))
+    matches = []
+    for i in range(nummatches):
+        winner, loser = rng.sample(range(numplayers), 2)
+        started = start + timedelta(minutes=7 * i)
+        matches.append({
+            "attachment-count": None, "created-at": started,
+            "group-id": None, "has-attachment": False, "id": i,
+            "identifier": "A", "location": None, "loser-id": loser,
+            "player1-id": winner, "player1-is-prereq-match-loser": False,
+            "player1-prereq-match-id": None, "player1-votes": None,
+            "player2-id": loser, "player2-is-prereq-match-loser": False,
+            "player2-prereq-match-id": None, "player2-votes": None,
+            "round": rng.randint(-6, 6), "scheduled-time": None,
+            "started-at": started, "state": "complete",
+            "tournament-id": i // 64, "underway-at": None,
+            "updated-at": started + timedelta(minutes=5),
+            "winner-id": winner, "prerequisite-match-ids-csv": "",
+            "scores-csv": rng.choice(["2-0", "2-1", "3-0", "3-1", "3-2"]),
+            "completed-at": started + timedelta(minutes=5),
+        })
+    return matches
+
+
+def measure(build):
+    """
+    Return (players, live bytes, pickled bytes, seconds) for build().
+
+    Live bytes is what is still allocated once build() has returned,
+    i.e. the players and everything they keep alive.
+    """
+    tracemalloc.start()
+    begin = time.perf_counter()
+    players = build()
+    seconds = time.perf_counter() - begin
+    live = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    pickled = len(pickle.dumps(players, pickle.HIGHEST_PROTOCOL))
+    return players, live, pickled, seconds
+
+
+def main(numplayers=3000, nummatches=100000):
+    # Pickling the old object graph recurses through every opponent
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 20 * numplayers))
+
+    def legacy():
+        matches = make_matches(numplayers, nummatches)
+        players = [LegacyPlayer("P%d" % i) for i in range(numplayers)]
+        for match in matches:
+            players[match["winner-id"]].record(players[match["loser-id"]],
+                                               match)
+        return players
+
+    def compact():
+        matches = make_matches(numplayers, nummatches)
+        roster = []
+        for i in range(numplayers):
+            roster.append(Player("P%d" % i, i, roster))
+        for match in matches:
+            winner = roster[match["winner-id"]]
+            loser = roster[match["loser-id"]]
+            winner.calculateWin(loser, match)
+            loser.calculateLoss(winner, match)
+        return roster
+
+    print("{} players, {} matches".format(numplayers, nummatches))
+    print("{:10s} {:>14s} {:>14s} {:>9s}".format(
+        "model", "live bytes", "pickled bytes", "seconds"))
+    for name, build in (("before", legacy), ("after", compact)):
+        players, live, pickled, seconds = measure(build)
+        print("{:10s} {:>14,d} {:>14,d} {:>9.2f}".format(
+            name, live, pickled, seconds))
+        del players
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+"""
+Time how long commands take to start, each in a fresh interpreter.
+
+Players are calculated from synthetic tournaments (see synthetic.py) and
+saved, then each command is run several times and the fastest run is kept.
+Besides printing help, this times seeding a bracket from the saved players
+both by loading players.pkl and by opening the snapshot.
+
+Usage: benchmarks/startup.py [players] [tournaments] [runs]
+"""
+
+import os
+import sys
+import time
+import tempfile
+import subprocess
+
+SCRIPTDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPTDIR)
+import synthetic  # noqa: E402
+from elo_list import EloList  # noqa: E402
+
+# Seeds the top 64 names of the leaderboard, in reverse
+SEED = """
+import sys
+{}
+names = [line.split()[1] + " " + line.split()[2]
+         for line in open(sys.argv[1]).readlines()[1:65]][::-1]
+elos.seed_order(names)
+"""
+LOAD = SEED.format("""from elo_list import EloList
+elos = EloList()
+elos.load(sys.argv[2])""")
+OPEN = SEED.format("""from snapshot import Snapshot
+elos = Snapshot(sys.argv[3])""")
+
+
+def best_time(command, runs, cwd, env):
+    """
+    Return the fastest wall time of running a command, in seconds.
+    """
+    times = []
+    for _ in range(runs):
+        begin = time.perf_counter()
+        subprocess.run(command, cwd=cwd, env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - begin)
+    return min(times)
+
+
+def main(numplayers=5000, numtournaments=300, runs=5):
+    env = dict(os.environ, PYTHONPATH=SCRIPTDIR + os.pathsep
+               + os.environ.get("PYTHONPATH", ""))
+    with tempfile.TemporaryDirectory() as tempdir:
+        synthetic.write(synthetic.generate(numplayers, numtournaments),
+                        tempdir)
+        objdir = os.path.join(tempdir, "obj")
+        elos = EloList()
+        elos.calculate_elos(*(os.path.join(objdir, name + ".pkl") for name
+                              in ("tournaments", "participants", "matches")))
+        files = [os.path.join(tempdir, "output", name) for name in
+                 ("elos.txt", "players.pkl", "snapshot.bin")]
+        elos.write_elos(files[0])
+        elos.save(files[1], os.path.join(tempdir, "output", "h2h.bin"),
+                  os.path.join(tempdir, "output", "history.bin"), files[2])
+        commands = [
+            ("python -c pass", [sys.executable, "-c", "pass"]),
+            ("calculate_elos.py -h", [sys.executable, os.path.join(
+                SCRIPTDIR, "calculate_elos.py"), "-h"]),
+            ("seed.py -h", [sys.executable, os.path.join(
+                SCRIPTDIR, "seed.py"), "-h"]),
+            ("seed 64 from players.pkl",
+             [sys.executable, "-c", LOAD] + files),
+            ("seed 64 from snapshot", [sys.executable, "-c", OPEN] + files),
+        ]
+        print("{} players, {} tournaments, best of {}".format(
+            len(elos.roster()), numtournaments, runs))
+        for label, command in commands:
+            seconds = best_time(command, runs, tempdir, env)
+            print("{:28s} {:>8.1f} ms".format(label, seconds * 1000))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:4]])
@@ -0,0 +1,357 @@
+#!/usr/bin/python3
+"""
+Time and memory-profile every phase of a run on synthetic tournaments.
+
+Data is generated with synthetic.py (or read from an existing directory
+with -d), then each phase is run on a fresh copy of the state it needs:
+reading the three files, each EloList filter, the matchup chart, saving
+and loading, and writing elos and summaries. Setting up a phase is not
+timed. Each phase is timed -n times and the fastest is kept, then run once
+more under tracemalloc to measure how much memory it allocates.
+
+Results are printed (or written with -o) as JSON, so that runs on
+different versions can be compared with -c.
+
+Usage: benchmarks/suite.py [options]
+"""
+
+import os
+import sys
+import json
+import time
+import pickle
+import getopt
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import synthetic  # noqa: E402
+from elo_calculator import EloCalculator  # noqa: E402
+from elo_list import EloList, SCRIPTDIR  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Argument given to each EloList.filter_by_* phase
+FILTERS = {
+    "games": 10,
+    "wins": 5,
+    "rank": 100,
+    "elo": 1200,
+    "tournaments": 3,
+}
+USAGE = "suite.py [options]\nOptions:"\
+        "\n\t-h\tDisplay this help"\
+        "\n\t-p\tNumber of players (default 1000)"\
+        "\n\t-t\tNumber of tournaments (default 100)"\
+        "\n\t-b\tEntrants per tournament (default 64)"\
+        "\n\t-s\tScore frequencies, e.g. 2-0:40,2-1:30,none:5"\
+        "\n\t-1\tSingle elimination brackets"\
+        "\n\t-r\tRandom seed (default 0)"\
+        "\n\t-g\tNumber of regions whose players never meet (default 1)"\
+        "\n\t-d\tUse the obj folder of this directory instead of generating"\
+        "\n\t-n\tNumber of timed runs of each phase (default 3)"\
+        "\n\t-m\tDon't measure memory"\
+        "\n\t-o\tWrite the results to this file instead of printing them"\
+        "\n\t-c\tCompare against results saved by an earlier run"
+
+
+class Phases:
+    """
+    Set up each phase of a run on the files in a directory.
+
+    Every method named after a phase returns a function that runs it once.
+    Results that later phases need are kept in state.
+
+    Fields include:
+    files           dict (file name to path, for the obj and output files)
+    state           dict (players, once the matches have been read)
+    """
+
+    def __init__(self, directory, outputdir):
+        objdir = os.path.join(directory, "obj")
+        self.files = {name: os.path.join(objdir, name + ".pkl")
+                      for name in ("tournaments", "participants", "matches")}
+        self.files["store"] = os.path.join(objdir, "matches.cols")
+        for name in ("players.pkl", "h2h.bin", "history.bin", "elos.txt",
+                     "summaries.txt", "MU Chart.xlsx"):
+            self.files[name] = os.path.join(outputdir, name)
+        self.state = {}
+
+    def names(self):
+        """
+        Return the phases to run, in order.
+        """
+        names = ["read_tournaments_file", "read_participants_file",
+                 "read_matches_file"]
+        if os.path.exists(self.files["store"]):
+            names.append("read_matches_file_store")
+        names.append("read_matches_file_started")
+        names.extend("filter_by_" + criterion for criterion in FILTERS)
+        names.extend(["export_spreadsheet", "save", "load", "write_elos",
+                      "save_summaries"])
+        return names
+
+    def _calculator(self, upto, order="file"):
+        # A calculator that has read every file before upto
+        calculator = EloCalculator(order=order)
+        if upto > 0:
+            calculator.read_tournaments_file(self.files["tournaments"])
+        if upto > 1:
+            calculator.read_participants_file(self.files["participants"])
+        return calculator
+
+    def _elos(self):
+        # An EloList of every player, without any cached indexes
+        elos = EloList()
+        elos.elolist = list(self.state["players"])
+        return elos
+
+    def read_tournaments_file(self):
+        calculator = self._calculator(0)
+        return lambda: calculator.read_tournaments_file(
+            self.files["tournaments"])
+
+    def read_participants_file(self):
+        calculator = self._calculator(1)
+        return lambda: calculator.read_participants_file(
+            self.files["participants"])
+
+    def read_matches_file(self, matchesfile=None, order="file"):
+        calculator = self._calculator(2, order)
+        matchesfile = matchesfile or self.files["matches"]
+
+        def run():
+            calculator.read_matches_file(matchesfile)
+            self.state["players"] = calculator.get_elo_list()
+        return run
+
+    def read_matches_file_store(self):
+        return self.read_matches_file(self.files["store"])
+
+    def read_matches_file_started(self):
+        return self.read_matches_file(order="started")
+
+    def export_spreadsheet(self):
+        elos = self._elos()
+        return lambda: elos.export_spreadsheet(
+            wbpath=self.files["MU Chart.xlsx"])
+
+    def save(self):
+        elos = self._elos()
+        return lambda: elos.save(self.files["players.pkl"],
+                                 self.files["h2h.bin"],
+                                 self.files["history.bin"])
+
+    def load(self):
+        elos = EloList()
+        return lambda: elos.load(self.files["players.pkl"],
+                                 self.files["h2h.bin"],
+                                 self.files["history.bin"])
+
+    def write_elos(self):
+        elos = self._elos()
+        return lambda: elos.write_elos(self.files["elos.txt"])
+
+    def save_summaries(self):
+        elos = self._elos()
+        return lambda: elos.save_summaries(self.files["summaries.txt"])
+
+    def setup(self, name):
+        """
+        Return a function that runs a phase once on fresh state.
+        """
+        if name.startswith("filter_by_"):
+            criterion = name[len("filter_by_"):]
+            elos = self._elos()
+            method = getattr(elos, name)
+            return lambda: method(FILTERS[criterion])
+        return getattr(self, name)()
+
+
+def measure(setup, repeats=3, memory=True):
+    """
+    Time a phase and measure the memory it allocates.
+
+    Args:
+        setup (function): Returns a function that runs the phase once
+        repeats (int): Number of timed runs
+        memory (bool): Run once more under tracemalloc
+
+    Returns:
+        dict: seconds (fastest run), runs (every run), and if memory is
+              measured peak_bytes (most allocated at once while running) and
+              retained_bytes (still allocated when it returned)
+    """
+    runs = []
+    for _ in range(repeats):
+        run = setup()
+        begin = time.perf_counter()
+        run()
+        runs.append(time.perf_counter() - begin)
+    result = {"seconds": min(runs), "runs": runs}
+    if memory:
+        run = setup()
+        tracemalloc.start()
+        run()
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["peak_bytes"] = peak
+        result["retained_bytes"] = retained
+    return result
+
+
+def version():
+    """
+    Return the git commit of the program, or None outside of a checkout.
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "-C", SCRIPTDIR, "describe", "--always", "--dirty"],
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit or None
+
+
+def run_suite(directory, repeats=3, memory=True):
+    """
+    Run every phase on the files in directory/obj.
+
+    Returns:
+        dict: the phases, in order, mapped to what measure() returned
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as outputdir:
+        phases = Phases(directory, outputdir)
+        for name in phases.names():
+            results[name] = measure(lambda: phases.setup(name), repeats,
+                                    memory)
+            print("{:28s} {:>9.4f}s".format(name, results[name]["seconds"]),
+                  file=sys.stderr)
+    return results
+
+
+def describe(directory):
+    """
+    Count what is in the data files of a directory.
+    """
+    calculator = EloCalculator()
+    phases = Phases(directory, directory)
+    calculator.read_tournaments_file(phases.files["tournaments"])
+    calculator.read_participants_file(phases.files["participants"])
+    with open(phases.files["matches"], "rb") as f:
+        matches = pickle.load(f)
+    return {
+        "tournaments": len(calculator.tournaments),
+        "players": len(calculator.roster),
+        "matches": sum(len(tournament) for tournament in matches),
+    }
+
+
+def compare(baseline, results):
+    """
+    Generate lines comparing each phase against an earlier run.
+    """
+    yield "{:28s} {:>10s} {:>10s} {:>7s}\n".format(
+        "PHASE", "BEFORE", "AFTER", "RATIO")
+    before = baseline["phases"]
+    for name, result in results["phases"].items():
+        if name not in before:
+            continue
+        old = before[name]["seconds"]
+        new = result["seconds"]
+        yield "{:28s} {:>9.4f}s {:>9.4f}s {:>7.2f}\n".format(
+            name, old, new, new / old if old else float("inf"))
+
+
+def main(options, directory=None, repeats=3, memory=True):
+    """
+    Generate data unless a directory is given, run the suite on it, and
+    return the results with a description of the run.
+    """
+    with tempfile.TemporaryDirectory() as tempdir:
+        if directory is None:
+            directory = tempdir
+            begin = time.perf_counter()
+            synthetic.write(synthetic.generate(**options), directory)
+            print("{:28s} {:>9.4f}s".format(
+                "generate", time.perf_counter() - begin), file=sys.stderr)
+        results = {
+            "version": version(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "generator": None if options is None else options,
+            "data": describe(directory),
+            "repeats": repeats,
+            "phases": run_suite(directory, repeats, memory),
+        }
+    if resource is not None:
+        # Kilobytes on Linux, bytes on macOS
+        results["maxrss"] = resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss
+    return results
+
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hp:t:b:s:1r:g:d:n:mo:c:")
+    except getopt.GetoptError:
+        print(USAGE)
+        sys.exit(2)
+    options = {"players": 1000, "tournaments": 100, "size": 64,
+               "scores": synthetic.SCORES, "double": True, "seed": 0,
+               "regions": 1}
+    directory = None
+    repeats = 3
+    memory = True
+    outputfile = None
+    baselinefile = None
+    for opt, arg in opts:
+        if opt == "-h":
+            print(USAGE)
+            sys.exit()
+        if opt == "-p":
+            options["players"] = int(arg)
+        if opt == "-t":
+            options["tournaments"] = int(arg)
+        if opt == "-b":
+            options["size"] = int(arg)
+        if opt == "-s":
+            options["scores"] = synthetic.parse_scores(arg)
+        if opt == "-1":
+            options["double"] = False
+        if opt == "-r":
+            options["seed"] = int(arg)
+        if opt == "-g":
+            options["regions"] = int(arg)
+        if opt == "-d":
+            directory = arg
+        if opt == "-n":
+            repeats = max(1, int(arg))
+        if opt == "-m":
+            memory = False
+        if opt == "-o":
+            outputfile = arg
+        if opt == "-c":
+            baselinefile = arg
+    results = main(None if directory else options, directory, repeats, memory)
+    if results["generator"] is not None:
+        # JSON keys have to be strings
+        results["generator"]["scores"] = {
+            str(score).lower(): weight
+            for score, weight in results["generator"]["scores"].items()}
+    if outputfile is not None:
+        with open(outputfile, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    if baselinefile is not None:
+        with open(baselinefile) as f:
+            sys.stderr.writelines(compare(json.load(f), results))
@@ -0,0 +1,234 @@
+#!/usr/bin/python3
+"""
+Generate synthetic tournaments in the shape save_tourneys.py saves them.
+
+Every player has a hidden skill. Each tournament takes a random sample of
+players, seeds them by skill with some noise and plays out a single or
+double elimination bracket, the better player winning each set with the
+elo expected score of their skills. Tournaments, participants and matches
+carry the fields the rest of the program reads from Challonge.
+
+Usage: benchmarks/synthetic.py [options] [directory]
+
+Writes obj/tournaments.pkl, obj/participants.pkl, obj/matches.pkl and
+obj/matches.cols under the directory (default: the current one).
+"""
+
+import os
+import sys
+import pickle
+import random
+import getopt
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bracket_sim import Bracket, ENTRANT, WINNER, LOSER  # noqa: E402
+import match_store  # noqa: E402
+
+# Relative frequency of each set score, from the winner's side
+# None is a set without a reported score
+SCORES = {"2-0": 40, "2-1": 30, "3-0": 8, "3-1": 10, "3-2": 7, None: 5}
+# When the first tournament starts
+START = datetime(2017, 1, 7, 18, 0, tzinfo=timezone(timedelta(hours=-5)))
+USAGE = "synthetic.py [options] [directory]\nOptions:"\
+        "\n\t-h\tDisplay this help"\
+        "\n\t-p\tNumber of players (default 1000)"\
+        "\n\t-t\tNumber of tournaments (default 100)"\
+        "\n\t-b\tEntrants per tournament (default 64)"\
+        "\n\t-s\tScore frequencies, e.g. 2-0:40,2-1:30,none:5"\
+        "\n\t-1\tSingle elimination brackets"\
+        "\n\t-r\tRandom seed (default 0)"\
+        "\n\t-g\tNumber of regions whose players never meet (default 1)"
+
+
+def parse_scores(arg):
+    """
+    Parse score frequencies given as "score:weight,score:weight,...".
+    """
+    scores = {}
+    for item in arg.split(","):
+        score, weight = item.rsplit(":", 1)
+        scores[None if score.lower() == "none" else score] = float(weight)
+    return scores
+
+
+def generate(players=1000, tournaments=100, size=64, scores=None,
+             double=True, seed=0, regions=1):
+    """
+    Generate tournaments, participants and matches.
+
+    Args:
+        players (int): Number of distinct players
+        tournaments (int): Number of tournaments, one a week
+        size (int): Number of entrants in each tournament
+        scores (dict): Relative frequency of each set score, see SCORES
+        double (bool): Double elimination instead of single elimination
+        seed (int): Seed of the random generator
+        regions (int): Number of regions; players are split evenly between
+                       them, and tournaments take turns between regions
+                       and only have entrants from theirs
+
+    Returns:
+        tuple: (tournaments, participants, matches), where participants and
+               matches are lists of lists grouped by tournament
+    """
+    rng = random.Random(seed)
+    scores = SCORES if scores is None else scores
+    scorelist = list(scores)
+    weights = [scores[score] for score in scorelist]
+    names = ["PLAYER %d" % i for i in range(players)]
+    skills = [rng.gauss(1200, 150) for _ in range(players)]
+    regions = max(1, min(regions, players))
+    pools = [range(players * region // regions,
+                   players * (region + 1) // regions)
+             for region in range(regions)]
+    all_tournaments = []
+    all_participants = []
+    all_matches = []
+    participantid = 10000000
+    matchid = 100000000
+    for number in range(tournaments):
+        tourneyid = 1000000 + number
+        started = START + timedelta(days=7 * number)
+        pool = pools[number % regions]
+        count = min(size, len(pool))
+        entrants = rng.sample(pool, count)
+        entrants.sort(key=lambda p: skills[p] + rng.gauss(0, 100),
+                      reverse=True)
+        bracket = Bracket.from_seeds([names[p] for p in entrants], double)
+        ids = list(range(participantid, participantid + count))
+        participantid += count
+        ranks = [None] * count
+        winners = [None] * len(bracket)
+        losers = [None] * len(bracket)
+        players_of = [None] * len(bracket)
+        matchids = [None] * len(bracket)
+        matches = []
+        clock = started
+        for i in range(len(bracket)):
+            pair = []
+            for kind, ref in zip(bracket.kinds[i], bracket.refs[i]):
+                if kind == ENTRANT:
+                    pair.append(ref)
+                elif kind == WINNER:
+                    pair.append(winners[ref])
+                elif kind == LOSER:
+                    pair.append(losers[ref])
+                else:
+                    pair.append(None)
+            players_of[i] = pair
+            p1, p2 = pair
+            reset = bracket.resets[i]
+            prereq = bracket.refs[i][0]
+            if reset and winners[prereq] != players_of[prereq][reset - 1]:
+                winners[i] = winners[prereq]
+                losers[i] = losers[prereq]
+            elif p1 is None or p2 is None:
+                # A bye; Challonge doesn't make a match for it
+                winners[i] = p2 if p1 is None else p1
+                losers[i] = None
+            else:
+                R1 = 10**(skills[entrants[p1]]/400)
+                R2 = 10**(skills[entrants[p2]]/400)
+                if rng.random() < R1/(R1+R2):
+                    winners[i], losers[i] = p1, p2
+                else:
+                    winners[i], losers[i] = p2, p1
+                score = rng.choices(scorelist, weights)[0]
+                if score is not None and winners[i] == p2:
+                    score = "-".join(reversed(score.split("-")))
+                clock += timedelta(minutes=rng.randint(5, 20))
+                matchids[i] = matchid
+                match = {
+                    "id": matchid,
+                    "tournament-id": tourneyid,
+                    "state": "complete",
+                    "round": -1 if LOSER in bracket.kinds[i] else 1,
+                    "player1-id": ids[p1],
+                    "player2-id": ids[p2],
+                    "winner-id": ids[winners[i]],
+                    "loser-id": ids[losers[i]],
+                    "scores-csv": score,
+                    "started-at": clock,
+                    "completed-at": clock + timedelta(minutes=15),
+                }
+                for n, (kind, ref) in enumerate(zip(bracket.kinds[i],
+                                                    bracket.refs[i]), 1):
+                    prereqid = matchids[ref] if kind in (WINNER, LOSER) \
+                        else None
+                    match["player%d-prereq-match-id" % n] = prereqid
+                    match["player%d-is-prereq-match-loser" % n] = \
+                        kind == LOSER
+                matches.append(match)
+                matchid += 1
+            if bracket.winplaces[i] and winners[i] is not None:
+                ranks[winners[i]] = bracket.winplaces[i]
+            if bracket.lossplaces[i] and losers[i] is not None:
+                ranks[losers[i]] = bracket.lossplaces[i]
+        all_tournaments.append({
+            "id": tourneyid,
+            "name": "Synthetic %d" % number,
+            "url": "synthetic%d" % number,
+            "tournament-type": "double elimination" if double
+                               else "single elimination",
+            "state": "complete",
+            "participants-count": count,
+            "started-at": started,
+            "completed-at": clock + timedelta(minutes=15),
+            "updated-at": clock + timedelta(minutes=20),
+        })
+        all_participants.append([{
+            "id": ids[i],
+            "tournament-id": tourneyid,
+            "name": names[entrant],
+            "display-name": names[entrant],
+            "seed": i + 1,
+            "final-rank": ranks[i],
+        } for i, entrant in enumerate(entrants)])
+        all_matches.append(matches)
+    return all_tournaments, all_participants, all_matches
+
+
+def write(data, directory="."):
+    """
+    Write generated data where save_tourneys.py would, under a directory.
+    """
+    tournaments, participants, matches = data
+    objdir = os.path.join(directory, "obj")
+    os.makedirs(objdir, exist_ok=True)
+    for name, obj in (("tournaments", tournaments),
+                      ("participants", participants),
+                      ("matches", matches)):
+        with open(os.path.join(objdir, name + ".pkl"), "wb") as f:
+            pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+    match_store.write_store(matches, os.path.join(objdir, "matches.cols"),
+                            [tournament["id"] for tournament in tournaments],
+                            match_store.digest(tournaments))
+
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hp:t:b:s:1r:g:")
+    except getopt.GetoptError:
+        print(USAGE)
+        sys.exit(2)
+    options = {}
+    for opt, arg in opts:
+        if opt == "-h":
+            print(USAGE)
+            sys.exit()
+        if opt == "-p":
+            options["players"] = int(arg)
+        if opt == "-t":
+            options["tournaments"] = int(arg)
+        if opt == "-b":
+            options["size"] = int(arg)
+        if opt == "-s":
+            options["scores"] = parse_scores(arg)
+        if opt == "-1":
+            options["double"] = False
+        if opt == "-r":
+            options["seed"] = int(arg)
+        if opt == "-g":
+            options["regions"] = int(arg)
+    write(generate(**options), args[0] if args else ".")
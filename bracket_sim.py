@@ -0,0 +1,626 @@
+#!/usr/bin/python3
+"""
+Estimate each entrant's odds of finishing in each place of a bracket.
+
+A single or double elimination bracket is played out many times, each set
+being won with the expected score Player.calculateWin uses for the winner.
+Ratings can optionally be updated after every simulated set, the way they
+would be once the results are in. Sets that have already been played keep
+their real result, so brackets can be simulated while they are running.
+
+Runs are split into chunks of CHUNKSIZE, which are spread over a pool of
+processes. Each chunk has its own random generator seeded from the seed and
+the chunk number, so the results only depend on the seed and the number of
+runs, not on the number of processes. If numpy is installed, every chunk is
+simulated as arrays with one entry per run; otherwise runs are played one
+at a time, which is much slower.
+
+Usage: bracket_sim.py [options] tourney_id
+       bracket_sim.py [options] -s NAME,NAME,...
+"""
+
+import sys
+import random
+import getopt
+from concurrent.futures import ProcessPoolExecutor
+from player import Player, classify_score
+from snapshot import open_players
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Kinds of source for a player in a match
+ENTRANT = 0  # An entrant, by index
+WINNER = 1   # The winner of an earlier match, by index
+LOSER = 2    # The loser of an earlier match, by index
+EMPTY = 3    # Nobody, e.g. a bye
+# Runs simulated together by one process
+CHUNKSIZE = 50000
+# Places to report the odds of finishing at or above
+CUTOFFS = (1, 2, 3, 4, 8, 16)
+USAGE = "bracket_sim.py [options] tourney_id\nOptions:"\
+        "\n\t-h\tDisplay this help"\
+        "\n\t-n\tNumber of runs (default 100000)"\
+        "\n\t-j\tNumber of processes (default: one per CPU)"\
+        "\n\t-r\tRandom seed (default 0)"\
+        "\n\t-u\tUpdate ratings after every simulated set"\
+        "\n\t-s\tSimulate a new double elimination bracket of these"\
+        " comma separated names, in seeding order, instead of a tournament"\
+        "\n\t-1\tMake the new bracket single elimination"
+
+
+class Bracket:
+    """
+    The structure of an elimination bracket, with matches in playing order.
+
+    Each match takes its two players from an entrant, the winner or loser of
+    an earlier match, or nobody (a bye, where the other player goes through
+    without playing).
+
+    Fields include:
+    names           list of str (name of each entrant, in seeding order)
+    kinds           list of tuples (ENTRANT, WINNER, LOSER or EMPTY, for
+                    each player of each match)
+    refs            list of tuples (entrant or match index for each player)
+    fixed           list of int (entrant index of the winner of matches that
+                    have been played, None otherwise)
+    resets          list of int (for a grand finals reset, the player, 1 or 2,
+                    of the previous match who has to win it for the reset to
+                    be played; 0 for every other match)
+    winplaces       list of int (place of the winner, 0 if they carry on)
+    lossplaces      list of int (place of the loser, 0 if they carry on)
+    places          list of int (every distinct place, best first)
+    """
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.kinds = []
+        self.refs = []
+        self.fixed = []
+        self.resets = []
+        self.winplaces = []
+        self.lossplaces = []
+        self.places = []
+
+    def add_match(self, player1, player2, fixed=None, reset=0):
+        """
+        Add a match after every match added so far.
+
+        Args:
+            player1 (tuple): (kind, index) source of the first player
+            player2 (tuple): (kind, index) source of the second player
+            fixed (int): entrant index of the winner if already played
+            reset (int): see the resets field
+
+        Returns:
+            int: index of the new match
+        """
+        self.kinds.append((player1[0], player2[0]))
+        self.refs.append((player1[1], player2[1]))
+        self.fixed.append(fixed)
+        self.resets.append(reset)
+        return len(self.kinds) - 1
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def assign_places(self):
+        """
+        Work out where the winner and loser of each match finish.
+
+        Players who are not taken by a later match finish in that match.
+        Later matches finish higher, winners finish above losers, and of
+        two finishing matches played at the same stage, the one that takes
+        a loser from earlier (e.g. a third place match) finishes lower.
+        Players finishing in matches with the same ranking tie, the way
+        Challonge ranks them.
+        """
+        count = len(self)
+        depth = [0] * count
+        # Whether the winner and the loser can be a real entrant; byes
+        # are part of the structure, so this is the same on every run
+        realwin = [False] * count
+        realloss = [False] * count
+        takeswinner = [False] * count
+        takesloser = [False] * count
+        for i in range(count):
+            real = []
+            for kind, ref in zip(self.kinds[i], self.refs[i]):
+                if kind == ENTRANT:
+                    real.append(True)
+                elif kind == EMPTY:
+                    real.append(False)
+                else:
+                    depth[i] = max(depth[i], depth[ref] + 1)
+                    if kind == WINNER:
+                        takeswinner[ref] = True
+                        real.append(realwin[ref])
+                    else:
+                        takesloser[ref] = True
+                        real.append(realloss[ref])
+            depth[i] = max(depth[i], 1)
+            realwin[i] = real[0] or real[1]
+            realloss[i] = real[0] and real[1]
+        fromwinners = [LOSER not in kinds for kinds in self.kinds]
+        groups = {}
+        for i in range(count):
+            if not takeswinner[i] and realwin[i]:
+                key = (depth[i], fromwinners[i], 1)
+                groups.setdefault(key, []).append((i, 1))
+            if not takesloser[i] and realloss[i]:
+                key = (depth[i], fromwinners[i], 0)
+                groups.setdefault(key, []).append((i, 0))
+        self.winplaces = [0] * count
+        self.lossplaces = [0] * count
+        self.places = []
+        place = 1
+        for key in sorted(groups, reverse=True):
+            for i, won in groups[key]:
+                if won:
+                    self.winplaces[i] = place
+                else:
+                    self.lossplaces[i] = place
+            self.places.append(place)
+            place += len(groups[key])
+
+    @classmethod
+    def from_seeds(cls, names, double=True):
+        """
+        Create an unplayed bracket from entrants in seeding order.
+
+        Entrants are placed the standard way, with byes for the top seeds
+        if the number of entrants is not a power of two. In double
+        elimination, losers drop into the losers' bracket in reverse order
+        every other round, to put off rematches, and the grand finals can
+        be reset.
+        """
+        bracket = cls(names)
+        size = 1
+        while size < len(names):
+            size *= 2
+        order = [0]
+        while len(order) < size:
+            order = [x for seed in order
+                     for x in (seed, 2 * len(order) - 1 - seed)]
+        sources = [(ENTRANT, seed) if seed < len(names) else (EMPTY, 0)
+                   for seed in order]
+        if size == 1:
+            sources.append((EMPTY, 0))
+        # Winners' bracket
+        dropped = []
+        while len(sources) > 1:
+            matches = [bracket.add_match(sources[i], sources[i + 1])
+                       for i in range(0, len(sources), 2)]
+            sources = [(WINNER, i) for i in matches]
+            dropped.append([(LOSER, i) for i in matches])
+        if not double or size < 2:
+            bracket.assign_places()
+            return bracket
+        # Losers' bracket
+        survivors = dropped[0]
+        for rnd, losers in enumerate(dropped[1:]):
+            if len(survivors) > 1:
+                survivors = [(WINNER, bracket.add_match(survivors[i],
+                                                        survivors[i + 1]))
+                             for i in range(0, len(survivors), 2)]
+            if rnd % 2 == 0:
+                losers = losers[::-1]
+            survivors = [(WINNER, bracket.add_match(survivor, loser))
+                         for survivor, loser in zip(survivors, losers)]
+        final = bracket.add_match(sources[0], survivors[0])
+        bracket.add_match((WINNER, final), (LOSER, final), reset=2)
+        bracket.assign_places()
+        return bracket
+
+    @classmethod
+    def from_challonge(cls, participants, matches, reset=True):
+        """
+        Create a bracket from a Challonge tournament that has been started.
+
+        Args:
+            participants (list): participant json objects
+            matches (list): match json objects
+            reset (bool): Add a grand finals reset to double elimination
+                          brackets if Challonge has not created one yet
+        """
+        participants = sorted(participants,
+                              key=lambda x: x.get("seed") or 0)
+        bracket = cls([p["name"] for p in participants])
+        entrants = {p["id"]: i for i, p in enumerate(participants)}
+        byid = {match["id"]: match for match in matches}
+        ordered = []
+        seen = set()
+
+        def visit(match):
+            if match["id"] in seen:
+                return
+            seen.add(match["id"])
+            for n in (1, 2):
+                prereq = match.get("player{}-prereq-match-id".format(n))
+                if prereq in byid:
+                    visit(byid[prereq])
+            ordered.append(match)
+
+        for match in sorted(matches, key=lambda x: x["id"]):
+            visit(match)
+        index = {match["id"]: i for i, match in enumerate(ordered)}
+
+        def source(match, n):
+            player = match.get("player{}-id".format(n))
+            prereq = match.get("player{}-prereq-match-id".format(n))
+            if player in entrants:
+                return ENTRANT, entrants[player]
+            if prereq in index:
+                if match.get("player{}-is-prereq-match-loser".format(n)):
+                    return LOSER, index[prereq]
+                return WINNER, index[prereq]
+            return EMPTY, 0
+
+        def losers_side(match):
+            # The player of a grand final coming from the losers' bracket
+            for n in (1, 2):
+                prereq = byid.get(match.get(
+                    "player{}-prereq-match-id".format(n)))
+                if prereq is not None and (prereq.get("round") or 0) < 0:
+                    return n
+            return 2
+
+        for match in ordered:
+            player1 = source(match, 1)
+            player2 = source(match, 2)
+            resetside = 0
+            prereq = match.get("player1-prereq-match-id")
+            if (prereq in byid and prereq
+                    == match.get("player2-prereq-match-id")):
+                resetside = losers_side(byid[prereq])
+                player1 = (WINNER, index[prereq])
+                player2 = (LOSER, index[prereq])
+            fixed = entrants.get(match.get("winner-id"))
+            bracket.add_match(player1, player2, fixed, resetside)
+        if reset and ordered and not any(bracket.resets):
+            final = ordered[-1]
+            rounds = [(byid[prereq].get("round") or 0) for prereq in
+                      (final.get("player1-prereq-match-id"),
+                       final.get("player2-prereq-match-id"))
+                      if prereq in byid]
+            if any(r > 0 for r in rounds) and any(r < 0 for r in rounds):
+                last = len(ordered) - 1
+                bracket.add_match((WINNER, last), (LOSER, last),
+                                  reset=losers_side(final))
+        bracket.assign_places()
+        return bracket
+
+
+def fetch_tourney(tourney_id):
+    """
+    Get a tournament, its participants and its matches from Challonge.
+
+    challonge is imported, and credentials are asked for if there is no
+    set_credentials.py, only when a tournament is fetched.
+
+    Returns:
+        tuple: (tournament, participants, matches) json objects
+    """
+    import challonge
+    from seed import get_credentials
+    get_credentials()
+    tournament = challonge.tournaments.show(tourney_id)
+    participants = challonge.participants.index(tournament["id"])
+    matches = challonge.matches.index(tournament["id"])
+    return tournament, participants, matches
+
+
+def ratings(bracket, elolist):
+    """
+    Return the elo and k constant of every entrant of a bracket.
+
+    Entrants without any elo records get the ratings of a new player.
+    """
+    elos = []
+    kconsts = []
+    for name in bracket.names:
+        player = elolist.player(name)
+        if player is None:
+            player = Player(name)
+        elos.append(player.elo)
+        kconsts.append(player.kconst())
+    return elos, kconsts
+
+
+def _play_runs(bracket, elos, kconsts, runs, rng, update):
+    """
+    Simulate runs one at a time.
+
+    Returns:
+        list of lists: count of each entrant finishing in each place
+    """
+    count = len(bracket)
+    bye = len(bracket.names)
+    column = {place: i for i, place in enumerate(bracket.places)}
+    counts = [[0] * len(bracket.places) for _ in range(bye + 1)]
+    # Simulated sets count as sets without a reported score
+    winresult, lossresult = classify_score(None)
+    powers = [10**(elo/400) for elo in elos]
+    for _ in range(runs):
+        if update:
+            current = list(elos)
+        winners = [bye] * count
+        losers = [bye] * count
+        players = [None] * count
+        for i in range(count):
+            pair = []
+            for kind, ref in zip(bracket.kinds[i], bracket.refs[i]):
+                if kind == ENTRANT:
+                    pair.append(ref)
+                elif kind == WINNER:
+                    pair.append(winners[ref])
+                elif kind == LOSER:
+                    pair.append(losers[ref])
+                else:
+                    pair.append(bye)
+            p1, p2 = pair
+            players[i] = pair
+            reset = bracket.resets[i]
+            fixed = bracket.fixed[i]
+            if reset and winners[bracket.refs[i][0]] \
+                    != players[bracket.refs[i][0]][reset - 1]:
+                w = winners[bracket.refs[i][0]]
+                l = losers[bracket.refs[i][0]]
+            elif fixed is not None:
+                w = fixed
+                l = p2 if fixed == p1 else p1
+            elif p2 == bye:
+                w, l = p1, p2
+            elif p1 == bye:
+                w, l = p2, p1
+            else:
+                if update:
+                    R1 = 10**(current[p1]/400)
+                    R2 = 10**(current[p2]/400)
+                else:
+                    R1 = powers[p1]
+                    R2 = powers[p2]
+                if rng.random() < R1/(R1+R2):
+                    w, l = p1, p2
+                else:
+                    w, l = p2, p1
+                if update:
+                    R1 = 10**(current[w]/400)
+                    R2 = 10**(current[l]/400)
+                    current[w] += kconsts[w]*(winresult - R1/(R1+R2))
+                    R1 = 10**(current[w]/400)
+                    current[l] += kconsts[l]*(lossresult - R2/(R1+R2))
+            winners[i] = w
+            losers[i] = l
+            if bracket.winplaces[i]:
+                counts[w][column[bracket.winplaces[i]]] += 1
+            if bracket.lossplaces[i]:
+                counts[l][column[bracket.lossplaces[i]]] += 1
+    return counts
+
+
+def _play_arrays(bracket, elos, kconsts, runs, rng, update):
+    """
+    Simulate runs together as numpy arrays with one entry per run.
+
+    Returns:
+        list of lists: count of each entrant finishing in each place
+    """
+    np = numpy
+    count = len(bracket)
+    bye = len(bracket.names)
+    column = {place: i for i, place in enumerate(bracket.places)}
+    counts = np.zeros((bye + 1, len(bracket.places)), dtype=np.int64)
+    winresult, lossresult = classify_score(None)
+    # A bye has a power of 0, so it always loses
+    powers = np.append(10**(np.asarray(elos, dtype=float)/400), 0.0)
+    ks = np.append(np.asarray(kconsts, dtype=float), 0.0)
+    if update:
+        # Every run's ratings, flattened so that run r's rating of entrant
+        # p is at p * runs + offsets[r]; the runs of one entrant are next
+        # to each other, which keeps lookups close together in memory
+        current = np.repeat(np.append(np.asarray(elos, dtype=float), 0.0),
+                            runs)
+        offsets = np.arange(runs, dtype=np.intp)
+    constants = {}
+    winners = [None] * count
+    losers = [None] * count
+    players = [None] * count
+    for i in range(count):
+        pair = []
+        for kind, ref in zip(bracket.kinds[i], bracket.refs[i]):
+            if kind == WINNER:
+                pair.append(winners[ref])
+            elif kind == LOSER:
+                pair.append(losers[ref])
+            else:
+                entrant = ref if kind == ENTRANT else bye
+                if entrant not in constants:
+                    constants[entrant] = np.full(runs, entrant, np.intp)
+                pair.append(constants[entrant])
+        p1, p2 = pair
+        players[i] = pair
+        fixed = bracket.fixed[i]
+        if fixed is not None:
+            w = np.full(runs, fixed, np.intp)
+            l = np.where(p1 == fixed, p2, p1)
+        else:
+            if update:
+                elo1 = current[p1 * runs + offsets]
+                elo2 = current[p2 * runs + offsets]
+                R1 = 10**(elo1/400) * (p1 != bye)
+                R2 = 10**(elo2/400) * (p2 != bye)
+            else:
+                R1 = powers[p1]
+                R2 = powers[p2]
+            with np.errstate(invalid="ignore"):
+                won = rng.random(runs) < R1/(R1+R2)
+            w = np.where(won, p1, p2)
+            l = np.where(won, p2, p1)
+        reset = bracket.resets[i]
+        if reset:
+            prereq = bracket.refs[i][0]
+            played = winners[prereq] == players[prereq][reset - 1]
+            w = np.where(played, w, winners[prereq])
+            l = np.where(played, l, losers[prereq])
+        if update and fixed is None:
+            mask = (p1 != bye) & (p2 != bye)
+            if reset:
+                mask &= played
+            # The powers from before the set are reused for the update
+            Rw = np.where(won, R1, R2)[mask]
+            Rl = np.where(won, R2, R1)[mask]
+            welo = np.where(won, elo1, elo2)[mask]
+            lelo = np.where(won, elo2, elo1)[mask]
+            ws = w[mask]
+            ls = l[mask]
+            welo = welo + ks[ws]*(winresult - Rw/(Rw+Rl))
+            Rw = 10**(welo/400)
+            current[ws * runs + offsets[mask]] = welo
+            current[ls * runs + offsets[mask]] = \
+                lelo + ks[ls]*(lossresult - Rl/(Rw+Rl))
+        winners[i] = w
+        losers[i] = l
+        if bracket.winplaces[i]:
+            counts[:, column[bracket.winplaces[i]]] += np.bincount(
+                w, minlength=bye + 1)
+        if bracket.lossplaces[i]:
+            counts[:, column[bracket.lossplaces[i]]] += np.bincount(
+                l, minlength=bye + 1)
+    return counts.tolist()
+
+
+def _simulate_chunk(bracket, elos, kconsts, runs, seed, chunk, update):
+    """
+    Simulate one chunk of runs with its own random generator.
+    """
+    if numpy is not None:
+        rng = numpy.random.default_rng([seed, chunk])
+        return _play_arrays(bracket, elos, kconsts, runs, rng, update)
+    rng = random.Random("{}-{}".format(seed, chunk))
+    return _play_runs(bracket, elos, kconsts, runs, rng, update)
+
+
+def simulate(bracket, elolist, runs=100000, jobs=None, seed=0,
+             update=False):
+    """
+    Play a bracket out many times and count where every entrant finishes.
+
+    Args:
+        bracket (Bracket): Bracket to simulate
+        elolist (EloList or Snapshot): Ratings of the entrants
+        runs (int): Number of times to play the bracket
+        jobs (int): Number of processes, 1 to simulate in this one
+        seed (int): Seed of the random generators
+        update (bool): Update ratings after every simulated set
+
+    Returns:
+        dict: entrant name to a dict of place to probability
+    """
+    elos, kconsts = ratings(bracket, elolist)
+    chunks = [(bracket, elos, kconsts, min(CHUNKSIZE, runs - start), seed,
+               number, update)
+              for number, start in enumerate(range(0, runs, CHUNKSIZE))]
+    if jobs == 1 or len(chunks) == 1:
+        results = [_simulate_chunk(*chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(_simulate_chunk, *zip(*chunks)))
+    odds = {}
+    for entrant, name in enumerate(bracket.names):
+        totals = [sum(result[entrant][i] for result in results)
+                  for i in range(len(bracket.places))]
+        odds[name] = {place: total / runs
+                      for place, total in zip(bracket.places, totals)}
+    return odds
+
+
+def chance_of_top(places, cutoff):
+    """
+    Return the probability of finishing at or above a place.
+
+    Args:
+        places (dict): place to probability, as returned by simulate
+        cutoff (int): worst place to count
+    """
+    return sum(p for place, p in places.items() if place <= cutoff)
+
+
+def expected_place(places):
+    """
+    Return the average place a player finishes in.
+    """
+    return sum(place * p for place, p in places.items())
+
+
+def print_odds(odds, elolist):
+    """
+    Print a table of everyone's odds, best expected place first.
+    """
+    size = len(odds)
+    cutoffs = [c for c in CUTOFFS if c < size] or [1]
+    header = "{:20s}  ELO ".format("NAME") + "".join(
+        "{:>8s}".format("WIN" if c == 1 else "TOP " + str(c))
+        for c in cutoffs) + "   AVG"
+    print(header)
+    for name, places in sorted(odds.items(),
+                               key=lambda x: expected_place(x[1])):
+        player = elolist.player(name)
+        elo = Player.DEFAULT_ELO if player is None else player.elo
+        print("{:20s} {:0>4.0f}".format(name, elo) + "".join(
+            "{:>7.1f}%".format(100 * chance_of_top(places, c))
+            for c in cutoffs)
+            + " {:>5.1f}".format(expected_place(places)))
+
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hn:j:r:us:1",
+                                   ["help", "runs=", "jobs=", "seed=",
+                                    "update", "names=", "single"])
+    except getopt.GetoptError:
+        print(USAGE)
+        sys.exit(2)
+    runs = 100000
+    jobs = None
+    seed = 0
+    update = False
+    names = None
+    double = True
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print(USAGE)
+            sys.exit()
+        if opt in ("-n", "--runs"):
+            runs = int(arg)
+        if opt in ("-j", "--jobs"):
+            jobs = int(arg)
+        if opt in ("-r", "--seed"):
+            seed = int(arg)
+        if opt in ("-u", "--update"):
+            update = True
+        if opt in ("-s", "--names"):
+            names = [name.strip() for name in arg.split(",") if name.strip()]
+        if opt in ("-1", "--single"):
+            double = False
+    if names is None and len(args) != 1:
+        print(USAGE)
+        sys.exit(2)
+    elolist = open_players()
+    if names is not None:
+        bracket = Bracket.from_seeds(names, double)
+    else:
+        tournament, participants, matches = fetch_tourney(args[0])
+        if matches:
+            bracket = Bracket.from_challonge(participants, matches)
+        else:
+            # Not started yet, so Challonge has not made the matches
+            participants = sorted(participants,
+                                  key=lambda x: x.get("seed") or 0)
+            bracket = Bracket.from_seeds(
+                [p["name"] for p in participants],
+                tournament.get("tournament-type") != "single elimination")
+    print_odds(simulate(bracket, elolist, runs, jobs, seed, update),
+               elolist)
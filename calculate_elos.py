@@ -8,12 +8,30 @@ pychallonge can be found here: https://github.com/russ-/pychallonge
 
 import sys
 import os
+import time
 import getopt
-from elo_list import EloList
+import tourney_cache
+import metrics
+# Everything else is imported where it is used, so that -h (and bad
+# options) return at once
+
+# Outputs that can be produced, in the form
+# name: (EloList method, message printed once it has been written)
+OUTPUTS = {
+    "chart": ("export_spreadsheet", "A MU chart of all players has been"
+              " saved to \"output/MU Chart.xlsx\"."),
+    "players": ("save", "Player data has been saved to"
+                " \"output/players.pkl\"."),
+    "elos": ("write_elos", "Elos have been saved to \"output/elos.txt\"."),
+    "summaries": ("save_summaries", "Player summaries have been saved to"
+                  " \"output/summaries.txt\"."),
+}
+PROFILEFILE = os.path.join("output", "calculate_elos.prof")
 
 # Both of these are in the form (option, description)
 OPTS = [  # Options that don't require an argument
     ("filter", "Manually filter players"),
+    ("incremental", "Only replay tournaments added since the last run"),
 ]
 ARGOPTS = [  # Options that require an argument
     ("tournaments", "Require a minimum amount of tournaments"),
@@ -22,11 +40,163 @@ ARGOPTS = [  # Options that require an argument
     ("rank", "Require a minimum rank"),
     ("elo", "Require a minimum elo"),
 ]
+LONGOPTS = [  # Options that don't require an argument and have no short form
+    ("history", "Record every rating change, saved to output/history.bin"),
+    ("profile", "Run under cProfile, saving the stats to " + PROFILEFILE
+                + " (outputs are written in this process unless --jobs)"),
+]
+LONGARGOPTS = [  # Options that require an argument and have no short form
+    ("engine", "Rating engine: object (default), array, parallel or glicko"),
+    ("database", "Read tournaments from this SQLite database (see"
+                 " tourney_db.py)"),
+    ("order", "Replay matches by tournament (file, default) or merged by"
+              " time (started or completed)"),
+    ("chart-top", "Only put the top N players in the MU chart"),
+    ("chart-tile", "Split the MU chart into sheets of N by N players"),
+    ("outputs", "Comma separated outputs to write (default: "
+                + ",".join(OUTPUTS) + ")"),
+    ("jobs", "Number of processes writing outputs (1: no extra processes)"),
+    ("replay-jobs", "Number of processes replaying matches with --engine"
+                    " parallel (default: 1)"),
+    ("metrics", "Write timings, counters and peak memory as JSON to this"
+                " file (- to print them)"),
+]
+
+# The list each output process works from, set once per process
+_snapshot = None
+
+
+def _set_snapshot(elos):
+    global _snapshot
+    _snapshot = elos
+
+
+def _write_output(name, kwargs):
+    """
+    Produce one output from the snapshot.
+
+    Returns:
+        tuple: (wall seconds, CPU seconds) it took
+    """
+    begin = time.perf_counter()
+    cpu = time.process_time()
+    getattr(_snapshot, OUTPUTS[name][0])(**kwargs)
+    return time.perf_counter() - begin, time.process_time() - cpu
+
+
+def write_outputs(elos, outputs, jobs=None, options=None):
+    """
+    Write the requested outputs, several at a time.
+
+    Every writer only reads the list, so each worker process gets its own
+    copy of it as it is when this is called.
+
+    Args:
+        elos (EloList): Players to write out
+        outputs (list of str): Names of outputs from OUTPUTS
+        jobs (int): Number of processes, 1 to write everything in this one
+        options (dict): Keyword arguments for some outputs, by name
+    """
+    options = options or {}
+    if "chart" in outputs or "players" in outputs:
+        # Build this once here instead of once in each process
+        with metrics.phase("h2h_matrix"):
+            elos.h2h_matrix()
+    if jobs == 1 or len(outputs) == 1:
+        _set_snapshot(elos)
+        timings = [_write_output(name, options.get(name, {}))
+                   for name in outputs]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs or len(outputs),
+                                 initializer=_set_snapshot,
+                                 initargs=(elos,)) as pool:
+            futures = [pool.submit(_write_output, name,
+                                   options.get(name, {}))
+                       for name in outputs]
+            timings = [future.result() for future in futures]
+    for name, (seconds, cpu) in zip(outputs, timings):
+        metrics.record("write " + name, seconds, cpu)
+        print(OUTPUTS[name][1] + " ({:.2f} s)".format(seconds))
+
+
+def run(opts, incremental=False, engine="object", history=False,
+        outputs=tuple(OUTPUTS), jobs=None, chartoptions=None,
+        order="file", dbfile=None, replayjobs=None):
+    """
+    Calculate elos, apply the filters given in opts and write the outputs.
+
+    Args:
+        opts (list of tuples): (option, argument) as returned by getopt,
+                               for the filters, which apply in order
+        incremental (bool): Only replay tournaments added since the last run
+        engine (str): Rating engine, see elo_calculator.ENGINES
+        history (bool): Record every rating change
+        outputs (list of str): Names of outputs from OUTPUTS
+        jobs (int): Number of processes writing outputs
+        chartoptions (dict): Keyword arguments for export_spreadsheet
+        order (str): Order to replay matches in, see match_order.ORDERS
+        dbfile (str): SQLite database to read tournaments from instead of
+                      the obj folder
+        replayjobs (int): Number of processes replaying matches with the
+                          parallel engine
+    """
+    # Make sure the files to read from actually exist
+    if dbfile is None and not (tourney_cache.has_index() or (
+            os.path.isdir("obj") and os.path.exists("obj/matches.pkl")
+            and os.path.exists("obj/participants.pkl"))):
+        if not os.path.isdir("obj"):
+            os.mkdir("obj")
+        import save_tourneys
+        with metrics.phase("save_tourneys"):
+            save_tourneys.main()
+    # Create a new EloList object and have that do the work
+    from elo_list import EloList
+    elos = EloList()
+    with metrics.phase("calculate"):
+        if dbfile is not None:
+            elos.calculate_elos_from_database(dbfile, incremental, engine,
+                                              history, order, replayjobs)
+        elif tourney_cache.has_index():
+            elos.calculate_elos_from_cache(incremental=incremental,
+                                           engine=engine, history=history,
+                                           order=order, jobs=replayjobs)
+        else:
+            elos.calculate_elos(incremental=incremental, engine=engine,
+                                history=history, order=order,
+                                jobs=replayjobs)
+    metrics.count("players", len(elos.elolist))
+    # Filters are collected and applied together in one pass,
+    # except around manual filtering which has to see the list so far
+    criteria = []
+    for opt, arg in opts:
+        if opt in ("-t", "--tournaments"):
+            criteria.append(("tournaments", int(arg)))
+        if opt in ("-g", "--games"):
+            criteria.append(("games", int(arg)))
+        if opt in ("-w", "--wins"):
+            criteria.append(("wins", int(arg)))
+        if opt in ("-r", "--rank"):
+            criteria.append(("rank", int(arg)))
+        if opt in ("-e", "--elo"):
+            criteria.append(("elo", int(arg)))
+        if opt in ("-f", "--filter"):  # Manual filtering
+            with metrics.phase("filter"):
+                elos.filter(*criteria)
+            criteria = []
+            elos.filter_manually()
+    if criteria:
+        with metrics.phase("filter"):
+            elos.filter(*criteria)
+    metrics.count("players after filtering", len(elos.elolist))
+    with metrics.phase("write_outputs"):
+        write_outputs(elos, outputs, jobs, {"chart": chartoptions or {}})
+
 
 # Programatically create the usage statement and appropriate options
 USAGE = "calculate_elos.py [options]\nOptions:"\
         "\n\t-h\tDisplay this help"
-SHORTARGS = ""
+SHORTARGS = "h"
 LONGARGS = []
 for opt in OPTS:
     USAGE += "\n\t-" + opt[0][0] + "\t" + opt[1]
@@ -36,6 +206,12 @@ for opt in ARGOPTS:
     USAGE += "\n\t-" + opt[0][0] + "\t" + opt[1]
     SHORTARGS += opt[0][0] + ":"
     LONGARGS.append(opt[0] + "=")
+for opt in LONGOPTS:
+    USAGE += "\n\t--" + opt[0] + "\t" + opt[1]
+    LONGARGS.append(opt[0])
+for opt in LONGARGOPTS:
+    USAGE += "\n\t--" + opt[0] + "\t" + opt[1]
+    LONGARGS.append(opt[0] + "=")
 
 
 if __name__ == "__main__":
@@ -45,36 +221,82 @@ if __name__ == "__main__":
     except getopt.GetoptError:
         print(USAGE)
         sys.exit(2)
-
-    # Make sure the files to read from actually exist
-    if not (os.path.isdir("obj") and os.path.exists("obj/matches.pkl")
-            and os.path.exists("obj/participants.pkl")):
-        if not os.path.isdir("obj"):
-            os.mkdir("obj")
-        import save_tourneys
-        save_tourneys.main()
-    # Create a new EloList object and have that do the work
-    elos = EloList()
-    elos.calculate_elos()
+    incremental = False
+    engine = "object"
+    order = "file"
+    dbfile = None
+    charttop = None
+    charttile = None
+    outputs = list(OUTPUTS)
+    jobs = None
+    replayjobs = None
+    history = False
+    profile = False
+    metricsfile = None
     for opt, arg in opts:
-        if opt.strip('-')[0] == 't':  # Tournaments
-            elos.filter_by_tournaments(int(arg))
-        if opt.strip('-')[0] == 'g':  # Games
-            elos.filter_by_games(int(arg))
-        if opt.strip('-')[0] == 'w':  # Wins
-            elos.filter_by_wins(int(arg))
-        if opt.strip('-')[0] == 'r':  # Rank
-            elos.filter_by_rank(int(arg))
-        if opt.strip('-')[0] == 'e':  # Elo
-            elos.filter_by_elo(int(arg))
-        if opt.strip('-')[0] == 'f':  # Manual filtering
-            elos.filter_manually()
-    elos.export_spreadsheet()
-    elos.save()
-    elos.write_elos()
-    elos.save_summaries()
-    print("Elos have been saved to \"output/elos.txt\".")
-    print("A MU chart of all players has been saved to"
-          + " \"output/MU Chart.xlsx\".")
-    print("Player summaries have been saved to \"output/summaries.txt\".")
+        if opt in ("-h", "--help"):
+            print(USAGE)
+            sys.exit()
+        if opt in ("-i", "--incremental"):
+            incremental = True
+        if opt == "--engine":
+            from elo_calculator import ENGINES
+            if arg not in ENGINES:
+                print(USAGE)
+                sys.exit(2)
+            engine = arg
+        if opt == "--order":
+            from match_order import ORDERS
+            if arg not in ORDERS:
+                print(USAGE)
+                sys.exit(2)
+            order = arg
+        if opt == "--database":
+            dbfile = arg
+        if opt == "--chart-top":
+            charttop = int(arg)
+        if opt == "--chart-tile":
+            charttile = int(arg)
+        if opt == "--outputs":
+            outputs = [name.strip() for name in arg.split(",")]
+            if not all(name in OUTPUTS for name in outputs):
+                print(USAGE)
+                sys.exit(2)
+        if opt == "--jobs":
+            jobs = int(arg)
+        if opt == "--replay-jobs":
+            replayjobs = int(arg)
+        if opt == "--history":
+            history = True
+        if opt == "--profile":
+            profile = True
+        if opt == "--metrics":
+            metricsfile = arg
+
+    if metricsfile is not None:
+        metrics.enable()
+    runargs = (opts, incremental, engine, history, outputs,
+            1 if profile and jobs is None else jobs,
+            {"top": charttop, "tile": charttile}, order, dbfile,
+            replayjobs)
+    with metrics.phase("total"):
+        if profile:
+            import cProfile
+            import pstats
+            profiler = cProfile.Profile()
+            profiler.runcall(run, *runargs)
+            os.makedirs(os.path.dirname(PROFILEFILE), exist_ok=True)
+            profiler.dump_stats(PROFILEFILE)
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+        else:
+            run(*runargs)
+    if metricsfile is not None:
+        import json
+        if metricsfile == "-":
+            json.dump(metrics.report(), sys.stdout, indent=2)
+            sys.stdout.write("\n")
+        else:
+            with open(metricsfile, "w") as f:
+                json.dump(metrics.report(), f, indent=2)
+                f.write("\n")
 
@@ -0,0 +1,257 @@
+"""
+Replay groups of players who never meet each other in separate processes.
+
+A match only changes the ratings of its two players, so players can be
+split into groups (connected components of the graph of who entered a
+tournament with whom) that have no matches between them, and each group
+replayed on its own. Every player sees the same matches in the same order
+as in one replay, so the ratings are exactly the same.
+
+Groups are found with union-find over the tournaments players entered,
+which only looks at each placing once rather than at every match. Every
+tournament then belongs to one group. Groups are packed into as many
+batches as there are processes, most matches first. Each batch's matches
+are encoded here (see array_engine.encode), and each process is only sent
+flat arrays: the ratings, counters and k constants of the batch's
+players, and the player indices and results of its matches. It replays
+them with array_engine.replay and sends back the new ratings and counters;
+head-to-head records are added here, from the encoded matches. Nothing
+but arrays crosses processes, so matches read from a match_store file or
+a tournament database work with spawned processes too.
+
+Only the rating loop runs in other processes, and it is a small part of a
+replay, so this only gains anything with several CPUs and several large
+groups; see benchmarks/parallel_replay.py.
+"""
+
+import heapq
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+import metrics
+import array_engine
+
+class DisjointSet:
+    """
+    Union-find over the integers 0 to size - 1.
+
+    Fields include:
+    parent          array of int (parent of each element, roots are their
+                    own parent)
+    size            array of int (number of elements under each root)
+    """
+
+    def __init__(self, size):
+        self.parent = array("l", range(size))
+        self.size = array("l", [1]) * size
+
+    def find(self, x):
+        """
+        Return the root of the set x is in.
+        """
+        parent = self.parent
+        while parent[x] != x:
+            # Path halving: point x at its grandparent as we go
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a, b):
+        """
+        Merge the sets a and b are in, returning the root of the result.
+        """
+        a = self.find(a)
+        b = self.find(b)
+        if a == b:
+            return a
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        return a
+
+
+def player_groups(players):
+    """
+    Join every player to everyone they entered a tournament with.
+
+    Args:
+        players (list of Players): players, with their placings
+
+    Returns:
+        DisjointSet: over indices in players
+    """
+    groups = DisjointSet(len(players))
+    # First player seen in each tournament, by tournament id
+    first = {}
+    for i, player in enumerate(players):
+        for placing in player.placings:
+            tid = placing.tourney["id"]
+            if tid in first:
+                groups.union(first[tid], i)
+            else:
+                first[tid] = i
+    return groups
+
+
+def components(players_by_name, names_by_id, all_matches):
+    """
+    Split players and tournaments into groups that share no players.
+
+    Args:
+        players_by_name (dict): player name to Player, with their placings
+        names_by_id (dict): participant id to player name
+        all_matches (list of lists): matches grouped by tournament
+
+    Returns:
+        list of tuples: (players, tournaments) of each group, where players
+                        are indices in players_by_name and tournaments are
+                        indices in all_matches, in order
+    """
+    players = list(players_by_name.values())
+    index_by_name = {name: i for i, name in enumerate(players_by_name)}
+    groups = player_groups(players)
+    tournaments = {}
+    for t, matches in enumerate(all_matches):
+        # Anyone in a tournament tells which group it belongs to
+        root = None
+        for match in matches:
+            pid = match["winner-id"]
+            if pid is None:
+                pid = match["loser-id"]
+            if pid is not None:
+                root = groups.find(index_by_name[names_by_id[pid]])
+                break
+        if root not in tournaments:
+            tournaments[root] = []
+        tournaments[root].append(t)
+    # Tournaments without anyone in their matches can go with any group
+    if None in tournaments and len(tournaments) > 1:
+        empty = tournaments.pop(None)
+        other = next(iter(tournaments))
+        tournaments[other] = sorted(tournaments[other] + empty)
+    members = {root: [] for root in tournaments}
+    for i in range(len(players)):
+        root = groups.find(i)
+        if root in members:
+            members[root].append(i)
+    return [(members[root], tournaments[root]) for root in tournaments]
+
+
+def _batches(groups, sizes, count):
+    """
+    Pack groups into at most count batches with about as many matches each.
+
+    Args:
+        sizes (list of int): number of matches in each group
+    """
+    count = min(count, len(groups))
+    batches = [[] for _ in range(count)]
+    # (matches so far, batch) of every batch, fewest first
+    loads = [(0, n) for n in range(count)]
+    for size, group in sorted(zip(sizes, groups), key=lambda pair: pair[0],
+                              reverse=True):
+        load, n = heapq.heappop(loads)
+        batches[n].append(group)
+        heapq.heappush(loads, (load + size, n))
+    return [batch for batch in batches if batch]
+
+
+def _encode(batch, players, names_by_id, all_matches):
+    """
+    Encode the matches of a batch of groups, with players indexed in the
+    order they are listed in the batch.
+
+    Returns:
+        tuple: (players of the batch, EncodedMatches)
+    """
+    members = [players[i] for group, tournaments in batch for i in group]
+    index_by_name = {player.name: n for n, player in enumerate(members)}
+    tournaments = sorted(t for group, tournaments in batch
+                         for t in tournaments)
+    encoded = array_engine.encode([all_matches[t] for t in tournaments],
+                                  names_by_id, index_by_name)
+    return members, encoded
+
+
+def _payload(members, encoded):
+    """
+    Return what a process needs to replay a batch: flat arrays only.
+
+    Returns:
+        tuple: elos, won, played and k constants of the batch's players,
+               and winners, losers, winresults, lossresults and valid of
+               its encoded matches
+    """
+    return (array("d", [player.elo for player in members]),
+            array("l", [player.won for player in members]),
+            array("l", [player.played for player in members]),
+            array("d", [player.kconst() for player in members]),
+            encoded.winners, encoded.losers, encoded.winresults,
+            encoded.lossresults, encoded.valid)
+
+
+def _replay_batch(payload):
+    """
+    Replay the encoded matches of a batch in a worker process.
+
+    Args:
+        payload (tuple): as returned by _payload
+
+    Returns:
+        tuple: (elos, won, played) arrays of the batch's players
+    """
+    elos, won, played, kconsts = payload[:4]
+    encoded = array_engine.EncodedMatches()
+    (encoded.winners, encoded.losers, encoded.winresults,
+     encoded.lossresults, encoded.valid) = payload[4:]
+    array_engine.replay(elos, won, played, kconsts, encoded)
+    return elos, won, played
+
+
+def replay_matches(players_by_name, names_by_id, all_matches, history=None,
+                   start=0, jobs=None):
+    """
+    Same as array_engine.replay_matches, replaying groups of players who
+    never play each other in up to jobs processes.
+
+    Matches must be grouped by tournament. Everything is replayed in this
+    process if there is only one process or one group, or if a history is
+    being recorded (matches without a time are recorded at the time of the
+    match before them, which may be in another group).
+
+    Args:
+        jobs (int): Number of processes, default 1
+
+    Returns:
+        tuple: (matches read, matches with a winner, matches counted)
+    """
+    jobs = jobs or 1
+    groups = None
+    if jobs > 1 and history is None:
+        groups = components(players_by_name, names_by_id, all_matches)
+        metrics.count("player groups", len(groups))
+    if groups is None or len(groups) <= 1:
+        encoded = array_engine.replay_matches(
+            players_by_name, names_by_id, all_matches, history, start)
+        return encoded.total, len(encoded), sum(encoded.valid)
+    sizes = [sum(len(all_matches[t]) for t in tournaments)
+             for members, tournaments in groups]
+    batches = _batches(groups, sizes, jobs)
+    players = list(players_by_name.values())
+    encoded = [_encode(batch, players, names_by_id, all_matches)
+               for batch in batches]
+    with ProcessPoolExecutor(max_workers=len(batches)) as pool:
+        results = list(pool.map(_replay_batch,
+                                [_payload(members, batch)
+                                 for members, batch in encoded]))
+    counts = [0, 0, 0]
+    for (members, batch), (elos, won, played) in zip(encoded, results):
+        for player, elo, wins, games in zip(members, elos, won, played):
+            player.elo = elo
+            player.won = wins
+            player.played = games
+        array_engine.record_h2h(members, batch)
+        counts[0] += batch.total
+        counts[1] += len(batch)
+        counts[2] += sum(batch.valid)
+    return tuple(counts)
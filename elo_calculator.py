@@ -5,12 +5,23 @@ Uses the Challonge public API and pychallonge to parse data.
 pychallonge can be found here: https://github.com/russ-/pychallonge
 """
 
+import os
+import math
 import pickle
-from player import Player
+import hashlib
+import player
+from player import Player, classify_score
+import array_engine
+import match_order
+import match_store
+import metrics
+import name_resolver
+from rating_history import RatingHistory
 
-from aliases import aliases  # Another file I made with a dictionary
-# of replacements for names
-# For example, one of the entries is "JEREMY LEFURGE" : "NERFAN"
+CHECKPOINTFILE = os.path.join("obj", "checkpoint.pkl")
+CHECKPOINTVERSION = 6
+# Ways of replaying matches, see EloCalculator.read_matches
+ENGINES = ("object", "array", "parallel", "glicko")
 
 
 class EloCalculator:
@@ -27,24 +38,76 @@ class EloCalculator:
     # Allows players to be accessed by ID
     # names_by_id = {}
 
-    def __init__(self):
+    def __init__(self, engine="object", history=False, resolver=None,
+                 order="file", jobs=None):
         """
         Constructor method
 
-        Takes no arguments, returns a new EloList object with empty everything.
+        Returns a new EloCalculator object with empty everything.
+
+        Args:
+            engine (str): "object" to update Player objects match by match,
+                          "array" to replay matches with array_engine,
+                          "parallel" to do the same with groups of
+                          players who never meet replayed in separate
+                          processes (see components.py).
+                          All give the same results.
+                          "glicko" rates players with Glicko-2
+                          instead, one tournament being one rating
+                          period (see glicko.py).
+            history (bool): Record every rating change in self.history
+            resolver (NameResolver): Turns display names into player
+                                     names, default from aliases.py
+            order (str): Order to replay matches in, see match_order.ORDERS
+            jobs (int): Number of processes the "parallel" engine replays
+                        matches in, default 1
         """
+        if engine not in ENGINES:
+            raise ValueError("Unknown engine: " + str(engine))
+        if order not in match_order.ORDERS:
+            raise ValueError("Unknown match order: " + str(order))
+        self.engine = engine
+        self.order = order
+        self.jobs = jobs
         self.players_by_name = {}
+        # Every Player, indexed by Player.id
+        self.roster = []
         self.names_by_id = {}
         self.tournaments = {}
+        # Fingerprints of the tournaments processed so far, in order
+        self.processed = []
+        # Number of matches read so far
+        self.matchcount = 0
+        # Matches read by this object that had no winner, and that had a
+        # score that isn't counted
+        self.unplayed = 0
+        self.unrecognized = 0
+        # Key (see match_order.match_key) of the latest match replayed,
+        # if matches are replayed by time
+        self.latest = None
+        self.history = RatingHistory() if history else None
+        # Deviations and volatilities, if rating with Glicko-2
+        self.glicko = None
+        if engine == "glicko":
+            import glicko
+            self.glicko = glicko.GlickoState()
+        self.resolver = resolver or name_resolver.default()
 
     def read_tournaments_file(self, tournamentfile):
         """
         Read obj/tournaments.pkl and create the tournament dictionary.
         """
-        with open(tournamentfile, "rb") as f:
+        with metrics.phase("unpickle"), open(tournamentfile, "rb") as f:
             tournaments = pickle.load(f)
-        for tournament in tournaments:
-            self.tournaments[tournament["id"]] = tournament
+        self.read_tournaments(tournaments)
+
+    def read_tournaments(self, tournaments):
+        """
+        Create the tournament dictionary from a list of tournaments.
+        """
+        with metrics.phase("read_tournaments"):
+            for tournament in tournaments:
+                self.tournaments[tournament["id"]] = tournament
 
     def read_participants_file(self, participantsfile):
         """
@@ -53,41 +116,121 @@ class EloCalculator:
         Assumes that the files exist as created by save_tournaments.py.
         Initializes players_by_name and names_by_id.
         """
-        with open(participantsfile, "rb") as f:
+        with metrics.phase("unpickle"), open(participantsfile, "rb") as f:
             participants = pickle.load(f)
-        # Go through participants
-        for participantlist in participants:
-            players = 0
-            # Check how many players are in the tournament being parsed
-            for participant in participantlist:
-                players += 1
-            # Add the player to the dictionaries
-            for participant in participantlist:
-                # Normalize all names
-                name = participant["display-name"].upper()
-                # Check for known aliases; allow transitive property
-                if name in aliases:
-                    name = aliases[name]
-                if "JUSTIN" in name:
-                    name = "JUSTIN"
-                # Add to reference dictionaries and update data
-                self.names_by_id[participant["id"]] = name
-                if name not in self.players_by_name:
-                    self.players_by_name[name] = Player(name)
-                self.players_by_name[name].record_tourney(
-                    self.tournaments[participant["tournament-id"]],
-                    participant
-                )
+        self.read_participants(participants)
+
+    def read_participants(self, participants):
+        """
+        Create player dictionaries from participants grouped by tournament.
+
+        Tournaments must have been read first.
+        """
+        created = len(self.roster)
+        renamed = 0
+        resolve = self.resolver.resolve
+        with metrics.phase("read_participants"):
+            # Go through participants
+            for participantlist in participants:
+                # Add the player to the dictionaries
+                for participant in participantlist:
+                    # Normalize all names, applying aliases and patterns
+                    displayname = participant["display-name"]
+                    name = resolve(displayname)
+                    if name != displayname.upper():
+                        renamed += 1
+                    # Add to reference dictionaries and update data
+                    self.names_by_id[participant["id"]] = name
+                    if name not in self.players_by_name:
+                        player = Player(name, len(self.roster), self.roster)
+                        self.roster.append(player)
+                        self.players_by_name[name] = player
+                    self.players_by_name[name].record_tourney(
+                        self.tournaments[participant["tournament-id"]],
+                        participant
+                    )
+        metrics.count("participants read", sum(map(len, participants)))
+        metrics.count("players created", len(self.roster) - created)
+        metrics.count("alias hits", renamed)
 
     def read_matches_file(self, matchesfile):
         """
-        Read obj/matches.pkl and parse all matches.
+        Read obj/matches.pkl (or a match_store file) and parse all matches.
         """
-        with open(matchesfile, "rb") as f:
+        if match_store.is_store(matchesfile):
+            self.read_matches(match_store.MatchStore(matchesfile))
+            return
+        with metrics.phase("unpickle"), open(matchesfile, "rb") as f:
             all_matches = pickle.load(f)
-        for tournament in all_matches:
-            for match in tournament:
-                self.parse_match(match)
+        self.read_matches(all_matches)
+
+    def read_matches(self, all_matches):
+        """
+        Parse all matches from a list of matches grouped by tournament.
+
+        A match_store.MatchStore can be given in place of the list.
+        Unless the order is "file", matches of all tournaments are merged
+        into one stream by time as they are replayed (see match_order).
+        With Glicko-2, tournaments are rated whole, as rating periods, in
+        order of their first match instead.
+        """
+        before = (self.matchcount, self.unplayed, self.unrecognized)
+        with metrics.phase("read_matches"):
+            if self.order != "file":
+                with metrics.phase("order_matches"):
+                    tournamentspans = match_order.spans(all_matches,
+                                                        self.order)
+                for span in tournamentspans:
+                    if span and (self.latest is None
+                                 or span[1] > self.latest):
+                        self.latest = span[1]
+                if self.engine == "glicko":
+                    # Tournaments are kept whole as rating periods, in
+                    # order of their first match
+                    all_matches = [all_matches[t] for t in sorted(
+                        range(len(all_matches)),
+                        key=lambda t: (tournamentspans[t][0]
+                                       if tournamentspans[t]
+                                       else (math.inf,)))]
+                else:
+                    all_matches = match_order.ordered(
+                        all_matches, self.order, tournamentspans)
+            if self.engine == "glicko":
+                import glicko
+                encoded = glicko.replay_matches(
+                    self.players_by_name, self.names_by_id, all_matches,
+                    self.glicko, self.history, self.matchcount)
+                self._count_replayed(encoded.total, len(encoded),
+                                     sum(encoded.valid))
+            elif self.engine == "parallel" and self.order == "file":
+                # Players are only split into groups when matches are
+                # replayed a tournament at a time
+                import components
+                counts = components.replay_matches(
+                    self.players_by_name, self.names_by_id, all_matches,
+                    self.history, self.matchcount, self.jobs)
+                self._count_replayed(*counts)
+            elif self.engine != "object":
+                encoded = array_engine.replay_matches(
+                    self.players_by_name, self.names_by_id, all_matches,
+                    self.history, self.matchcount)
+                self._count_replayed(encoded.total, len(encoded),
+                                     sum(encoded.valid))
+            else:
+                for tournament in all_matches:
+                    for match in tournament:
+                        self.parse_match(match)
+        metrics.count("matches read", self.matchcount - before[0])
+        metrics.count("matches without a winner",
+                      self.unplayed - before[1])
+        metrics.count("matches with an unrecognized score",
+                      self.unrecognized - before[2])
+
+    def _count_replayed(self, read, played, counted):
+        # Update the counters parse_match would have for replayed matches
+        self.matchcount += read
+        self.unplayed += read - played
+        self.unrecognized += played - counted
 
     def parse_match(self, match):
         """
@@ -106,14 +249,152 @@ class EloCalculator:
             # Also record match for head-to-head
             winner.calculateWin(loser, match)
             loser.calculateLoss(winner, match)
+            if classify_score(match["scores-csv"]) is None:
+                self.unrecognized += 1
+            elif self.history is not None:
+                self.history.record_match(winner.id, winner.elo, loser.id,
+                                          loser.elo, match["started-at"],
+                                          self.matchcount)
+        else:
+            self.unplayed += 1
+        self.matchcount += 1
 
     def calculate(self, tournamentfile, participantsfile, matchesfile):
         """
         Run the calculations.
         """
-        self.read_tournaments_file(tournamentfile)
-        self.read_participants_file(participantsfile)
-        self.read_matches_file(matchesfile)
+        self.calculate_data(*load_files(tournamentfile, participantsfile,
+                                        matchesfile))
+
+    def calculate_data(self, tournaments, participants, all_matches):
+        """
+        Run the calculations on data that has already been loaded.
+
+        Takes the same lists that save_tourneys.py pickles, e.g. the ones
+        returned by tourney_cache.load_all().
+        """
+        self.read_tournaments(tournaments)
+        self.read_participants(participants)
+        self.read_matches(all_matches)
+        self.processed.extend(fingerprints(tournaments, participants,
+                                           all_matches))
+
+    def calculate_incremental(self, tournaments, participants, all_matches,
+                              checkpointfile=CHECKPOINTFILE):
+        """
+        Run the calculations, only replaying tournaments new since last time.
+
+        If the checkpoint covers a prefix of the given tournaments, unchanged,
+        its state is restored and only the remaining tournaments are
+        processed. Otherwise (a tournament was inserted earlier in the list,
+        or one was updated) everything is replayed from the start.
+        Either way, a new checkpoint is saved afterwards.
+
+        The result is identical to a full replay, since tournaments are
+        processed in the same order either way. If the aliases, pattern
+        rules or rating constants changed since the checkpoint (see
+        settings), everything is replayed. If a history is being
+        recorded and the checkpoint has none, or the checkpoint was saved
+        with Elo ratings and these are Glicko-2 ratings (or the other way
+        round), everything is replayed too.
+        When matches are replayed by time, the checkpoint is only used if
+        it was saved in the same order and no new match comes before the
+        latest one it replayed.
+        """
+        done = 0
+        with metrics.phase("load_checkpoint"):
+            checkpoint = load_checkpoint(checkpointfile)
+        if checkpoint is not None and not self.players_by_name:
+            done = len(checkpoint["processed"])
+            current = fingerprints(tournaments, participants, all_matches)
+            if checkpoint["processed"] != current[:done]:
+                done = 0
+            elif checkpoint["settings"] != self.settings():
+                done = 0
+            elif self.history is not None \
+                    and checkpoint["history"] is None:
+                done = 0
+            elif checkpoint["order"] != self.order:
+                done = 0
+            elif (checkpoint["glicko"] is None) != (self.glicko is None):
+                done = 0
+            elif self.order != "file" and checkpoint["latest"] is not None \
+                    and any(span[0] < checkpoint["latest"] for span
+                            in match_order.spans(all_matches[done:],
+                                                 self.order) if span):
+                done = 0
+            else:
+                self.players_by_name = checkpoint["players_by_name"]
+                self.roster = checkpoint["roster"]
+                self.names_by_id = checkpoint["names_by_id"]
+                self.tournaments = checkpoint["tournaments"]
+                self.processed = checkpoint["processed"]
+                self.matchcount = checkpoint["matchcount"]
+                self.latest = checkpoint["latest"]
+                if self.history is not None:
+                    self.history = checkpoint["history"]
+                if self.glicko is not None:
+                    self.glicko = checkpoint["glicko"]
+        metrics.count("tournaments restored from checkpoint", done)
+        self.calculate_data(tournaments[done:], participants[done:],
+                            all_matches[done:])
+        with metrics.phase("save_checkpoint"):
+            self.save_checkpoint(checkpointfile)
+
+    def save_checkpoint(self, checkpointfile=CHECKPOINTFILE):
+        """
+        Save the full state of the calculator after the last tournament.
+
+        This includes players (ratings, counters and head-to-heads), the id
+        lookups, which tournaments have been processed and the rating
+        history if one is being recorded, as well as deviations and
+        volatilities if rating with Glicko-2.
+        """
+        dirpath = os.path.dirname(checkpointfile)
+        if dirpath:
+            os.makedirs(dirpath, exist_ok=True)
+        checkpoint = {
+            "version": CHECKPOINTVERSION,
+            "players_by_name": self.players_by_name,
+            "roster": self.roster,
+            "names_by_id": self.names_by_id,
+            "tournaments": self.tournaments,
+            "processed": self.processed,
+            "matchcount": self.matchcount,
+            "order": self.order,
+            "latest": self.latest,
+            "history": self.history,
+            "glicko": self.glicko,
+            "settings": self.settings(),
+        }
+        temppath = checkpointfile + ".tmp"
+        with open(temppath, "wb") as f:
+            pickle.dump(checkpoint, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temppath, checkpointfile)
+
+    def settings(self):
+        """
+        Summarize everything besides the tournaments that ratings depend on.
+
+        That is the aliases and pattern rules names are resolved with, the
+        constants of player.py (KFACTOR, IGNOREGAMES, SCOREWEIGHTS and
+        Player.DEFAULT_ELO) and, with Glicko-2, those of glicko.py.
+
+        Returns:
+            str: A digest that changes whenever any of these do
+        """
+        values = [
+            sorted(self.resolver.aliases.items()),
+            [(pattern.pattern, name)
+             for pattern, name in self.resolver.patterns],
+            player.KFACTOR, player.IGNOREGAMES,
+            sorted(player.SCOREWEIGHTS.items()), Player.DEFAULT_ELO,
+        ]
+        if self.glicko is not None:
+            import glicko
+            values.append((glicko.TAU, glicko.DEFAULT_DEVIATION,
+                           glicko.DEFAULT_VOLATILITY, glicko.EPSILON))
+        return hashlib.sha256(repr(values).encode()).hexdigest()
 
     def set_elo_list(self, elolist):
         """
@@ -123,11 +404,70 @@ class EloCalculator:
         Since this resets, it deletes the old data.
         """
         self.players_by_name.clear()
+        self.roster = []
         for player in elolist:
             self.players_by_name[player.name.upper()] = player
+            if player.roster is not None:
+                self.roster = player.roster
 
     def get_elo_list(self):
         """
         Return the list of all Player objects.
         """
         return list(self.players_by_name.values())
+
+
+def load_files(tournamentfile, participantsfile, matchesfile):
+    """
+    Unpickle the three files written by save_tourneys.py.
+
+    The matches file may also be a match_store file, in which case it is
+    memory-mapped rather than loaded.
+
+    Returns:
+        tuple: (tournaments, participants, matches)
+    """
+    data = []
+    with metrics.phase("unpickle"):
+        for filename in (tournamentfile, participantsfile):
+            with open(filename, "rb") as f:
+                data.append(pickle.load(f))
+        if match_store.is_store(matchesfile):
+            data.append(match_store.MatchStore(matchesfile))
+        else:
+            with open(matchesfile, "rb") as f:
+                data.append(pickle.load(f))
+    return tuple(data)
+
+
+def fingerprints(tournaments, participants, all_matches):
+    """
+    Summarize tournaments so that changes to them can be detected.
+
+    Returns:
+        list of tuples: (id, updated-at, participant count, match count)
+                        for each tournament, in order
+    """
+    return [(tournament["id"], tournament.get("updated-at"),
+             len(participantlist), len(matches))
+            for tournament, participantlist, matches
+            in zip(tournaments, participants, all_matches)]
+
+
+def load_checkpoint(checkpointfile=CHECKPOINTFILE):
+    """
+    Read a checkpoint saved by EloCalculator.save_checkpoint.
+
+    Returns:
+        dict: The checkpoint, or None if it is missing or from another version
+    """
+    try:
+        with open(checkpointfile, "rb") as f:
+            checkpoint = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError,
+            AttributeError, TypeError):
+        # Checkpoints from older versions may not unpickle at all
+        return None
+    if checkpoint.get("version") != CHECKPOINTVERSION:
+        return None
+    return checkpoint
@@ -3,18 +3,36 @@ Hold the list of elos and operate on it.
 
 This class provides utilities to save and load the list, as well as edit it.
 We have functions such as filtering and writing to a spreadsheet.
+
+Modules only some commands need (xlsxwriter, the calculator) are imported
+by the methods that use them, so that read-only commands start quickly.
 """
 
 import time
-import xlsxwriter
+import gzip
+import bisect
 import pickle
 import os
-import pathlib
-import subprocess
-import webbrowser
-from elo_calculator import EloCalculator
+import tourney_cache
+from h2h_matrix import H2HMatrix, roster_hash
+from rating_history import RatingHistory
+import match_store
+import metrics
+from player import UNKNOWN_ELO
 
 SCRIPTDIR = os.path.dirname(os.path.realpath(__file__))
+# Buffer size used when writing output files
+BUFFERSIZE = 1 << 16
+
+# Player attribute checked by each kind of criterion in EloList.select
+# None means a rank cutoff
+CRITERIA = {
+    "games": lambda player: player.played,
+    "wins": lambda player: player.won,
+    "tournaments": lambda player: len(player.placings),
+    "elo": lambda player: player.elo,
+    "rank": None,
+}
 
 
 class EloList:
@@ -38,11 +56,195 @@ class EloList:
         Takes no arguments, initializes the list to empty.
         """
         self.elolist = []
+        self._matrix = None
+        self._matrixroster = None
+        # RatingHistory of every player in roster(), if it was recorded
+        self.history = None
+        # glicko.GlickoState, if players were rated with Glicko-2
+        self.glicko = None
+
+    @property
+    def elolist(self):
+        """
+        List of Player objects.
+
+        Assigning a new list resets the index used by ranked().
+        """
+        return self._elolist
+
+    @elolist.setter
+    def elolist(self, players):
+        self._elolist = players
+        self._ranked = None
+        self._keys = None
+        self._byname = None
+
+    def reindex(self):
+        """
+        Rebuild the elo index on next use.
+
+        Needed if elolist is changed in place or elos change after ranking.
+        """
+        self._ranked = None
+        self._keys = None
+        self._byname = None
+
+    def ranked(self):
+        """
+        Return the players sorted by elo, highest first.
+
+        The sorted list is kept as an index and only rebuilt when elolist
+        is replaced, so it should not be modified by the caller.
+        """
+        if self._ranked is None:
+            self._ranked = sorted(self._elolist,
+                                  key=lambda x: x.elo, reverse=True)
+            self._keys = None
+        return self._ranked
+
+    def count_at_least(self, elo):
+        """
+        Return how many players have an elo of at least the given value.
+        """
+        if self._keys is None:
+            # Ascending keys so that the index can be bisected
+            self._keys = [-player.elo for player in self.ranked()]
+        return bisect.bisect_right(self._keys, -elo)
+
+    def roster(self):
+        """
+        Return every player that was calculated, including filtered ones.
+
+        Players refer to each other by index in this list.
+        """
+        for player in self.elolist:
+            if player.roster is not None:
+                return player.roster
+        return []
+
+    def h2h_matrix(self):
+        """
+        Return the head-to-head matrix of every player in roster().
+
+        The matrix is built the first time it is needed and then reused,
+        since filtering does not change anyone's head-to-heads.
+        """
+        roster = self.roster()
+        if self._matrix is None or self._matrixroster is not roster:
+            self._matrix = H2HMatrix.from_players(roster)
+            self._matrixroster = roster
+        return self._matrix
+
+    def player(self, name):
+        """
+        Return the Player with the given name, or None.
+
+        Names are not case sensitive, and names in aliases.py are looked up
+        as the player they belong to. Players that were filtered out of
+        elolist can still be found, since they are kept in roster().
+        """
+        if self._byname is None:
+            self._byname = {player.name.upper(): player
+                            for player in self.roster() or self.elolist}
+            for player in self.elolist:
+                self._byname.setdefault(player.name.upper(), player)
+        player = self._byname.get(name.upper())
+        if player is None:
+            import name_resolver
+            player = self._byname.get(name_resolver.resolve(name))
+        return player
+
+    def seed_order(self, entrants, name=lambda x: x):
+        """
+        Sort entrants of a tournament by elo, best first.
+
+        Entrants without any elo records are treated as having UNKNOWN_ELO.
+
+        Args:
+            entrants (list): entrants, e.g. names or participant json objects
+            name (function): returns the name of an entrant
+
+        Returns:
+            list: entrants in the order they should be seeded
+        """
+        def elo(entrant):
+            player = self.player(name(entrant))
+            return UNKNOWN_ELO if player is None else player.elo
+        return sorted(entrants, key=elo, reverse=True)
+
+    def top(self, count):
+        """
+        Return the players with the highest elos, best first.
+        """
+        return self.ranked()[:count]
+
+    def select(self, *criteria):
+        """
+        Return the players that meet every one of the given criteria.
+
+        Criteria are (kind, value) pairs, applied in order as if each one
+        had filtered the list on its own, but evaluated in a single pass:
+            ("games", n)        at least n games played
+            ("wins", n)         at least n games won
+            ("tournaments", n)  at least n tournaments entered
+            ("elo", n)          elo of at least n
+            ("rank", n)         among the n best of the players left
+                                by the criteria before it
+
+        Returns:
+            list of Players: matching players, sorted by elo, highest first
+        """
+        ranked = self.ranked()
+        # The index is sorted by elo, so an elo minimum cuts off the end
+        # of it no matter where it appears among the criteria
+        stop = len(ranked)
+        checks = []
+        for kind, value in criteria:
+            if kind not in CRITERIA:
+                raise ValueError("Unknown criterion: " + str(kind))
+            if kind == "elo":
+                stop = min(stop, self.count_at_least(value))
+            else:
+                checks.append((CRITERIA[kind], value))
+        if all(getter is None for getter, value in checks):
+            # Only rank cutoffs left, which are plain slices
+            for getter, value in checks:
+                stop = min(stop, value)
+            return ranked[:max(stop, 0)]
+        # Number of players that have reached each rank cutoff so far
+        counts = [0] * len(checks)
+        selected = []
+        for player in ranked[:stop]:
+            for i, (getter, value) in enumerate(checks):
+                if getter is None:
+                    if counts[i] >= value:
+                        # Nobody else can make it past this cutoff
+                        return selected
+                    counts[i] += 1
+                elif getter(player) < value:
+                    break
+            else:
+                selected.append(player)
+        return selected
+
+    def filter(self, *criteria):
+        """
+        Remove every player that does not meet the given criteria.
+
+        Takes the same criteria as select().
+        """
+        selected = self.select(*criteria)
+        keep = set(selected)
+        self.elolist = [p for p in self.elolist if p in keep]
+        # Survivors keep their relative order, so they are already ranked
+        self._ranked = selected
 
     def calculate_elos(self,
                        tournamentfile="obj/tournaments.pkl",
                        participantsfile="obj/participants.pkl",
-                       matchesfile="obj/matches.pkl"):
+                       matchesfile="obj/matches.pkl",
+                       incremental=False, engine="object", history=False,
+                       order="file", jobs=None):
         """
         Calculate changes to the list of elos based on saved tournaments.
 
@@ -50,56 +252,199 @@ class EloList:
             tournamentfile (str): path to file of list of tournaments
             participantfile (str): path to file of list of participants
             matchfile (str): path to file of list of matches
+            incremental (bool): only replay tournaments added since the
+                                last checkpoint (see obj/checkpoint.pkl)
+            engine (str): "object", "array", "parallel" or "glicko",
+                          see EloCalculator
+            history (bool): record every rating change in self.history
+            order (str): order to replay matches in, see match_order
+            jobs (int): number of processes the "parallel" engine replays
+                        matches in, default 1
 
             All of these files should have been created by save_tourneys.py
         """
-        calculator = EloCalculator()
+        from elo_calculator import EloCalculator, load_files
+        calculator = EloCalculator(engine, history, order=order, jobs=jobs)
         calculator.set_elo_list(self.elolist)
-        calculator.calculate(tournamentfile, participantsfile, matchesfile)
+        if incremental:
+            calculator.calculate_incremental(
+                *load_files(tournamentfile, participantsfile, matchesfile))
+        else:
+            calculator.calculate(tournamentfile, participantsfile,
+                                 matchesfile)
+        self.elolist = calculator.get_elo_list()
+        self._set_history(calculator)
+
+    def calculate_elos_from_cache(self, cachedir=tourney_cache.CACHEDIR,
+                                  incremental=False, engine="object",
+                                  storefile=match_store.STOREFILE,
+                                  history=False, order="file", jobs=None):
+        """
+        Calculate changes to the list of elos from the tournament cache.
+
+        Matches are read from the columnar match store instead of the cache
+        if the store exists and was saved with the same version of every
+        tournament (see match_store.digest).
+
+        Args:
+            cachedir (str): path to the per-tournament cache directory
+                            written by save_tourneys.py
+            storefile (str): path to a match_store file
+            incremental (bool): only replay tournaments added since the
+                                last checkpoint (see obj/checkpoint.pkl)
+            engine (str): "object", "array", "parallel" or "glicko",
+                          see EloCalculator
+            history (bool): record every rating change in self.history
+            order (str): order to replay matches in, see match_order
+            jobs (int): number of processes the "parallel" engine replays
+                        matches in, default 1
+        """
+        with metrics.phase("unpickle"):
+            tournaments, participants, all_matches = tourney_cache.load_all(
+                cachedir, with_matches=False)
+            if os.path.exists(storefile):
+                try:
+                    all_matches = match_store.MatchStore(storefile)
+                except ValueError:
+                    # Written by another version
+                    all_matches = None
+                if all_matches is not None and \
+                        all_matches.digest != match_store.digest(tournaments):
+                    all_matches = None
+            if all_matches is None:
+                all_matches = tourney_cache.load_matches(cachedir)
+        self._calculate(tournaments, participants, all_matches, incremental,
+                        engine, history, order, jobs)
+
+    def calculate_elos_from_database(self, dbfile="obj/tourneys.db",
+                                     incremental=False, engine="object",
+                                     history=False, order="file",
+                                     jobs=None):
+        """
+        Calculate changes to the list of elos from a tournament database.
+
+        Participants and matches are streamed from the database one
+        tournament at a time instead of being loaded first.
+
+        Args:
+            dbfile (str): path to a database written by tourney_db.py
+            incremental (bool): only replay tournaments added since the
+                                last checkpoint (see obj/checkpoint.pkl)
+            engine (str): "object", "array", "parallel" or "glicko",
+                          see EloCalculator
+            history (bool): record every rating change in self.history
+            order (str): order to replay matches in, see match_order
+            jobs (int): number of processes the "parallel" engine replays
+                        matches in, default 1
+        """
+        import tourney_db
+        with tourney_db.TourneyDatabase(dbfile) as database:
+            with metrics.phase("unpickle"):
+                data = database.load()
+            self._calculate(*data, incremental, engine, history, order,
+                            jobs)
+
+    def _calculate(self, tournaments, participants, all_matches,
+                   incremental, engine, history, order, jobs):
+        from elo_calculator import EloCalculator
+        calculator = EloCalculator(engine, history, order=order, jobs=jobs)
+        calculator.set_elo_list(self.elolist)
+        if incremental:
+            calculator.calculate_incremental(tournaments, participants,
+                                             all_matches)
+        else:
+            calculator.calculate_data(tournaments, participants, all_matches)
         self.elolist = calculator.get_elo_list()
+        self._set_history(calculator)
+
+    def _set_history(self, calculator):
+        self.history = calculator.history
+        self.glicko = calculator.glicko
+        if self.history is not None:
+            self.history.resize(len(self.roster()))
+
+    def rating_at(self, name, when):
+        """
+        Return a player's elo as it was at a point in time.
+
+        Needs the rating history, see calculate_elos.
+
+        Args:
+            name (str): Name of the player
+            when: Point in time, as a datetime, a date (meaning the end of
+                  that day), an ISO 8601 string or a timestamp
+
+        Returns:
+            float: The elo, or None if the player had not played yet
+        """
+        if self.history is None:
+            raise ValueError("No rating history was recorded")
+        player = self.player(name)
+        if player is None:
+            return None
+        return self.history.rating_at(player.id, when)
+
+    def deviation(self, name):
+        """
+        Return a player's Glicko-2 rating deviation, in rating points.
+
+        Needs players to have been rated with the "glicko" engine, see
+        calculate_elos.
 
-    def export_spreadsheet(self):
+        Returns:
+            float: The deviation, or None if there is no such player
+        """
+        if self.glicko is None:
+            raise ValueError("Players were not rated with Glicko-2")
+        player = self.player(name)
+        if player is None:
+            return None
+        return self.glicko.deviation(player.id)
+
+    def leaderboard_as_of(self, when):
+        """
+        Return the players in elolist ranked by their elo at a point in time.
+
+        Needs the rating history, see calculate_elos. Players who had not
+        played yet are left out.
+
+        Returns:
+            list of tuples: (Player, elo), highest first
+        """
+        if self.history is None:
+            raise ValueError("No rating history was recorded")
+        roster = self.roster()
+        return [(roster[pid], elo) for pid, elo in self.history.leaderboard(
+            when, [player.id for player in self.elolist])]
+
+    def export_spreadsheet(self, top=None, tile=None,
+                           wbpath=os.path.join(SCRIPTDIR, "output",
+                                               "MU Chart.xlsx")):
         """
         Export a matchup chart of the players.
 
         Write directly to a file named "MU Chart.xlsx."
+        Rows are streamed to the file one at a time, and only pairs of
+        players who have actually played each other are visited, so memory
+        use does not grow with the size of the chart.
 
         Args:
-            players:    list of Player objects
+            top (int): Only chart the top players of the (filtered) list
+            tile (int): Split the chart into sheets of at most tile by tile
+                        players each, for charts too big to open at once
+            wbpath (str): Path of the workbook to write
         """
-        wbpath = os.path.join(SCRIPTDIR, "output", "MU Chart.xlsx")
+        players = self.top(top) if top else self.ranked()
+        matrix = self.h2h_matrix()
+        # Column (and row) of each player in the full chart
+        position = {player.id: i for i, player in enumerate(players, 1)}
         # Create the directory if it doesn't exist already
-        dirpath = pathlib.Path(os.path.dirname(wbpath))
-        dirpath.mkdir(parents=True, exist_ok=True)
+        dirpath = os.path.dirname(wbpath)
+        if dirpath:
+            os.makedirs(dirpath, exist_ok=True)
         # Create the workbook
-        workbook = xlsxwriter.Workbook(wbpath)
-        worksheet = workbook.add_worksheet()
-        # Create an array for easy access to ratios, this will be changed later
-        # to be in-line
-        sortedPlayers = sorted(list(self.elolist),
-                               key=lambda x: x.elo, reverse=True)
-        # Dictionary, keys are names
-        #   Values are dictionaries, in which keys are opponent names
-        #       Values are tuples of (win, loss)
-        # i.e. h2h[player_name][opponent_name] = (wins, losses)
-        h2h = {}
-        # Loop through all players
-        numplayers = 0
-        for player in sortedPlayers:
-            ratios = {}
-            # Loop through each individual player's head-to-head records
-            for opponent in sortedPlayers:
-                if opponent in player.h2hwins:
-                    wins = len(player.h2hwins[opponent])
-                else:
-                    wins = 0
-                if opponent in player.h2hlosses:
-                    losses = len(player.h2hlosses[opponent])
-                else:
-                    losses = 0
-                ratios[opponent.name] = (wins, losses)
-            numplayers += 1
-            h2h[player.name] = ratios
+        import xlsxwriter
+        workbook = xlsxwriter.Workbook(wbpath, {"constant_memory": True})
         # Create color formats for the cells
         # TODO better gradients
         winning = workbook.add_format({"bg_color": "green"})
@@ -107,25 +452,43 @@ class EloList:
         tied = workbook.add_format({"bg_color": "yellow"})
         # ore wa kage
         againstSelf = workbook.add_format({"bg_color": "gray"})
-        # Write to the spreadsheet
-        for row in range(1, numplayers + 1):
-            player_name = sortedPlayers[row - 1].name
-            worksheet.write(row, 0, player_name)
-            worksheet.write(0, row, player_name)
-            for col in range(1, numplayers + 1):
-                opponent_name = sortedPlayers[col - 1].name
-                ratio = h2h[player_name][opponent_name]
-                stringratio = str(ratio[0]) + "-" + str(ratio[1])
-                if row == col:
-                    worksheet.write(row, col, "", againstSelf)
-                elif ratio[0] > ratio[1]:
-                    worksheet.write(row, col, str(stringratio), winning)
-                elif ratio[1] > ratio[0]:
-                    worksheet.write(row, col, str(stringratio), losing)
-                elif ratio[0] == 0 and ratio[1] == 0:
-                    pass
+        size = tile if tile else max(len(players), 1)
+        for rowstart in range(0, len(players), size):
+            rowplayers = players[rowstart:rowstart + size]
+            for colstart in range(0, len(players), size):
+                colplayers = players[colstart:colstart + size]
+                if tile:
+                    worksheet = workbook.add_worksheet("{}-{} v {}-{}".format(
+                        rowstart + 1, rowstart + len(rowplayers),
+                        colstart + 1, colstart + len(colplayers)))
                 else:
-                    worksheet.write(row, col, str(stringratio), tied)
+                    worksheet = workbook.add_worksheet()
+                # Rows have to be written in order, starting with the names
+                for col, opponent in enumerate(colplayers, 1):
+                    worksheet.write(0, col, opponent.name)
+                for row, player in enumerate(rowplayers, 1):
+                    worksheet.write(row, 0, player.name)
+                    cells = []
+                    for pid, wins, losses in matrix.row(player.id):
+                        col = position.get(pid, 0) - colstart
+                        if 0 < col <= len(colplayers) and pid != player.id:
+                            cells.append((col, wins, losses))
+                    if 0 < rowstart + row - colstart <= len(colplayers):
+                        cells.append((rowstart + row - colstart, None, None))
+                    cells.sort()
+                    for col, wins, losses in cells:
+                        if wins is None:
+                            worksheet.write(row, col, "", againstSelf)
+                            continue
+                        stringratio = str(wins) + "-" + str(losses)
+                        if wins > losses:
+                            worksheet.write(row, col, stringratio, winning)
+                        elif losses > wins:
+                            worksheet.write(row, col, stringratio, losing)
+                        else:
+                            worksheet.write(row, col, stringratio, tied)
+        if not players:
+            workbook.add_worksheet()
         workbook.close()
 
     def filter_by_games(self, minimum):
@@ -133,75 +496,46 @@ class EloList:
         Remove players with below a certain number of games.
 
         Args:
-            eloslist (list of Players): List to be filtered
             minimum (int): Minimum number of games players should have played
                            Anybody with fewer games is removed from the list
         """
-        toremove = []
-        for player in self.elolist:
-            if player.played < minimum:
-                toremove.append(player)
-        for player in toremove:
-            self.elolist.remove(player)
+        self.filter(("games", minimum))
 
     def filter_by_wins(self, wins):
         """
         Remove entries with less than a certain amount of wins.
 
         Args:
-            eloslist (list of Players): List to be filtered
             wins (int): Minimum number of wins to be left in the list
         """
-        toremove = []
-        for player in self.elolist:
-            if player.won < wins:
-                toremove.append(player)
-        for player in toremove:
-            self.elolist.remove(player)
+        self.filter(("wins", wins))
 
     def filter_by_rank(self, cutoff):
         """
         Remove entries beyond a certain rank.
 
         Args:
-            eloslist (list of Players): List to be filtered
             cutoff (int): Last rank to keep (e.g. 10 if you want to top 10)
         """
-        i = 0
-        for player in sorted(self.elolist, key=lambda x: x.elo, reverse=True):
-            if i >= cutoff:
-                self.elolist.remove(player)
-            i += 1
+        self.filter(("rank", cutoff))
 
     def filter_by_elo(self, elo):
         """
         Remove entries below a certain elo.
 
         Args:
-            eloslist (list of Players): List to be filtered
             elo (int): Minimum elo to be left in the list
         """
-        toremove = []
-        for player in self.elolist:
-            if player.elo < elo:
-                toremove.append(player)
-        for player in toremove:
-            self.elolist.remove(player)
+        self.filter(("elo", elo))
 
     def filter_by_tournaments(self, minimum):
         """
         Remove entries who have below a certain number of tournament entries.
 
         Args:
-            eloslist (list of Players): List to be filtered
             minimum (int): Minimum number of tournaments required to remain
         """
-        toremove = []
-        for player in self.elolist:
-            if len(player.placings) < minimum:
-                toremove.append(player)
-        for player in toremove:
-            self.elolist.remove(player)
+        self.filter(("tournaments", minimum))
 
     def filter_manually(self):
         """
@@ -213,12 +547,12 @@ class EloList:
         tempfilename = os.path.join("obj", ".elolisttempfile.txt")
         # Write names to a temp file
         with openFile(tempfilename, "w") as tempfile:
-            for player in sorted(self.elolist,
-                                 key=lambda x: x.elo, reverse=True):
+            for player in self.ranked():
                 tempfile.write(player.name + "\n")
         # Edit the file
         editor = os.environ.get("EDITOR")
         if editor is not None:
+            import subprocess
             subprocess.call([editor, tempfilename])
         else:
             return
@@ -236,34 +570,81 @@ class EloList:
         Write the elos to a file in a human-readable format.
 
         By default, this is saved to output/elos.txt.
+        Lines are streamed to the file; if the name ends in .gz,
+        the file is gzip compressed.
         """
         outputfilepath = os.path.join(SCRIPTDIR, outputfile)
         with openFile(outputfilepath, "w") as f:
-            f.write(str(self))
+            f.writelines(self.iter_lines())
 
-    def save(self, playersfile=os.path.join("output", "players.pkl")):
+    def save(self, playersfile=os.path.join("output", "players.pkl"),
+             matrixfile=os.path.join("output", "h2h.bin"),
+             historyfile=os.path.join("output", "history.bin"),
+             snapshotfile=os.path.join("output", "snapshot.bin")):
         """
         Save the elos (Player data) to a pickle encoded file.
 
         This can be loaded in for future invocations (e.g. filtering).
+        The head-to-head matrix is saved next to it, and so is the rating
+        history if it was recorded. So is a snapshot that read-only
+        commands can open without loading everything, see snapshot.py.
         """
         # Pickle file
         playersfilepath = os.path.join(SCRIPTDIR, playersfile)
         with openFile(playersfilepath, "wb") as f:
             pickle.dump(self.elolist,
                         f, pickle.HIGHEST_PROTOCOL)
-
-    def load(self, playersfile=os.path.join("output", "players.pkl")):
+        self.h2h_matrix().save(os.path.join(SCRIPTDIR, matrixfile))
+        historyfilepath = os.path.join(SCRIPTDIR, historyfile)
+        if self.history is not None:
+            self.history.save(historyfilepath)
+        elif os.path.exists(historyfilepath):
+            # Don't leave a history of some other run next to these players
+            os.remove(historyfilepath)
+        import snapshot
+        snapshot.write(self, snapshotfile)
+
+    def load(self, playersfile=os.path.join("output", "players.pkl"),
+             matrixfile=os.path.join("output", "h2h.bin"),
+             historyfile=os.path.join("output", "history.bin")):
         """
         Read player data from a file.
 
         This should be the file that was saved by elo_list.save().
+        The head-to-head matrix and rating history are read too if they
+        were saved. The matrix is only used if it was built from these
+        players, otherwise it is built again when needed.
+
+        Raises:
+            ValueError: if the players were saved by an older version,
+                        whose players cannot be read any more
         """
         players_list = []
         playersfilepath = os.path.join(SCRIPTDIR, playersfile)
         with openFile(playersfilepath, "rb") as f:
-            players_list = pickle.load(f)
+            try:
+                players_list = pickle.load(f)
+            except AttributeError:
+                # Players saved before they had __slots__ keep their
+                # fields in a __dict__, which current players don't have
+                raise ValueError(playersfilepath + " was saved by an older"
+                                 " version, run calculate_elos.py again to"
+                                 " regenerate players.pkl") from None
         self.elolist = players_list
+        matrixfilepath = os.path.join(SCRIPTDIR, matrixfile)
+        roster = self.roster()
+        if os.path.exists(matrixfilepath):
+            matrix = H2HMatrix.load(matrixfilepath)
+            if matrix.size == len(roster) \
+                    and matrix.roster == roster_hash(roster):
+                self._matrix = matrix
+                self._matrixroster = roster
+        historyfilepath = os.path.join(SCRIPTDIR, historyfile)
+        self.history = None
+        if os.path.exists(historyfilepath):
+            history = RatingHistory.load(historyfilepath)
+            if len(history) == len(roster):
+                self.history = history
 
     def summarize(self):
         """
@@ -271,8 +652,7 @@ class EloList:
 
         This summary includes information such as rank, elo, and W/L ratio.
         """
-        for player in sorted(self.elolist,
-                             key=lambda x: x.elo, reverse=True):
+        for player in self.ranked():
             print(player.summary())
 
     def save_summaries(self, filepath=os.path.join("output", "summaries.txt")):
@@ -280,11 +660,13 @@ class EloList:
         Save summaries of the players.
 
         This summary includes information such as rank, elo, and W/L ratio.
+        Summaries are streamed to the file; if the name ends in .gz,
+        the file is gzip compressed.
         """
         with openFile(filepath, "w") as f:
-            for player in sorted(self.elolist,
-                                 key=lambda x: x.elo, reverse=True):
-                f.write(player.summary() + "\n")
+            for player in self.ranked():
+                f.writelines(player.iter_summary())
+                f.write("\n")
 
     def __str__(self):
         """
@@ -292,20 +674,35 @@ class EloList:
 
         Information listed is according to str(Player).
         """
-        this = "    NAME                  ELO    W    G     W/G     AVG\n"
+        return "".join(self.iter_lines())
+
+    def iter_lines(self):
+        """
+        Generate the lines of str(self) one at a time.
+        """
+        yield "    NAME                  ELO    W    G     W/G     AVG\n"
         rank = 1
-        for player in sorted(self.elolist,
-                             key=lambda x: x.elo, reverse=True):
-            this += "{:>3d}".format(rank) + " " + str(player) + "\n"
+        for player in self.ranked():
+            yield "{:>3d}".format(rank) + " " + str(player) + "\n"
             rank += 1
-        return this
 
 
-def openFile(filepath, mode):
-    dirpath = pathlib.Path(os.path.dirname(filepath))
-    dirpath.mkdir(parents=True, exist_ok=True)
+def openFile(filepath, mode, buffering=BUFFERSIZE):
+    """
+    Open a file, creating its directory first if needed.
+
+    Text files get DOS-style line endings. Files whose name ends in .gz
+    are gzip compressed.
+    """
+    dirpath = os.path.dirname(filepath)
+    if dirpath:
+        os.makedirs(dirpath, exist_ok=True)
+    if filepath.endswith(".gz"):
+        if 'b' not in mode:
+            return gzip.open(filepath, mode + 't', newline='\r\n')
+        return gzip.open(filepath, mode)
     # DOS-style line endings for non-binary files
     if 'b' not in mode:
-        return open(filepath, mode, newline='\r\n')
-    return open(filepath, mode)
+        return open(filepath, mode, buffering, newline='\r\n')
+    return open(filepath, mode, buffering)
 
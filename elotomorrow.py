@@ -1,65 +1,349 @@
-from calculate_elos import *
+#!/usr/bin/python3
+"""
+Work out how elos would change after hypothetical sets.
+
+Hypothetical results are applied to a RatingOverlay, which copies the rating
+of a player the first time they appear in a result and never changes the
+Player objects themselves. Results are replayed with array_engine.replay, so
+the arithmetic is exactly that of Player.calculateWin followed by
+Player.calculateLoss.
+
+Many scenarios are replayed together if numpy is installed, as arrays with
+one rating for each player in each scenario: the first sets of every
+scenario are applied at once, then the second sets, and so on. Scores are
+weighted the same way and the arithmetic is the same element by element,
+so the deltas are those of replaying the scenarios one by one, to within
+rounding (numpy's powers can differ from Python's in the last bit).
+
+Usage: elotomorrow.py [resultsfile ...]
+
+Without arguments, asks for one set at a time. Each results file describes
+one scenario, e.g. a whole hypothetical bracket, with one set per line in
+the form "winner,loser,score", applied in order.
+"""
+
+import sys
+import os
+from array import array
+from player import Player, SCOREWEIGHTS, classify_score
+from array_engine import EncodedMatches, replay
+from snapshot import SCRIPTDIR, open_players
+import name_resolver
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class RatingOverlay:
+    """
+    Ratings of the players taking part in hypothetical sets.
+
+    Players are looked up and copied in on first use. Names that are not
+    found are resolved with name_resolver and start at Player.DEFAULT_ELO,
+    like a new player would.
+
+    Fields include:
+    names           list of str (name of each player in the overlay)
+    before          array of float (elo of each player before any results)
+    elos            array of float (elo of each player so far)
+    won             array of int (hypothetical sets won)
+    played          array of int (hypothetical sets played)
+    """
+
+    def __init__(self, lookup):
+        """
+        Args:
+            lookup (function): Returns the Player with a name, or None,
+                               e.g. EloList.player
+        """
+        self.lookup = lookup
+        self.names = []
+        self.index = {}
+        self.before = array("d")
+        self.elos = array("d")
+        self.won = array("l")
+        self.played = array("l")
+        self.kconsts = array("d")
+
+    def add(self, name):
+        """
+        Return the index of a player, copying them in if needed.
+        """
+        player = self.lookup(name)
+        if player is None:
+            player = Player(name_resolver.resolve(name))
+        if player.name in self.index:
+            return self.index[player.name]
+        self.index[player.name] = len(self.names)
+        self.names.append(player.name)
+        self.before.append(player.elo)
+        self.elos.append(player.elo)
+        self.won.append(0)
+        self.played.append(0)
+        self.kconsts.append(player.kconst())
+        return self.index[player.name]
+
+    def apply(self, results):
+        """
+        Apply hypothetical sets in order.
+
+        Sets with a score that would not be counted by
+        Player.calculateWin are skipped the same way.
+
+        Args:
+            results (iterable): (winner name, loser name, score) tuples
+        """
+        replay(self.elos, self.won, self.played, self.kconsts,
+               self.encode(results))
+
+    def encode(self, results):
+        """
+        Encode hypothetical sets, copying their players in, without
+        applying them.
+
+        Returns:
+            EncodedMatches: with indices in the overlay as players
+        """
+        encoded = EncodedMatches()
+        for winner, loser, score in results:
+            encoded.winners.append(self.add(winner))
+            encoded.losers.append(self.add(loser))
+            weights = classify_score(score)
+            if weights is None:
+                encoded.winresults.append(0)
+                encoded.lossresults.append(0)
+                encoded.valid.append(0)
+            else:
+                encoded.winresults.append(weights[0])
+                encoded.lossresults.append(weights[1])
+                encoded.valid.append(1)
+        return encoded
+
+    def elo(self, name):
+        """
+        Return a player's elo after the results applied so far.
+
+        Names are resolved the same way as in the results, so an alias
+        gives the elo of the player it belongs to.
+
+        Raises:
+            KeyError: if the player is neither in the overlay nor found
+        """
+        player = self.lookup(name)
+        key = name_resolver.resolve(name) if player is None else player.name
+        if key in self.index:
+            return self.elos[self.index[key]]
+        if player is None:
+            raise KeyError("Unknown player: " + name)
+        return player.elo
+
+    def deltas(self):
+        """
+        Return the change in elo of every player in the overlay.
+
+        Returns:
+            dict: name to change in elo
+        """
+        return {name: after - before for name, before, after
+                in zip(self.names, self.before, self.elos)}
+
+
+def simulate(elolist, results):
+    """
+    Apply one scenario of hypothetical sets to an EloList.
+
+    Args:
+        elolist (EloList or Snapshot): Players to start from, unchanged
+        results (iterable): (winner name, loser name, score) tuples
+
+    Returns:
+        dict: name to change in elo, for every player in results
+    """
+    overlay = RatingOverlay(elolist.player)
+    overlay.apply(results)
+    return overlay.deltas()
+
+
+def simulate_many(elolist, scenarios):
+    """
+    Apply many independent scenarios of hypothetical sets to an EloList.
+
+    Each scenario starts from the ratings in the list, not from the end of
+    the previous one. Players are only looked up once across all of them.
+    With numpy, scenarios are replayed together as arrays (see
+    _replay_arrays), which need about 33 bytes for every set, shorter
+    scenarios being padded to the longest, and 40 for every player of every
+    scenario; otherwise one after the other.
+
+    Args:
+        elolist (EloList or Snapshot): Players to start from, unchanged
+        scenarios (iterable of lists): results for each scenario
+
+    Returns:
+        list of dicts: name to change in elo, for each scenario
+    """
+    players = {}
+
+    def lookup(name):
+        if name not in players:
+            players[name] = elolist.player(name)
+        return players[name]
+
+    if numpy is not None:
+        overlay = RatingOverlay(lookup)
+        return _replay_arrays(overlay, [overlay.encode(results)
+                                        for results in scenarios])
+    deltas = []
+    for results in scenarios:
+        overlay = RatingOverlay(lookup)
+        overlay.apply(results)
+        deltas.append(overlay.deltas())
+    return deltas
+
+
+def _replay_arrays(overlay, scenarios):
+    """
+    Replay encoded scenarios together, as numpy arrays.
+
+    The n-th sets of every scenario are applied at once, with the same
+    arithmetic as array_engine.replay. Each step is one set per scenario,
+    so the time mostly depends on the length of the longest scenario.
+    Every scenario only has a rating for the players in it, all of them
+    kept in one flat array.
+
+    Args:
+        overlay (RatingOverlay): every player of every scenario, with the
+                                 ratings they start from
+        scenarios (list of EncodedMatches): sets of each scenario
+
+    Returns:
+        list of dicts: name to change in elo, for each scenario
+    """
+    np = numpy
+    count = len(scenarios)
+    longest = max((len(encoded) for encoded in scenarios), default=0)
+    # Sets by scenario and position in it, shorter scenarios padded with
+    # sets that are not counted. Players are given as slots in the flat
+    # array of ratings.
+    winners = np.zeros((count, longest), dtype=np.intp)
+    losers = np.zeros((count, longest), dtype=np.intp)
+    winresults = np.zeros((count, longest))
+    lossresults = np.zeros((count, longest))
+    valid = np.zeros((count, longest), dtype=bool)
+    # Player in each slot, the players of each scenario in the order they
+    # first appear in it, as in the overlay
+    players = array("l")
+    starts = [0]
+    for row, encoded in enumerate(scenarios):
+        slots = {}
+        for pid in (pid for pair in zip(encoded.winners, encoded.losers)
+                    for pid in pair):
+            if pid not in slots:
+                slots[pid] = len(players)
+                players.append(pid)
+        starts.append(len(players))
+        size = len(encoded)
+        winners[row, :size] = [slots[pid] for pid in encoded.winners]
+        losers[row, :size] = [slots[pid] for pid in encoded.losers]
+        winresults[row, :size] = encoded.winresults
+        lossresults[row, :size] = encoded.lossresults
+        valid[row, :size] = encoded.valid
+    players = np.asarray(players, dtype=np.intp)
+    before = np.asarray(overlay.before)[players]
+    kconsts = np.asarray(overlay.kconsts)[players]
+    elos = before.copy()
+    for n in range(longest):
+        rows = np.flatnonzero(valid[:, n])
+        w = winners[rows, n]
+        l = losers[rows, n]
+        elo = elos[w]
+        R1 = 10**(elo/400)
+        R2 = 10**(elos[l]/400)
+        elo = elo + kconsts[w]*(winresults[rows, n] - R1/(R1+R2))
+        elos[w] = elo
+        # The loser's expectation uses the winner's updated elo, and a
+        # player playing themselves sees their own updated elo
+        R1 = 10**(elo/400)
+        elo = elos[l]
+        R2 = 10**(elo/400)
+        elos[l] = elo + kconsts[l]*(lossresults[rows, n] - R2/(R1+R2))
+    deltas = []
+    for start, stop in zip(starts, starts[1:]):
+        deltas.append({overlay.names[pid]: float(elos[slot] - before[slot])
+                       for slot, pid in zip(range(start, stop),
+                                            players[start:stop].tolist())})
+    return deltas
+
 
 def eloTomorrow(winner, loser, set):
     """
     Calculates elo changes if any two players play a set.
     :Player param winner: winner of the hypothetical set
     :Player param loser: loser of the hypothetical set
-    :str param set: 3-0, 3-1, 3-2, 2-1, or 2-0, game win count.
+    :str param set: set score, e.g. 2-0, 2-1, 3-0, 3-1 or 3-2
     :tuple return: hypothetical updated elo's of (winner, loser). Nothing is saved in the player object.
     """
-    p1elo = winner.elo
-    p2elo = loser.elo
-    k=32
-    R1 = 10**(winner.elo/400)
-    R2 = 10**(loser.elo/400)
-    winE1 = R1/(R1+R2)
-    loseE1 = R2/(R1+R2)
-    winresult = 1.25
-    loseresult = 0
-    if set in ["2-0", "3-1"]:
-        winresult = 1.25
-        loseresult = 0
-    elif set in ["2-1", "3-2"]:
-        winresult = 1
-        loseresult = .33
-    elif set in ["3-0"]:
-        winresult = 1.5
-        loseresult = -.25
-    p1elo = p1elo + k*(winresult-winE1)
-    p2elo = p2elo + k*(loseresult-loseE1)
-
-    return p1elo, p2elo
+    players = {winner.name: winner, loser.name: loser}
+    overlay = RatingOverlay(players.get)
+    overlay.apply([(winner.name, loser.name, set)])
+    return overlay.elo(winner.name), overlay.elo(loser.name)
+
+
+def read_results(resultsfile):
+    """
+    Read a scenario from a file with one "winner,loser,score" per line.
+    """
+    results = []
+    with open(resultsfile) as f:
+        for line in f:
+            if line.strip():
+                winner, loser, score = (x.strip() for x in line.split(","))
+                results.append((winner, loser, score))
+    return results
+
 
 if __name__ == "__main__":
-    for tourney in tourneys:
-        parse_tourney(tourney)
-    save_elos()
+    if not os.path.exists(os.path.join(SCRIPTDIR, "output", "players.pkl")):
+        print("Error: output/players.pkl not found, run calculate_elos.py")
+        sys.exit(1)
+    elos = open_players()
+    if sys.argv[1:]:
+        scenarios = [read_results(path) for path in sys.argv[1:]]
+        for path, deltas in zip(sys.argv[1:],
+                                simulate_many(elos, scenarios)):
+            print(path + ":")
+            for name, delta in sorted(deltas.items(), key=lambda x: -x[1]):
+                print("{:20s} {:+5.0f}".format(name, delta))
+            print()
+        sys.exit()
     while True:
         while True:
             p1 = input("Enter winner: ")
             p1 = p1.upper()
-            if p1 not in players_by_name:
+            if elos.player(p1) is None:
                 print("Error: " + p1 + " not found.")
                 print()
                 break
             p2 = input("Enter loser: ")
             p2 = p2.upper()
-            if p2 not in players_by_name:
+            if elos.player(p2) is None:
                 print("Error: " + p2 + " not found.")
                 print()
                 break
             set = input("Enter set result: ")
-            if set not in ["2-0", "3-1", "2-1", "3-2", "3-0"]:
+            if set not in SCOREWEIGHTS:
                 print("Error: " + set + " is invalid.")
                 print()
                 break
 
-            new_elo = eloTomorrow(players_by_name[p1], players_by_name[p2], set)
+            winner = elos.player(p1)
+            loser = elos.player(p2)
+            new_elo = eloTomorrow(winner, loser, set)
             print()
-            print(p1 + "'s elo was " + "{:0>4.0f}".format(players_by_name[p1].elo) + ", and would be: " + \
+            print(p1 + "'s elo was " + "{:0>4.0f}".format(winner.elo) + ", and would be: " + \
                   "{:0>4.0f}".format(new_elo[0]))
-            print(p2 + "'s elo was " + "{:0>4.0f}".format(players_by_name[p2].elo) + ", and would be: " + \
+            print(p2 + "'s elo was " + "{:0>4.0f}".format(loser.elo) + ", and would be: " + \
                   "{:0>4.0f}".format(new_elo[1]))
             print()
-
@@ -0,0 +1,456 @@
+"""
+Rate players with Glicko-2, one tournament being one rating period.
+
+Unlike Elo, every player also has a rating deviation (how unsure the rating
+is) and a volatility (how much it is expected to move). New players start
+with a large deviation, so their first results move them quickly, and the
+deviation of players who sit out grows with every rating period they miss,
+so returning players move quickly too. See Glickman, "Example of the
+Glicko-2 system".
+
+All matches of a period are rated against the ratings from before it, so
+the whole period is updated at once. If numpy is installed, each period is
+computed as arrays with one entry per set and per player in it, together
+with the periods right after it that share none of its players; otherwise
+players are updated one at a time, which gives the same ratings to within
+rounding but is slower.
+
+Ratings are kept in Player.elo, on the same scale as Elo ratings, so
+everything that reads players works unchanged. Deviations and volatilities
+are kept in a GlickoState, indexed by Player.id. Sets are classified with
+classify_score, exactly like the Elo engines: the winner and loser results
+it gives are used as the score of each player, and sets it doesn't
+recognize are not counted.
+"""
+
+import math
+from array import array
+from bisect import bisect_left
+from player import Player
+from rating_history import to_time
+import array_engine
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Constrains how much volatilities change, between 0.3 and 1.2
+TAU = 0.5
+# Deviation of players who have never played, in rating points; the
+# deviation of players who sit out never grows past it
+DEFAULT_DEVIATION = 350
+# Volatility of players who have never played
+DEFAULT_VOLATILITY = 0.06
+# Rating points per unit of the Glicko-2 scale
+SCALE = 400 / math.log(10)
+# Volatilities are solved for to within this
+EPSILON = 1e-6
+
+
+class GlickoState:
+    """
+    Deviation and volatility of every player, on the Glicko-2 scale.
+
+    Fields include:
+    deviations      array of float (deviation of each player, by id, after
+                    the last period they played in)
+    volatilities    array of float (volatility of each player, by id)
+    last            array of int (last period each player played in, or
+                    the period before they were first seen)
+    periods         int (number of rating periods so far)
+    """
+
+    def __init__(self):
+        self.deviations = array("d")
+        self.volatilities = array("d")
+        self.last = array("q")
+        self.periods = 0
+
+    def __len__(self):
+        return len(self.deviations)
+
+    def resize(self, size):
+        """
+        Make room for players with ids up to size - 1, as new players.
+        """
+        while len(self.deviations) < size:
+            self.deviations.append(DEFAULT_DEVIATION / SCALE)
+            self.volatilities.append(DEFAULT_VOLATILITY)
+            self.last.append(self.periods - 1)
+
+    def current(self, pid, period=None):
+        """
+        Return a player's deviation at the start of a period.
+
+        The deviation grows by the player's volatility for every period
+        they sat out since they last played, up to DEFAULT_DEVIATION.
+
+        Args:
+            pid (int): Id of the player
+            period (int): Period, default the next one
+
+        Returns:
+            float: Deviation on the Glicko-2 scale
+        """
+        if period is None:
+            period = self.periods
+        missed = period - 1 - self.last[pid]
+        return min(math.sqrt(self.deviations[pid]**2
+                             + missed * self.volatilities[pid]**2),
+                   DEFAULT_DEVIATION / SCALE)
+
+    def deviation(self, pid):
+        """
+        Return a player's current rating deviation, in rating points.
+        """
+        if pid >= len(self):
+            return float(DEFAULT_DEVIATION)
+        return self.current(pid) * SCALE
+
+
+def _volatility(sigma, phi, v, delta):
+    """
+    Solve for a player's new volatility (step 5 of Glicko-2).
+    """
+    a = math.log(sigma**2)
+
+    def f(x):
+        ex = math.exp(x)
+        return ex * (delta**2 - phi**2 - v - ex) \
+            / (2 * (phi**2 + v + ex)**2) - (x - a) / TAU**2
+
+    A = a
+    if delta**2 > phi**2 + v:
+        B = math.log(delta**2 - phi**2 - v)
+    else:
+        k = 1
+        while f(a - k * TAU) < 0:
+            k += 1
+        B = a - k * TAU
+    fA = f(A)
+    fB = f(B)
+    while abs(B - A) > EPSILON:
+        C = A + (A - B) * fA / (fB - fA)
+        fC = f(C)
+        if fC * fB <= 0:
+            A = B
+            fA = fB
+        else:
+            fA = fA / 2
+        B = C
+        fB = fC
+    return math.exp(A / 2)
+
+
+def _rate_period(mus, phis, sigmas, winners, losers, winresults,
+                 lossresults):
+    """
+    Rate one period, one player at a time.
+
+    Args:
+        mus, phis, sigmas (dicts): rating, deviation at the start of the
+                                   period, and volatility of each index
+                                   in the period
+        winners, losers (lists of int): indices of the players of each set
+        winresults, lossresults (lists of float): their scores
+
+    Returns:
+        dict: index to (rating, deviation, volatility) after the period
+    """
+    vinverse = dict.fromkeys(mus, 0.0)
+    totals = dict.fromkeys(mus, 0.0)
+    gs = {i: 1 / math.sqrt(1 + 3 * phi**2 / math.pi**2)
+          for i, phi in phis.items()}
+    sides = ((winners, losers, winresults), (losers, winners, lossresults))
+    for players, opponents, results in sides:
+        for i, j, score in zip(players, opponents, results):
+            g = gs[j]
+            E = 1 / (1 + math.exp(-g * (mus[i] - mus[j])))
+            vinverse[i] += g * g * E * (1 - E)
+            totals[i] += g * (score - E)
+    rated = {}
+    for i, mu in mus.items():
+        v = 1 / vinverse[i]
+        sigma = _volatility(sigmas[i], phis[i], v, v * totals[i])
+        phi = 1 / math.sqrt(1 / (phis[i]**2 + sigma**2) + 1 / v)
+        rated[i] = (mu + phi**2 * totals[i], phi, sigma)
+    return rated
+
+
+def _rate_period_arrays(mus, phis, sigmas, winners, losers, winresults,
+                        lossresults):
+    """
+    Rate one period as numpy arrays, with one entry per player and per set.
+
+    Same as _rate_period, except mus, phis and sigmas are arrays with one
+    entry per player in the period, winners and losers index into them,
+    and the new ratings, deviations and volatilities are returned as three
+    arrays in the same order.
+    """
+    np = numpy
+    g = 1 / np.sqrt(1 + 3 * phis**2 / np.pi**2)
+    # Every set once from the winner's side, then once from the loser's
+    players = np.concatenate((winners, losers))
+    opponents = np.concatenate((losers, winners))
+    scores = np.concatenate((winresults, lossresults))
+    gj = g[opponents]
+    E = 1 / (1 + np.exp(-gj * (mus[players] - mus[opponents])))
+    count = len(mus)
+    v = 1 / np.bincount(players, gj * gj * E * (1 - E), count)
+    totals = np.bincount(players, gj * (scores - E), count)
+    delta = v * totals
+    # Step 5, for every player at once; players whose volatility has been
+    # found to within EPSILON are left alone
+    a = np.log(sigmas**2)
+    phi2 = phis**2
+
+    def f(x, rows=slice(None)):
+        ex = np.exp(x)
+        return ex * (delta[rows]**2 - phi2[rows] - v[rows] - ex) \
+            / (2 * (phi2[rows] + v[rows] + ex)**2) - (x - a[rows]) / TAU**2
+
+    A = a.copy()
+    B = np.empty(count)
+    high = delta**2 > phi2 + v
+    B[high] = np.log(delta[high]**2 - phi2[high] - v[high])
+    low = np.flatnonzero(~high)
+    k = 1
+    while len(low):
+        B[low] = a[low] - k * TAU
+        low = low[f(B[low], low) < 0]
+        k += 1
+    fA = f(A)
+    fB = f(B)
+    rows = np.flatnonzero(np.abs(B - A) > EPSILON)
+    while len(rows):
+        C = A[rows] + (A[rows] - B[rows]) * fA[rows] / (fB[rows] - fA[rows])
+        fC = f(C, rows)
+        swap = fC * fB[rows] <= 0
+        A[rows] = np.where(swap, B[rows], A[rows])
+        fA[rows] = np.where(swap, fB[rows], fA[rows] / 2)
+        B[rows] = C
+        fB[rows] = fC
+        rows = rows[np.abs(B[rows] - A[rows]) > EPSILON]
+    sigmas = np.exp(A / 2)
+    phis = 1 / np.sqrt(1 / (phi2 + sigmas**2) + 1 / v)
+    return mus + phis**2 * totals, phis, sigmas
+
+
+def replay_matches(players_by_name, names_by_id, all_matches, state,
+                   history=None, start=0):
+    """
+    Rate matches grouped by tournament onto a dictionary of players.
+
+    Every tournament with at least one counted set is a rating period.
+    Win/play counts and head-to-head records are updated exactly as the
+    Elo engines would; elos are replaced by Glicko-2 ratings.
+
+    Args:
+        state (GlickoState): deviations and volatilities, updated in place
+        history (RatingHistory): if given, the new rating of everyone in
+                                 each period is recorded at the time of its
+                                 last set
+        start (int): index of the first match, for the history
+
+    Returns:
+        EncodedMatches: the matches that were replayed; total is the number
+                        read, including those without a winner
+    """
+    players = [None] * (max((player.id for player
+                             in players_by_name.values()), default=-1) + 1)
+    for player in players_by_name.values():
+        players[player.id] = player
+    index_by_name = {name: player.id
+                     for name, player in players_by_name.items()}
+    encoded = array_engine.encode(all_matches, names_by_id, index_by_name)
+    elos = array("d", [player.elo if player is not None else 0.0
+                       for player in players])
+    rate(elos, state, encoded, periods(all_matches, encoded), history,
+         start)
+    for player, elo in zip(players, elos):
+        if player is not None:
+            player.elo = elo
+    for n, (w, l, valid) in enumerate(zip(encoded.winners, encoded.losers,
+                                          encoded.valid)):
+        if not valid:
+            continue
+        winner = players[w]
+        loser = players[l]
+        winner.won += 1
+        winner.played += 1
+        loser.played += 1
+        ref = encoded.ref(n)
+        if loser.id not in winner.h2hwins:
+            winner.h2hwins[loser.id] = []
+        winner.h2hwins[loser.id].append(ref)
+        if winner.id not in loser.h2hlosses:
+            loser.h2hlosses[winner.id] = []
+        loser.h2hlosses[winner.id].append(ref)
+    return encoded
+
+
+def periods(all_matches, encoded):
+    """
+    Return where each tournament's sets start in encoded, and where the
+    last one ends.
+
+    Args:
+        all_matches (list of lists): matches grouped by tournament
+        encoded (EncodedMatches): the same matches, encoded
+    """
+    bounds = [0]
+    total = 0
+    for tournament in all_matches:
+        total += len(tournament)
+        bounds.append(bisect_left(encoded.positions, total))
+    return bounds
+
+
+def rate(elos, state, encoded, bounds, history=None, start=0):
+    """
+    Rate encoded matches one period at a time.
+
+    Counterpart of array_engine.replay. Periods without any counted set
+    are skipped.
+
+    Args:
+        elos (array of float): rating of each player, by id, updated in
+                               place
+        state (GlickoState): deviations and volatilities, updated in place
+        encoded (EncodedMatches): matches to rate, with ids as indices
+        bounds (list of int): where each period starts in encoded, and
+                              where the last one ends, see periods()
+        history (RatingHistory): if given, new ratings are recorded
+        start (int): index of the first match, for the history
+    """
+    state.resize(len(elos))
+    if numpy is not None:
+        _rate_arrays(elos, state, encoded, bounds, history, start)
+        return
+    for begin, end in zip(bounds, bounds[1:]):
+        counted = [n for n in range(begin, end) if encoded.valid[n]]
+        if not counted:
+            continue
+        _rate(elos, state, encoded, counted)
+        if history is not None:
+            _record(elos, history, encoded, counted, start)
+
+
+def _rate(elos, state, encoded, counted):
+    """
+    Rate one period, given the indices in encoded of its counted sets.
+    """
+    period = state.periods
+    winners = [encoded.winners[n] for n in counted]
+    losers = [encoded.losers[n] for n in counted]
+    ids = list(dict.fromkeys(winners + losers))
+    rated = _rate_period(
+        {pid: (elos[pid] - Player.DEFAULT_ELO) / SCALE for pid in ids},
+        {pid: state.current(pid, period) for pid in ids},
+        {pid: state.volatilities[pid] for pid in ids}, winners, losers,
+        [encoded.winresults[n] for n in counted],
+        [encoded.lossresults[n] for n in counted])
+    for pid, (mu, phi, sigma) in rated.items():
+        elos[pid] = Player.DEFAULT_ELO + mu * SCALE
+        state.deviations[pid] = phi
+        state.volatilities[pid] = sigma
+        state.last[pid] = period
+    state.periods += 1
+
+
+def _rate_arrays(elos, state, encoded, bounds, history, start):
+    """
+    Rate every period with numpy, given the bounds of each in encoded.
+
+    A player's new rating only depends on the ratings from before the
+    period of everyone in it, so consecutive periods that share no players
+    give the same ratings whether they are rated one after the other or
+    together. Such runs of periods are rated as one batch, which saves
+    numpy's overhead when tournaments are small and far apart (e.g. in
+    different regions).
+
+    Players' ratings and state are read and written through numpy views
+    of the arrays, so only the players in a batch are touched.
+    """
+    np = numpy
+    views = (np.frombuffer(elos), np.frombuffer(state.deviations),
+             np.frombuffer(state.volatilities),
+             np.frombuffer(state.last, dtype=np.int64))
+    sets = tuple(np.frombuffer(column, dtype=column.typecode)
+                 for column in (encoded.winners, encoded.losers,
+                                encoded.winresults, encoded.lossresults))
+    winners, losers = sets[:2]
+    valid = np.frombuffer(encoded.valid, dtype=np.int8)
+    # Batch each player was last seen in
+    seen = np.full(len(elos), -1, dtype=np.int64)
+    # Counted sets of each period of the current batch
+    batch = []
+    for begin, end in zip(bounds, bounds[1:]):
+        counted = np.flatnonzero(valid[begin:end]) + begin
+        if not len(counted):
+            continue
+        ids = np.concatenate((winners[counted], losers[counted]))
+        if batch and (seen[ids] == state.periods).any():
+            _rate_batch(views, state, sets, batch, history, encoded, start)
+            batch = []
+        # Batches are numbered by their first period
+        seen[ids] = state.periods
+        batch.append(counted)
+    if batch:
+        _rate_batch(views, state, sets, batch, history, encoded, start)
+
+
+def _rate_batch(views, state, sets, batch, history, encoded, start):
+    """
+    Rate consecutive periods that share no players together.
+    """
+    np = numpy
+    ratings, deviations, volatilities, last = views
+    winners, losers, winresults, lossresults = sets
+    counted = np.concatenate(batch)
+    setperiods = np.repeat(
+        np.arange(state.periods, state.periods + len(batch)),
+        [len(periodsets) for periodsets in batch])
+    # Everyone in the batch, and the column of each side of every set
+    ids, columns = np.unique(np.concatenate((winners[counted],
+                                             losers[counted])),
+                             return_inverse=True)
+    periods = np.empty(len(ids), dtype=np.int64)
+    periods[columns] = np.concatenate((setperiods, setperiods))
+    missed = periods - 1 - last[ids]
+    phis = np.minimum(np.sqrt(deviations[ids]**2
+                              + missed * volatilities[ids]**2),
+                      DEFAULT_DEVIATION / SCALE)
+    mus, phis, sigmas = _rate_period_arrays(
+        (ratings[ids] - Player.DEFAULT_ELO) / SCALE, phis, volatilities[ids],
+        columns[:len(counted)], columns[len(counted):], winresults[counted],
+        lossresults[counted])
+    ratings[ids] = Player.DEFAULT_ELO + mus * SCALE
+    deviations[ids] = phis
+    volatilities[ids] = sigmas
+    last[ids] = periods
+    state.periods += len(batch)
+    if history is not None:
+        for periodsets in batch:
+            _record(ratings, history, encoded, periodsets.tolist(), start)
+
+
+def _record(elos, history, encoded, counted, start):
+    """
+    Record the new rating of everyone in a period, at its last set.
+    """
+    when = math.nan
+    for n in reversed(counted):
+        when = to_time(encoded.started(n))
+        if not math.isnan(when):
+            break
+    if math.isnan(when):
+        when = history.last
+    else:
+        history.last = when
+    match = start + encoded.positions[counted[-1]]
+    ids = [encoded.winners[n] for n in counted] \
+        + [encoded.losers[n] for n in counted]
+    for pid in dict.fromkeys(ids):
+        history.record(pid, when, match, elos[pid])
@@ -0,0 +1,273 @@
+"""
+Provides a sparse matrix of head-to-head records between players.
+
+Rows and columns are Player ids. Only pairs of players that have played each
+other are stored, in compressed sparse row form: the opponents of player i
+are indices[indptr[i]:indptr[i + 1]], sorted by id, with the matching set
+counts in wins and losses.
+
+A hash of the roster the matrix was built from is saved with it, so a matrix
+left next to some other players file is not used for them.
+"""
+
+import os
+import struct
+import hashlib
+from array import array
+from bisect import bisect_left
+
+MAGIC = b"CEH2H002"
+# Written before roster hashes were saved
+OLDMAGIC = b"CEH2H001"
+# magic, number of players, number of stored pairs, roster hash
+HEADER = struct.Struct("<8sqq32s")
+OLDHEADER = struct.Struct("<8sqq")
+
+
+def roster_hash(roster):
+    """
+    Return a sha256 digest of every player's id, name and set counts.
+
+    Args:
+        roster (list of Players): Every player, indexed by Player.id
+    """
+    digest = hashlib.sha256()
+    for player in roster:
+        digest.update("{}\t{}\t{}\t{}\n".format(
+            player.id, player.name, player.won, player.played)
+            .encode("utf-8"))
+    return digest.digest()
+
+
+def read_roster(matrixfile):
+    """
+    Return the roster hash saved with a matrix, without reading the matrix.
+
+    Returns:
+        bytes: roster_hash() of the players, or None if the matrix was
+               saved without one
+    """
+    with open(matrixfile, "rb") as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size or header[:len(MAGIC)] != MAGIC:
+        return None
+    roster = HEADER.unpack(header)[3]
+    return roster if any(roster) else None
+
+
+class H2HMatrix:
+    """
+    Head-to-head win and loss counts for every pair of players.
+
+    Fields include:
+    size            int (number of players, i.e. rows)
+    indptr          array of int (start of each row in the other arrays)
+    indices         array of int (opponent id of each entry)
+    wins            array of int (sets won against that opponent)
+    losses          array of int (sets lost against that opponent)
+    roster          bytes (roster_hash() of the players, or None if unknown)
+    """
+
+    def __init__(self, size=0):
+        self.size = size
+        self.indptr = array("q", [0] * (size + 1))
+        self.indices = array("q")
+        self.wins = array("q")
+        self.losses = array("q")
+        self.roster = None
+
+    @classmethod
+    def from_players(cls, roster):
+        """
+        Build the matrix from the head-to-head records of every player.
+
+        Args:
+            roster (list of Players): Every player, indexed by Player.id
+        """
+        matrix = cls()
+        matrix.size = len(roster)
+        matrix.roster = roster_hash(roster)
+        matrix.indptr = array("q", [0])
+        for player in roster:
+            wins = player.h2hwins
+            losses = player.h2hlosses
+            for pid in sorted(set(wins).union(losses)):
+                matrix.indices.append(pid)
+                matrix.wins.append(len(wins.get(pid, ())))
+                matrix.losses.append(len(losses.get(pid, ())))
+            matrix.indptr.append(len(matrix.indices))
+        return matrix
+
+    def row(self, pid):
+        """
+        Return a player's record against everyone they have played.
+
+        Returns:
+            list of tuples: (opponent id, wins, losses), sorted by id
+        """
+        start = self.indptr[pid]
+        stop = self.indptr[pid + 1]
+        return list(zip(self.indices[start:stop], self.wins[start:stop],
+                        self.losses[start:stop]))
+
+    def column(self, pid):
+        """
+        Return everyone's record against a player.
+
+        Returns:
+            list of tuples: (opponent id, opponent's wins, opponent's losses)
+        """
+        return [(opponent, losses, wins)
+                for opponent, wins, losses in self.row(pid)]
+
+    def record(self, pid, opponent):
+        """
+        Return one player's record against another.
+
+        Returns:
+            tuple: (wins, losses), (0, 0) if they never played
+        """
+        start = self.indptr[pid]
+        stop = self.indptr[pid + 1]
+        i = bisect_left(self.indices, opponent, start, stop)
+        if i < stop and self.indices[i] == opponent:
+            return self.wins[i], self.losses[i]
+        return 0, 0
+
+    def record_against(self, pid, subset):
+        """
+        Return a player's combined record against a group of players.
+
+        Args:
+            pid (int): Id of the player
+            subset (iterable of int): Ids of the opponents to count
+
+        Returns:
+            tuple: (wins, losses)
+        """
+        subset = set(subset)
+        start = self.indptr[pid]
+        stop = self.indptr[pid + 1]
+        wins = 0
+        losses = 0
+        for i in range(start, stop):
+            if self.indices[i] in subset:
+                wins += self.wins[i]
+                losses += self.losses[i]
+        return wins, losses
+
+    def records_against(self, subset):
+        """
+        Return every player's combined record against a group of players.
+
+        Only the rows of the group are read, since a win against a member
+        of the group is a loss in that member's row.
+
+        Args:
+            subset (iterable of int): Ids of the opponents to count
+
+        Returns:
+            dict: player id to (wins, losses), for players with any sets
+        """
+        wins = {}
+        losses = {}
+        for member in set(subset):
+            start = self.indptr[member]
+            stop = self.indptr[member + 1]
+            for i in range(start, stop):
+                pid = self.indices[i]
+                wins[pid] = wins.get(pid, 0) + self.losses[i]
+                losses[pid] = losses.get(pid, 0) + self.wins[i]
+        return {pid: (wins[pid], losses[pid]) for pid in wins}
+
+    def best_against(self, subset, count=10, minimum=1):
+        """
+        Return the players with the best win rate against a group.
+
+        Args:
+            subset (iterable of int): Ids of the opponents to count
+            count (int): Number of players to return
+            minimum (int): Minimum number of sets against the group
+
+        Returns:
+            list of tuples: (player id, wins, losses), best first
+        """
+        records = [(pid, wins, losses) for pid, (wins, losses)
+                   in self.records_against(subset).items()
+                   if wins + losses >= minimum]
+        records.sort(key=lambda x: (-x[1] / (x[1] + x[2]), -x[1], x[0]))
+        return records[:count]
+
+    def winning_against(self, pid):
+        """
+        Return the ids of every player with a winning record against pid.
+        """
+        return [opponent for opponent, wins, losses in self.row(pid)
+                if losses > wins]
+
+    def expected_vs_actual(self, pid, elos):
+        """
+        Compare a player's win rate with what their elo predicts.
+
+        The expected score of every set is computed from the current elos,
+        the same way as Player.calculateWin.
+
+        Args:
+            pid (int): Id of the player
+            elos (sequence of float): Elo of every player, indexed by id
+
+        Returns:
+            tuple: (expected win rate, actual win rate), or None if the
+                   player has no recorded sets
+        """
+        R1 = 10**(elos[pid]/400)
+        expected = 0.0
+        won = 0
+        played = 0
+        for opponent, wins, losses in self.row(pid):
+            R2 = 10**(elos[opponent]/400)
+            expected += (wins + losses) * R1/(R1+R2)
+            won += wins
+            played += wins + losses
+        if not played:
+            return None
+        return expected / played, won / played
+
+    def save(self, matrixfile):
+        """
+        Write the matrix to a binary file.
+        """
+        dirpath = os.path.dirname(matrixfile)
+        if dirpath:
+            os.makedirs(dirpath, exist_ok=True)
+        with open(matrixfile, "wb") as f:
+            f.write(HEADER.pack(MAGIC, self.size, len(self.indices),
+                                self.roster or bytes(32)))
+            for column in (self.indptr, self.indices, self.wins, self.losses):
+                f.write(column.tobytes())
+
+    @classmethod
+    def load(cls, matrixfile):
+        """
+        Read a matrix written by save().
+
+        Matrices saved without a roster hash are read with roster None.
+        """
+        with open(matrixfile, "rb") as f:
+            magic = f.read(len(MAGIC))
+            f.seek(0)
+            matrix = cls()
+            if magic == MAGIC:
+                magic, size, count, roster = HEADER.unpack(
+                    f.read(HEADER.size))
+                matrix.roster = roster if any(roster) else None
+            elif magic == OLDMAGIC:
+                magic, size, count = OLDHEADER.unpack(f.read(OLDHEADER.size))
+            else:
+                raise ValueError(matrixfile + " is not a head-to-head matrix")
+            matrix.size = size
+            matrix.indptr = array("q")
+            matrix.indptr.fromfile(f, size + 1)
+            for column in (matrix.indices, matrix.wins, matrix.losses):
+                column.fromfile(f, count)
+        return matrix
@@ -0,0 +1,132 @@
+"""
+Put matches from every tournament into one stream in the order they were
+played.
+
+Matches are normally replayed tournament by tournament, in the order of the
+tournament list, and within a tournament in the order Challonge lists them.
+When tournaments overlap (e.g. weeklies at different venues, or a bracket
+spread over a weekend), that is not the order the sets were played in.
+
+merge() streams matches by the time each was started (or completed),
+breaking ties on the match id. Each tournament is first scanned for its
+earliest match, and its matches are only sorted once the stream reaches
+that time, so only tournaments that overlap the current time are held
+sorted at once; the rest cost one heap entry each.
+
+Orders:
+    file            tournament list order, as Challonge lists the matches
+    started         by started-at
+    completed       by completed-at, or started-at if it has none
+Matches without a time go after every match with one.
+"""
+
+import math
+from heapq import heapify, heappop, heapreplace
+from rating_history import to_time
+
+ORDERS = ("file", "started", "completed")
+
+
+def match_key(order):
+    """
+    Return a function giving the position of a match in an order.
+
+    Keys are (timestamp, match id); matches without a time get infinity.
+    """
+    if order == "started":
+        def key(match):
+            when = to_time(match["started-at"])
+            return (math.inf if math.isnan(when) else when, match["id"])
+    elif order == "completed":
+        def key(match):
+            when = to_time(match.get("completed-at"))
+            if math.isnan(when):
+                when = to_time(match["started-at"])
+            return (math.inf if math.isnan(when) else when, match["id"])
+    else:
+        raise ValueError("Matches have no time order: " + str(order))
+    return key
+
+
+def spans(all_matches, order):
+    """
+    Find the first and last key of each tournament in one pass.
+
+    Args:
+        all_matches (list of lists): matches grouped by tournament (or a
+                                     match_store.MatchStore)
+        order (str): "started" or "completed"
+
+    Returns:
+        list: (first key, last key) of each tournament, None if it has
+              no matches
+    """
+    key = match_key(order)
+    result = []
+    for tournament in all_matches:
+        first = last = None
+        for match in tournament:
+            k = key(match)
+            if first is None or k < first:
+                first = k
+            if last is None or k > last:
+                last = k
+        result.append(None if first is None else (first, last))
+    return result
+
+
+def merge(all_matches, order, tournamentspans=None):
+    """
+    Generate the matches of every tournament, merged into one order.
+
+    Args:
+        all_matches (list of lists): matches grouped by tournament (or a
+                                     match_store.MatchStore)
+        order (str): "started" or "completed"
+        tournamentspans (list): what spans() returned, if already known
+
+    Yields:
+        json object: every match, by time then id
+    """
+    key = match_key(order)
+    if tournamentspans is None:
+        tournamentspans = spans(all_matches, order)
+    tournaments = []
+    # Entries are (key, position, match): match is None until the
+    # tournament at position is opened, and (key, position) is unique
+    # since each tournament has one entry at a time
+    heap = []
+    for position, (tournament, span) in enumerate(zip(all_matches,
+                                                      tournamentspans)):
+        tournaments.append(tournament)
+        if span is not None:
+            heap.append((span[0], position, None))
+    heapify(heap)
+    streams = {}
+    while heap:
+        _, position, match = heap[0]
+        if match is None:
+            # Its earliest match is next, so sort the tournament now
+            streams[position] = iter(sorted(tournaments[position], key=key))
+            tournaments[position] = None
+            match = next(streams[position])
+        yield match
+        match = next(streams[position], None)
+        if match is None:
+            heappop(heap)
+            del streams[position]
+        else:
+            heapreplace(heap, (key(match), position, match))
+
+
+def ordered(all_matches, order, tournamentspans=None):
+    """
+    Return matches grouped so that replaying them group by group goes in
+    the given order.
+
+    For "file" this is all_matches itself; otherwise it is a single group
+    streaming merge().
+    """
+    if order == "file":
+        return all_matches
+    return (merge(all_matches, order, tournamentspans),)
@@ -0,0 +1,391 @@
+#!/usr/bin/python3
+"""
+Store matches in a compact, memory-mappable columnar file.
+
+Only the fields used by the elo calculations are kept: match id, winner-id,
+loser-id, scores-csv, started-at and completed-at. Numbers are stored as
+fixed-width columns and set scores as indices into a table of unique strings,
+so the file can be memory-mapped and read without unpickling anything.
+Everything is stored little-endian, so files can be moved between machines.
+
+The header holds a digest of the tournaments the matches were saved with
+(their ids, updated-at and state, see digest()), so that a store left
+behind by an interrupted run is not mistaken for the current one.
+
+Usage: match_store.py [matches.pkl [matches.cols]]
+"""
+
+import os
+import sys
+import mmap
+import getopt
+import math
+import pickle
+import struct
+import hashlib
+from bisect import bisect_right
+from array import array
+from datetime import date, datetime, timedelta, timezone
+
+MAGIC = b"CEMATCH2"
+# magic, number of tournaments, number of matches, number of strings,
+# digest of the tournaments
+HEADER = struct.Struct("<8sqqq32s")
+# Stored in place of a missing id or score
+MISSING = -1
+# Stored as the UTC offset of datetimes without a timezone
+NAIVE = -(2 ** 31)
+STOREFILE = "obj/matches.cols"
+FIELDS = ("id", "tournament-id", "winner-id", "loser-id", "scores-csv",
+          "started-at", "completed-at")
+# Columns have to be byte swapped on big-endian machines
+SWAP = sys.byteorder != "little"
+EPOCH = date(1970, 1, 1)
+USAGE = "match_store.py [options] [matches.pkl [matches.cols]]\nOptions:"\
+        "\n\t-h\tDisplay this help"\
+        "\nConverts a matches pickle (default obj/matches.pkl) to a columnar"\
+        "\nfile (default " + STOREFILE + ")."
+
+
+def _split_time(value):
+    """
+    Split a datetime into (POSIX timestamp, UTC offset in minutes).
+    """
+    if value is None:
+        return math.nan, 0
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    offset = value.utcoffset()
+    if offset is None:
+        return value.timestamp(), NAIVE
+    return value.timestamp(), int(offset.total_seconds() // 60)
+
+
+def _join_time(timestamp, offset):
+    """
+    Rebuild a datetime from _split_time's output.
+    """
+    if math.isnan(timestamp):
+        return None
+    if offset == NAIVE:
+        return datetime.fromtimestamp(timestamp)
+    return datetime.fromtimestamp(timestamp,
+                                  timezone(timedelta(minutes=offset)))
+
+
+def digest(tournaments):
+    """
+    Return a digest of what identifies the current version of tournaments.
+
+    Args:
+        tournaments (list of json objects): tournaments, in order
+
+    Returns:
+        bytes: 32 bytes that change whenever a tournament is added, removed,
+               moved, updated or changes state
+    """
+    h = hashlib.sha256()
+    for tournament in tournaments:
+        h.update(repr((tournament["id"], str(tournament.get("updated-at")),
+                       tournament.get("state"))).encode("utf-8"))
+    return h.digest()
+
+
+def _write_column(f, column):
+    """
+    Write an array little-endian, padded to a multiple of 8 bytes.
+    """
+    if SWAP:
+        column = array(column.typecode, column)
+        column.byteswap()
+    data = column.tobytes()
+    f.write(data)
+    f.write(b"\0" * (-len(data) % 8))
+
+
+def write_store(all_matches, storefile, tournament_ids=None,
+                tournamentdigest=bytes(32)):
+    """
+    Write matches grouped by tournament to a columnar file.
+
+    Args:
+        all_matches (list of lists): matches as saved by save_tourneys.py
+        storefile (str): path of the file to write
+        tournament_ids (list of int): id of each tournament, taken from the
+                                      matches themselves if not given
+        tournamentdigest (bytes): digest() of the tournaments, if known
+    """
+    starts = array("q", [0])
+    tournaments = array("q")
+    ids = array("q")
+    winners = array("q")
+    losers = array("q")
+    scores = array("i")
+    started = array("d")
+    startedtz = array("i")
+    completed = array("d")
+    completedtz = array("i")
+    strings = {}
+    for i, tournament in enumerate(all_matches):
+        if tournament_ids is not None:
+            tournaments.append(tournament_ids[i])
+        elif tournament:
+            tournaments.append(tournament[0]["tournament-id"])
+        else:
+            tournaments.append(MISSING)
+        for match in tournament:
+            ids.append(match["id"])
+            winner = match["winner-id"]
+            winners.append(MISSING if winner is None else winner)
+            loser = match["loser-id"]
+            losers.append(MISSING if loser is None else loser)
+            score = match["scores-csv"]
+            if score is None:
+                scores.append(MISSING)
+            else:
+                scores.append(strings.setdefault(score, len(strings)))
+            timestamp, offset = _split_time(match.get("started-at"))
+            started.append(timestamp)
+            startedtz.append(offset)
+            timestamp, offset = _split_time(match.get("completed-at"))
+            completed.append(timestamp)
+            completedtz.append(offset)
+        starts.append(len(ids))
+    blob = bytearray()
+    offsets = array("q", [0])
+    for string in strings:
+        blob += string.encode("utf-8")
+        offsets.append(len(blob))
+    with open(storefile, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(tournaments), len(ids), len(strings),
+                            tournamentdigest))
+        for column in (starts, tournaments, ids, winners, losers, scores,
+                       started, startedtz, completed, completedtz, offsets):
+            _write_column(f, column)
+        f.write(bytes(blob))
+
+
+def convert(matchesfile="obj/matches.pkl", storefile=STOREFILE,
+            tournamentfile="obj/tournaments.pkl"):
+    """
+    Convert a matches pickle written by save_tourneys.py to a columnar file.
+    """
+    with open(matchesfile, "rb") as f:
+        all_matches = pickle.load(f)
+    tournamentdigest = bytes(32)
+    if os.path.exists(tournamentfile):
+        with open(tournamentfile, "rb") as f:
+            tournamentdigest = digest(pickle.load(f))
+    write_store(all_matches, storefile, tournamentdigest=tournamentdigest)
+
+
+def is_store(filename):
+    """
+    Return True if the file is a columnar match store, of any version.
+    """
+    with open(filename, "rb") as f:
+        return f.read(len(MAGIC))[:-1] == MAGIC[:-1]
+
+
+class MatchStore:
+    """
+    Read-only, memory-mapped view of a columnar match file.
+
+    Iterating over the store gives one sequence of matches per tournament,
+    so it can be used in place of the list of lists in obj/matches.pkl.
+
+    Fields include:
+    tournament_ids  memoryview of int (id of each tournament)
+    ids             memoryview of int (id of each match)
+    winners         memoryview of int (winner-id, or MISSING)
+    losers          memoryview of int (loser-id, or MISSING)
+    scores          memoryview of int (index into strings, or MISSING)
+    strings         list of str (every distinct scores-csv)
+    digest          bytes (digest() of the tournaments, all zero if unknown)
+    """
+
+    def __init__(self, storefile):
+        with open(storefile, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        if bytes(view[:len(MAGIC) - 1]) != MAGIC[:-1]:
+            raise ValueError(storefile + " is not a match store")
+        if bytes(view[:len(MAGIC)]) != MAGIC:
+            raise ValueError(storefile + " was written by another version,"
+                             " run match_store.py or save_tourneys.py again")
+        magic, ntourneys, nmatches, nstrings, self.digest = \
+            HEADER.unpack_from(view)
+        self._pos = HEADER.size
+
+        def column(fmt, count):
+            size = struct.calcsize(fmt) * count
+            data = view[self._pos:self._pos + size]
+            self._pos += size + (-size % 8)
+            if not SWAP:
+                return data.cast(fmt)
+            # Copied, since the mapped bytes cannot be used in place
+            col = array(fmt, bytes(data))
+            col.byteswap()
+            return col
+
+        self._starts = column("q", ntourneys + 1)
+        self.tournament_ids = column("q", ntourneys)
+        self.ids = column("q", nmatches)
+        self.winners = column("q", nmatches)
+        self.losers = column("q", nmatches)
+        self.scores = column("i", nmatches)
+        self._started = column("d", nmatches)
+        self._startedtz = column("i", nmatches)
+        self._completed = column("d", nmatches)
+        self._completedtz = column("i", nmatches)
+        offsets = column("q", nstrings + 1)
+        blob = bytes(view[self._pos:self._pos + offsets[nstrings]])
+        self.strings = [sys.intern(blob[offsets[i]:offsets[i + 1]]
+                                   .decode("utf-8"))
+                        for i in range(nstrings)]
+        # Day of each started-at, by days since the epoch, see ref()
+        self._days = {}
+
+    def __len__(self):
+        return len(self.tournament_ids)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("tournament index out of range")
+        return TournamentMatches(self, self._starts[i], self._starts[i + 1],
+                                 self.tournament_ids[i])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def value(self, index, field):
+        """
+        Return a single field of a match in the same form as the json object.
+        """
+        if field == "id":
+            return self.ids[index]
+        if field == "winner-id" or field == "loser-id":
+            column = self.winners if field == "winner-id" else self.losers
+            value = column[index]
+            return None if value == MISSING else value
+        if field == "scores-csv":
+            score = self.scores[index]
+            return None if score == MISSING else self.strings[score]
+        if field == "started-at":
+            return _join_time(self._started[index], self._startedtz[index])
+        if field == "completed-at":
+            return _join_time(self._completed[index],
+                              self._completedtz[index])
+        if field == "tournament-id":
+            return self.tournament_ids[bisect_right(self._starts, index) - 1]
+        raise KeyError(field)
+
+    def started(self, index):
+        """
+        Return the started-at of a match as a POSIX timestamp, NaN if it
+        has none.
+        """
+        return self._started[index]
+
+    def ref(self, index):
+        """
+        Return the same as player.match_ref for a match, without making a
+        datetime for it.
+        """
+        score = self.scores[index]
+        score = None if score == MISSING else self.strings[score]
+        timestamp = self._started[index]
+        offset = self._startedtz[index]
+        if math.isnan(timestamp) or offset == NAIVE:
+            # Local time, or "None", like str() of the datetime
+            day = sys.intern(str(self.value(index, "started-at"))[0:10])
+            return (day, score)
+        days = math.floor((timestamp + offset * 60) / 86400)
+        day = self._days.get(days)
+        if day is None:
+            day = sys.intern((EPOCH + timedelta(days=days)).isoformat())
+            self._days[days] = day
+        return (day, score)
+
+
+class TournamentMatches:
+    """
+    The matches of one tournament in a MatchStore, as a sequence.
+    """
+
+    __slots__ = ("store", "start", "stop", "tournament_id")
+
+    def __init__(self, store, start, stop, tournament_id):
+        self.store = store
+        self.start = start
+        self.stop = stop
+        self.tournament_id = tournament_id
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("match index out of range")
+        return MatchView(self.store, self.start + i)
+
+    def __iter__(self):
+        store = self.store
+        for index in range(self.start, self.stop):
+            yield MatchView(store, index)
+
+
+class MatchView:
+    """
+    A single match in a MatchStore.
+
+    Supports the same subscripting as a match json object for the fields
+    that are stored. Pickles as a plain dictionary of those fields.
+    """
+
+    __slots__ = ("store", "index")
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def __getitem__(self, field):
+        return self.store.value(self.index, field)
+
+    def get(self, field, default=None):
+        try:
+            return self.store.value(self.index, field)
+        except KeyError:
+            return default
+
+    def __contains__(self, field):
+        return field in FIELDS
+
+    def to_dict(self):
+        return {field: self[field] for field in FIELDS}
+
+    def __reduce__(self):
+        return (dict, (self.to_dict(),))
+
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "h", ["help"])
+    except getopt.GetoptError:
+        print(USAGE)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print(USAGE)
+            sys.exit()
+    if len(args) > 2:
+        print(USAGE)
+        sys.exit(2)
+    convert(*args)
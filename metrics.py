@@ -0,0 +1,137 @@
+"""
+Time the phases of a run and count what happened in it.
+
+Instrumentation is off unless enable() is called. While it is off, phase()
+returns a shared do-nothing context manager and count() returns at once,
+so the calls can stay in the code. Phases are coarse (reading a file,
+replaying every match, writing an output), never individual matches.
+
+Usage:
+    with metrics.phase("read_matches"):
+        ...
+    metrics.count("matches", n)
+"""
+
+import sys
+import time
+from contextlib import nullcontext
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+_enabled = False
+# Name of each phase to [calls, wall seconds, CPU seconds, peak RSS after]
+_phases = {}
+_counters = {}
+_noop = nullcontext()
+
+
+def enable():
+    """
+    Start recording phases and counters, forgetting any recorded so far.
+    """
+    global _enabled
+    _enabled = True
+    _phases.clear()
+    _counters.clear()
+
+
+def enabled():
+    """
+    Return whether phases and counters are being recorded.
+    """
+    return _enabled
+
+
+def peak_rss(who=None):
+    """
+    Return the peak resident memory of this process in bytes.
+
+    Args:
+        who: resource.RUSAGE_SELF (default) or resource.RUSAGE_CHILDREN
+
+    Returns:
+        int: Bytes, or None if the platform doesn't report it
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who is None else who)
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return usage.ru_maxrss if sys.platform == "darwin" \
+        else usage.ru_maxrss * 1024
+
+
+class _Phase:
+    """
+    Context manager adding the time spent inside it to a phase.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.wall,
+               time.process_time() - self.cpu)
+        return False
+
+
+def phase(name):
+    """
+    Return a context manager that times a phase of the run.
+
+    A phase entered several times adds up; phases may be nested.
+    """
+    if not _enabled:
+        return _noop
+    return _Phase(name)
+
+
+def record(name, wall, cpu):
+    """
+    Add time measured elsewhere (e.g. in another process) to a phase.
+    """
+    if not _enabled:
+        return
+    if name not in _phases:
+        _phases[name] = [0, 0.0, 0.0, None]
+    entry = _phases[name]
+    entry[0] += 1
+    entry[1] += wall
+    entry[2] += cpu
+    entry[3] = peak_rss()
+
+
+def count(name, n=1):
+    """
+    Add to a counter.
+    """
+    if _enabled:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def report():
+    """
+    Return everything recorded so far, ready to be written as JSON.
+
+    Returns:
+        dict: phases (name to calls, wall and cpu seconds, and the peak RSS
+              of the process when the phase last ended, in the order they
+              first ended), counters, and the peak RSS of this process and
+              of its finished child processes
+    """
+    return {
+        "phases": {name: {"calls": calls, "wall": wall, "cpu": cpu,
+                          "peak_rss": rss}
+                   for name, (calls, wall, cpu, rss) in _phases.items()},
+        "counters": dict(_counters),
+        "peak_rss": peak_rss(),
+        "children_peak_rss": None if resource is None
+        else peak_rss(resource.RUSAGE_CHILDREN),
+    }
@@ -0,0 +1,330 @@
+#!/usr/bin/python3
+"""
+Resolve the names participants sign up under to the players they belong to.
+
+Names are upper-cased, then replaced using the aliases dictionary from
+aliases.py (following chains of aliases to the end), then checked against
+pattern rules, e.g. every name containing JUSTIN belongs to JUSTIN.
+Pattern rules can be set by declaring a list called patterns in aliases.py,
+in the same form as PATTERNS.
+
+Run on its own, this lists names of players that look like they are the
+same person, as entries that can be pasted into aliases.py.
+
+Usage: name_resolver.py [options]
+"""
+
+import re
+import sys
+import json
+import getopt
+import pickle
+from collections import defaultdict
+import tourney_cache
+
+# Rules applied after aliases, in the form (regular expression, name):
+# a name the expression matches anywhere in becomes that name
+PATTERNS = [
+    ("JUSTIN", "JUSTIN"),
+]
+# Largest edit distance between names reported as likely duplicates
+MAXDISTANCE = 2
+USAGE = "name_resolver.py [options]\nOptions:"\
+        "\n\t-h\tDisplay this help"\
+        "\n\t-d\tLargest edit distance to report (default "\
+        + str(MAXDISTANCE) + ")"
+
+
+def close_aliases(aliases):
+    """
+    Follow every chain of aliases to the name at its end.
+
+    Args:
+        aliases (dict): name to the name it should count as
+
+    Returns:
+        dict: name to the name it ends up as
+
+    Entries that map a name to itself are harmless and left out.
+
+    Raises:
+        ValueError: if aliases refer to each other in a cycle
+    """
+    closed = {}
+    for name in aliases:
+        chain = [name]
+        target = aliases[name]
+        if target == name:
+            continue
+        while target in aliases and target not in closed \
+                and aliases[target] != target:
+            if target in chain:
+                raise ValueError("Aliases form a cycle: "
+                                 + " -> ".join(chain + [target]))
+            chain.append(target)
+            target = aliases[target]
+        target = closed.get(target, target)
+        for alias in chain:
+            closed[alias] = target
+    return closed
+
+
+class NameResolver:
+    """
+    Turn display names into player names.
+
+    Everything is worked out when the resolver is made, and every display
+    name is only resolved once.
+
+    Fields include:
+    aliases         dict (name to the name it ends up as, see close_aliases)
+    patterns        list of tuples (compiled expression, name)
+    cache           dict (display name to player name)
+    """
+
+    def __init__(self, aliases=None, patterns=None):
+        """
+        Args:
+            aliases (dict): name to the name it should count as, default
+                            none
+            patterns (list of tuples): (regular expression, name) rules,
+                                       default PATTERNS
+        """
+        self.aliases = close_aliases(aliases or {})
+        if patterns is None:
+            patterns = PATTERNS
+        self.patterns = [(re.compile(pattern), name)
+                         for pattern, name in patterns]
+        self.cache = {}
+
+    def resolve(self, displayname):
+        """
+        Return the name of the player a display name belongs to.
+        """
+        try:
+            return self.cache[displayname]
+        except KeyError:
+            pass
+        name = displayname.upper()
+        name = self.aliases.get(name, name)
+        for pattern, target in self.patterns:
+            if pattern.search(name):
+                # The name a rule gives is final, aliases are not applied
+                # to it
+                name = target
+                break
+        self.cache[displayname] = name
+        return name
+
+
+_default = None
+
+
+def default():
+    """
+    Return the resolver made from aliases.py, making it the first time.
+    """
+    global _default
+    if _default is None:
+        _default = NameResolver(*load_aliases())
+    return _default
+
+
+def load_aliases():
+    """
+    Read the aliases and pattern rules declared in aliases.py.
+
+    Without aliases.py no names are merged, and a notice is printed to
+    stderr so that this is not mistaken for a run with aliases.
+
+    Returns:
+        tuple: (aliases, patterns), patterns being None if aliases.py
+               does not declare any
+    """
+    try:
+        from aliases import aliases  # Another file I made with a dictionary
+        # of replacements for names
+        # For example, one of the entries is "JEREMY LEFURGE" : "NERFAN"
+    except ImportError:
+        print("File aliases.py was not found. No names will be merged as"
+              " aliases.", file=sys.stderr)
+        return {}, None
+    try:
+        from aliases import patterns
+    except ImportError:
+        patterns = None
+    return aliases, patterns
+
+
+def resolve(displayname):
+    """
+    Resolve a display name with the default resolver.
+    """
+    return default().resolve(displayname)
+
+
+def comparison_key(name):
+    """
+    Return the letters and digits of a name, which is what is compared
+    when looking for duplicates.
+    """
+    return re.sub(r"[^0-9A-Z]", "", name.upper())
+
+
+def _deletions(key, count):
+    # Every string made by deleting up to count characters from key
+    variants = {key}
+    frontier = {key}
+    for _ in range(count):
+        frontier = {variant[:i] + variant[i + 1:]
+                    for variant in frontier for i in range(len(variant))}
+        variants |= frontier
+    return variants
+
+
+def _allowed(key, maxdistance):
+    # Short names are only allowed few edits, or every three letter name
+    # would be a duplicate of every other one
+    return min(maxdistance, len(key) // 4)
+
+
+def edit_distance(a, b, limit):
+    """
+    Return the number of edits between two strings, counting a swap of
+    two neighbouring characters as one edit.
+
+    Only distances up to limit are worked out; anything further returns
+    limit + 1.
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    over = limit + 1
+    if len(b) - len(a) > limit:
+        return over
+    # Only cells within limit of the diagonal can be within limit
+    previous = None
+    row = [j if j <= limit else over for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [over] * (len(b) + 1)
+        if i <= limit:
+            current[0] = i
+        best = current[0]
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            distance = min(row[j] + 1, current[j - 1] + 1,
+                           row[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] \
+                    and a[i - 2] == b[j - 1]:
+                distance = min(distance, previous[j - 2] + 1)
+            current[j] = distance
+            if distance < best:
+                best = distance
+        if best > limit:
+            return over
+        previous, row = row, current
+    return min(row[-1], over)
+
+
+def find_duplicates(names, maxdistance=MAXDISTANCE):
+    """
+    Find pairs of names that are probably the same player.
+
+    Names are compared by their letters and digits only. Short names are
+    allowed fewer edits: one per four letters, up to maxdistance.
+
+    Candidates are found with an index of every way of deleting up to k
+    characters from each name. Any edit (including a swap) can be undone
+    by deleting one character from each name, so two names within k edits
+    of each other always have a deletion in common. Only names that do
+    have their edit distance worked out.
+
+    Args:
+        names (iterable of str): Distinct player names
+        maxdistance (int): Largest number of edits to report
+
+    Returns:
+        list of tuples: (name, name, edit distance), closest first
+    """
+    bykey = defaultdict(list)
+    for name in names:
+        bykey[comparison_key(name)].append(name)
+    pairs = []
+    for key, group in bykey.items():
+        # Names that only differ in spaces or punctuation
+        if not key:
+            continue
+        for i, name in enumerate(group):
+            for other in group[i + 1:]:
+                pairs.append((name, other, 0))
+    keys = [key for key in bykey if key]
+    allowed = [_allowed(key, maxdistance) for key in keys]
+    index = defaultdict(list)
+    for i, key in enumerate(keys):
+        if allowed[i]:
+            for variant in _deletions(key, allowed[i]):
+                index[variant].append(i)
+    checked = set()
+    for bucket in index.values():
+        for n, i in enumerate(bucket):
+            for j in bucket[n + 1:]:
+                if (i, j) in checked:
+                    continue
+                checked.add((i, j))
+                limit = min(allowed[i], allowed[j])
+                distance = edit_distance(keys[i], keys[j], limit)
+                if distance <= limit:
+                    for name in bykey[keys[i]]:
+                        for other in bykey[keys[j]]:
+                            pairs.append((name, other, distance))
+    pairs.sort(key=lambda pair: (pair[2], pair[0], pair[1]))
+    return pairs
+
+
+def tournament_counts(participants, resolver=None):
+    """
+    Count the tournaments each player entered.
+
+    Args:
+        participants (list of lists): participants grouped by tournament
+        resolver (NameResolver): Resolver to use, default from aliases.py
+
+    Returns:
+        dict: player name to number of tournaments
+    """
+    resolver = resolver or default()
+    counts = defaultdict(int)
+    for participantlist in participants:
+        for name in {resolver.resolve(participant["display-name"])
+                     for participant in participantlist}:
+            counts[name] += 1
+    return counts
+
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hd:")
+    except getopt.GetoptError:
+        print(USAGE)
+        sys.exit(2)
+    maxdistance = MAXDISTANCE
+    for opt, arg in opts:
+        if opt == "-h":
+            print(USAGE)
+            sys.exit()
+        if opt == "-d":
+            maxdistance = int(arg)
+    if tourney_cache.has_index():
+        participants = tourney_cache.load_all(with_matches=False)[1]
+    else:
+        with open("obj/participants.pkl", "rb") as f:
+            participants = pickle.load(f)
+    counts = tournament_counts(participants)
+    duplicates = find_duplicates(counts, maxdistance)
+    print("# " + str(len(duplicates)) + " likely duplicates among "
+          + str(len(counts)) + " players")
+    for name, other, distance in duplicates:
+        # Suggest counting the rarer name as the more common one
+        if (counts[name], name) > (counts[other], other):
+            name, other = other, name
+        print("    {}: {},  # {} edit{}, {} vs {} tournaments".format(
+            json.dumps(name), json.dumps(other), distance,
+            "" if distance == 1 else "s", counts[name], counts[other]))
@@ -14,6 +14,9 @@ class Placement:
     loss2:          Player object
     """
 
+    __slots__ = ("playername", "tourney", "entrants", "placement",
+                 "loss1", "loss2")
+
     def __init__(self, pname, tourney, participant):
         self.playername = pname
         self.tourney = tourney
@@ -3,11 +3,60 @@ Provides a class for information to be stored about players
 """
 
 from placement import Placement
-import math
+import sys
 
 IGNOREGAMES = False
+# The constant k used for every player, see tune.py for other schedules
+KFACTOR = 32
 # The elo requirement for a win to be good/bad
 NOTABLEELO = -80
+# Elo used to seed players without any elo records
+UNKNOWN_ELO = 1000
+
+# Result used for the winner and the loser of a set, keyed by set score
+# Sets with any other score are not counted at all
+SCOREWEIGHTS = {
+    "2-0": (1, 0), "3-1": (1, 0), "1-0": (1, 0),
+    "0-1": (1, 0), "1-3": (1, 0), "0-2": (1, 0),
+    "2-1": (.8, .2), "3-2": (.8, .2), "1-2": (.8, .2), "2-3": (.8, .2),
+    "3-0": (1.25, -0.25), "0-3": (1.25, -0.25),
+}
+
+
+def classify_score(score):
+    """
+    Return the results to use for the winner and loser of a set.
+
+    Args:
+        score (str): The scores-csv of the match, or None if not reported
+
+    Returns:
+        tuple: (winner result, loser result), or None if the score
+               is not recognized and the set should not be counted
+    """
+    if score is None:
+        score = "1-0"
+    if score not in SCOREWEIGHTS:
+        return None
+    if IGNOREGAMES:
+        return (1, 0)
+    return SCOREWEIGHTS[score]
+
+
+def match_ref(match):
+    """
+    Return the compact record of a match kept for head-to-head purposes.
+
+    Args:
+        match (json object): The match to record
+
+    Returns:
+        tuple: (date as "YYYY-MM-DD", scores-csv)
+    """
+    score = match["scores-csv"]
+    if score is not None:
+        score = sys.intern(score)
+    return (sys.intern(str(match["started-at"])[0:10]), score)
 
 
 class Player():
@@ -17,6 +66,7 @@ class Player():
     Stores information such as name, elo, games played, etc.
 
     Fields include:
+    id              int (index of this player in roster)
     name            str
     elo             int
     won             int
@@ -24,37 +74,49 @@ class Player():
     winnings        float
     placings        list of Placement objects
     h2hwins         dict
-                    key: player object
-                    value: list of match json objects
+                    key: opponent id
+                    value: list of match_ref tuples
     h2hlosses       dict
-                    key: player object
-                    value: list of match json objects
+                    key: opponent id
+                    value: list of match_ref tuples
+    roster          list of every Player, indexed by id
     """
 
+    __slots__ = ("id", "name", "elo", "won", "played", "winnings",
+                 "placings", "h2hwins", "h2hlosses", "roster")
+
     # Starting elo for players
     DEFAULT_ELO = 1200
 
-    def __init__(self, name):
+    def __init__(self, name, pid=None, roster=None):
         """
         Constructor method
 
         Args:
             name (str): Name of the player
-            elo (int): Elo of the player
-            won (int): Number of games won
-            played (int): Number of games played
+            pid (int): Id of the player, its index in roster
+            roster (list of Players): Every player, shared by all of them
+                                      so head-to-heads can refer to ids
         """
+        self.id = pid
+        self.roster = roster
         self.name = name
         self.elo = float(Player.DEFAULT_ELO)
         self.won = 0
         self.played = 0
         self.winnings = 0
         self.placings = []
-        # Dictionary, keys are Player objects,
-        # values are lists of Match json objects
+        # Dictionary, keys are opponent ids,
+        # values are lists of match_ref tuples
         self.h2hwins = {}
         self.h2hlosses = {}
 
+    def opponent(self, pid):
+        """
+        Return the Player with the given id.
+        """
+        return self.roster[pid]
+
     def calculateWin(self, loser, match):
         """
         Calculate and apply a change in elo based on a win
@@ -66,29 +128,16 @@ class Player():
         R1 = 10**(self.elo/400)
         R2 = 10**(loser.elo/400)
         E1 = R1/(R1+R2)
-        result = 1
-        if match["scores-csv"] != None:
-            score = match["scores-csv"]
-        else:
-            score = "1-0"
-        if not IGNOREGAMES:
-            if score in ["2-0", "3-1", "1-0", "0-1", "1-3", "0-2"]:
-                result = 1
-            elif score in ["2-1", "3-2", "1-2", "2-3"]:
-                result = .8
-            elif score in ["3-0", "0-3"]:
-                result = 1.25
-            else:
-                return
-        elif score not in ["2-0", "3-1", "1-0", "2-1", "3-2", "3-0", "0-2", \
-                         "1-3", "0-1", "1-2", "2-3", "0-3"]:
+        results = classify_score(match["scores-csv"])
+        if results is None:
             return
+        result = results[0]
         self.played += 1
         self.won += 1
         self.elo = self.elo + self.kconst()*(result-E1)
-        if loser not in self.h2hwins:
-            self.h2hwins[loser] = []
-        self.h2hwins[loser].append(match)
+        if loser.id not in self.h2hwins:
+            self.h2hwins[loser.id] = []
+        self.h2hwins[loser.id].append(match_ref(match))
 
     def calculateLoss(self, winner, match):
         """
@@ -101,28 +150,15 @@ class Player():
         R1 = 10**(winner.elo/400)
         R2 = 10**(self.elo/400)
         E2 = R2/(R1+R2)
-        result = 0
-        if match["scores-csv"] != None:
-            score = match["scores-csv"]
-        else:
-            score = "1-0"
-        if not IGNOREGAMES:
-            if score in ["2-0", "3-1", "1-0", "0-1", "1-3", "0-2"]:
-                result = 0
-            elif score in ["2-1", "3-2", "1-2", "2-3"]:
-                result = .2
-            elif score in ["3-0", "0-3"]:
-                result = -0.25
-            else:
-                return
-        elif score not in ["2-0", "3-1", "1-0", "2-1", "3-2", "3-0", "0-2", \
-                         "1-3", "0-1", "1-2", "2-3", "0-3"]:
+        results = classify_score(match["scores-csv"])
+        if results is None:
             return
+        result = results[1]
         self.played += 1
         self.elo = self.elo + self.kconst()*(result-E2)
-        if winner not in self.h2hlosses:
-            self.h2hlosses[winner] = []
-        self.h2hlosses[winner].append(match)
+        if winner.id not in self.h2hlosses:
+            self.h2hlosses[winner.id] = []
+        self.h2hlosses[winner.id].append(match_ref(match))
 
     def __str__(self):
         """
@@ -164,21 +200,24 @@ class Player():
         Returns:
             str: Formatted player head-to-head stats
         """
-        string = self.name + "'s head-to-head records:\n"
-        for player in self.h2hwins:
-            string += "{:20s}".format(player.name)
-            string += ": " + str(len(self.h2hwins[player])) + "-"
-            if player in self.h2hlosses:
-                string += str(len(self.h2hlosses[player]))
+        return "".join(self.iter_h2h_list())
+
+    def iter_h2h_list(self):
+        """
+        Generate the lines of h2h_list() one at a time.
+        """
+        yield self.name + "'s head-to-head records:\n"
+        for pid in self.h2hwins:
+            if pid in self.h2hlosses:
+                losses = str(len(self.h2hlosses[pid]))
             else:
-                string += "0"
-            string += "\n"
-        for player in self.h2hlosses:
-            if player not in self.h2hwins:
-                string += "{:20s}".format(player.name)
-                string += ": 0-" + str(len(self.h2hlosses[player]))
-                string += "\n"
-        return string
+                losses = "0"
+            yield "{:20s}".format(self.opponent(pid).name) + ": " \
+                  + str(len(self.h2hwins[pid])) + "-" + losses + "\n"
+        for pid in self.h2hlosses:
+            if pid not in self.h2hwins:
+                yield "{:20s}".format(self.opponent(pid).name) + ": 0-" \
+                      + str(len(self.h2hlosses[pid])) + "\n"
 
     def h2h_details(self, other_player):
         """
@@ -192,54 +231,74 @@ class Player():
         Returns:
             str: Formatted details about a specific head-to-head
         """
+        return "".join(self.iter_h2h_details(other_player))
+
+    def iter_h2h_details(self, other_player):
+        """
+        Generate the lines of h2h_details() one at a time.
+        """
         # Make sure we have data on the other player
-        if not (other_player in self.h2hwins or other_player in self.h2hlosses):
-            return "No matches against " + other_player.name + " recorded."
-        string = self.name + "'s detailed head-to-head against " \
-                 + other_player.name + ":\n"
-        string += "Wins:\n"
-        if other_player in self.h2hwins:
-            for match in self.h2hwins[other_player]:
-                # Displays date and game count
-                string += str(match["started-at"])[0:10] + ": " \
-                          + str(match["scores-csv"])
-                string += "\n"
-        string += "Losses:\n"
-        if other_player in self.h2hlosses:
-            for match in self.h2hlosses[other_player]:
-                # Displays date and game count
-                string += str(match["started-at"])[0:10] + ": " \
-                          + str(match["scores-csv"])
-                string += "\n"
-        return string
-
-    def summary(self):
+        pid = other_player.id
+        if not (pid in self.h2hwins or pid in self.h2hlosses):
+            yield "No matches against " + other_player.name + " recorded."
+            return
+        yield self.name + "'s detailed head-to-head against " \
+              + other_player.name + ":\n"
+        yield "Wins:\n"
+        for date, score in self.h2hwins.get(pid, ()):
+            # Displays date and game count
+            yield date + ": " + str(score) + "\n"
+        yield "Losses:\n"
+        for date, score in self.h2hlosses.get(pid, ()):
+            # Displays date and game count
+            yield date + ": " + str(score) + "\n"
+
+    def summary(self, matrix=None):
         """
         Return a string summarizing the player, including
         placings, notable wins, and notable losses.
 
+        Args:
+            matrix (H2HMatrix): If given, opponents are read from the
+                                head-to-head matrix, in order of id, instead
+                                of from this player's own records
+
         Returns:
             str: Summary of player
         """
+        return "".join(self.iter_summary(matrix))
+
+    def iter_summary(self, matrix=None):
+        """
+        Generate the lines of summary() one at a time.
+        """
+        if matrix is None:
+            beaten = self.h2hwins
+            lostto = self.h2hlosses
+        else:
+            row = matrix.row(self.id)
+            beaten = [pid for pid, wins, losses in row if wins]
+            lostto = [pid for pid, wins, losses in row if losses]
         # Player name
-        string = "Player: " + self.name + "\n"
+        yield "Player: " + self.name + "\n"
         # Placings
-        string += "Placings:\n"
+        yield "Placings:\n"
         for placing in self.placings:
-            string += "\t" + str(placing) + "\n"
+            yield "\t" + str(placing) + "\n"
         # Notable wins
-        string += "Notable wins:  "
-        for player in self.h2hwins:
-            if player.elo >= self.elo + NOTABLEELO:
-                string += player.name + ", "
-        string = string[:-2] + "\n"
+        names = [self.opponent(pid).name for pid in beaten
+                 if self.opponent(pid).elo >= self.elo + NOTABLEELO]
+        if names:
+            yield "Notable wins:  " + ", ".join(names) + "\n"
+        else:
+            yield "Notable wins:\n"
         # Notable losses
-        string += "Notable losses:  "
-        for player in self.h2hlosses:
-            if player.elo <= self.elo + NOTABLEELO:
-                string += player.name + ", "
-        string = string[:-2] + "\n"
-        return string
+        names = [self.opponent(pid).name for pid in lostto
+                 if self.opponent(pid).elo <= self.elo + NOTABLEELO]
+        if names:
+            yield "Notable losses:  " + ", ".join(names) + "\n"
+        else:
+            yield "Notable losses:\n"
 
     def kconst(self):
         """
@@ -248,20 +307,7 @@ class Player():
         Returns:
             int: Value of constant to use to calculate elo
         """
-        return 32
-        elodiff = abs(Player.DEFAULT_ELO - self.elo)
-        variance = math.sqrt(elodiff) * 1.5
-        return int(48 - variance)
-        if self.elo <= 1200:
-            return 60
-        if self.elo <= 1300:
-            return 40
-        if self.elo <= 1400:
-            return 30
-        if self.elo <= 1500:
-            return 20
-        return 10
-        #return 96/math.sqrt(self.played)
+        return KFACTOR
 
     __repr__ = __str__
 
@@ -0,0 +1,48 @@
+"""
+Provides a small thread-safe rate limiter for talking to the Challonge API.
+
+Challonge throttles accounts that send too many requests at once, so any code
+that fires requests from several threads should share one of these.
+"""
+
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Space out calls so that no more than a given number happen per second.
+
+    Fields include:
+    interval        float (minimum seconds between two calls)
+    """
+
+    def __init__(self, rate):
+        """
+        Constructor method
+
+        Args:
+            rate (float): Maximum number of calls per second.
+                          0 or None disables limiting entirely.
+        """
+        self.interval = 1.0 / rate if rate else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        """
+        Block until the caller is allowed to make its next call.
+        """
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+    __enter__ = wait
+
+    def __exit__(self, *exc):
+        return False
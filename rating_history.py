@@ -0,0 +1,203 @@
+"""
+Record every rating change so that past ratings can be looked up directly.
+
+Each player has a time series of (time, match index, rating after the
+match) kept in three arrays, in the order the matches were replayed. Times
+come from the started-at of the match, and are never earlier than the
+player's previous change so the series can be searched with bisect.
+"""
+
+import os
+import math
+import struct
+from array import array
+from bisect import bisect_right
+from datetime import date, datetime, time
+
+MAGIC = b"CEHIST01"
+# magic, number of players, number of rating changes
+HEADER = struct.Struct("<8sqq")
+
+
+def to_time(when):
+    """
+    Convert a point in time to a POSIX timestamp.
+
+    Args:
+        when: A timestamp, a datetime, an ISO 8601 string, or a date (or a
+              "YYYY-MM-DD" string), which means the end of that day
+
+    Returns:
+        float: The timestamp, NaN if when is None
+    """
+    if when is None:
+        return math.nan
+    if isinstance(when, (int, float)):
+        return float(when)
+    if isinstance(when, str):
+        if len(when) == 10:
+            when = date.fromisoformat(when)
+        else:
+            when = datetime.fromisoformat(when)
+    if not isinstance(when, datetime):
+        when = datetime.combine(when, time.max)
+    return when.timestamp()
+
+
+class RatingHistory:
+    """
+    Time series of the rating of every player.
+
+    Fields include:
+    times           list of arrays of float (time of each change, by id)
+    matches         list of arrays of int (index of the match that caused
+                    each change, counting every match replayed)
+    ratings         list of arrays of float (rating after each change)
+    """
+
+    def __init__(self, size=0):
+        self.times = []
+        self.matches = []
+        self.ratings = []
+        # Used in place of the time of matches without a started-at
+        self.last = -math.inf
+        self.resize(size)
+
+    def __len__(self):
+        return len(self.times)
+
+    def resize(self, size):
+        """
+        Make room for players with ids up to size - 1.
+        """
+        while len(self.times) < size:
+            self.times.append(array("d"))
+            self.matches.append(array("q"))
+            self.ratings.append(array("d"))
+
+    def record(self, pid, when, match, rating):
+        """
+        Record a player's new rating.
+
+        Args:
+            pid (int): Id of the player
+            when (float): Timestamp of the match, see to_time
+            match (int): Index of the match
+            rating (float): Rating after the match
+        """
+        if pid >= len(self.times):
+            self.resize(pid + 1)
+        times = self.times[pid]
+        if times and when < times[-1]:
+            when = times[-1]
+        times.append(when)
+        self.matches[pid].append(match)
+        self.ratings[pid].append(rating)
+
+    def record_match(self, winner, winnerelo, loser, loserelo, started,
+                     match):
+        """
+        Record the new ratings of both players of a match.
+
+        Args:
+            winner (int): Id of the winner
+            winnerelo (float): Rating of the winner after the match
+            loser (int): Id of the loser
+            loserelo (float): Rating of the loser after the match
+            started: started-at of the match
+            match (int): Index of the match
+        """
+        when = to_time(started)
+        if math.isnan(when):
+            when = self.last
+        else:
+            self.last = when
+        self.record(winner, when, match, winnerelo)
+        self.record(loser, when, match, loserelo)
+
+    def rating_at(self, pid, when):
+        """
+        Return a player's rating after every match started by a time.
+
+        Returns:
+            float: The rating, or None if they had not played yet
+        """
+        if pid >= len(self.times):
+            return None
+        i = bisect_right(self.times[pid], to_time(when))
+        if i == 0:
+            return None
+        return self.ratings[pid][i - 1]
+
+    def leaderboard(self, when, pids=None):
+        """
+        Return everyone's rating at a time, highest first.
+
+        Args:
+            when: Point in time, see to_time
+            pids (iterable of int): Players to include, default everyone
+
+        Returns:
+            list of tuples: (player id, rating) for players who had played
+        """
+        when = to_time(when)
+        if pids is None:
+            pids = range(len(self.times))
+        ratings = []
+        for pid in pids:
+            i = bisect_right(self.times[pid], when)
+            if i:
+                ratings.append((pid, self.ratings[pid][i - 1]))
+        ratings.sort(key=lambda x: x[1], reverse=True)
+        return ratings
+
+    def series(self, pid):
+        """
+        Return every rating change of a player, e.g. to draw a graph.
+
+        Returns:
+            list of tuples: (timestamp, match index, rating)
+        """
+        return list(zip(self.times[pid], self.matches[pid],
+                        self.ratings[pid]))
+
+    def save(self, historyfile):
+        """
+        Write the history to a binary file.
+        """
+        dirpath = os.path.dirname(historyfile)
+        if dirpath:
+            os.makedirs(dirpath, exist_ok=True)
+        indptr = array("q", [0])
+        for times in self.times:
+            indptr.append(indptr[-1] + len(times))
+        with open(historyfile, "wb") as f:
+            f.write(HEADER.pack(MAGIC, len(self.times), indptr[-1]))
+            f.write(indptr.tobytes())
+            for columns in (self.times, self.matches, self.ratings):
+                for column in columns:
+                    f.write(column.tobytes())
+
+    @classmethod
+    def load(cls, historyfile):
+        """
+        Read a history written by save().
+        """
+        with open(historyfile, "rb") as f:
+            magic, size, count = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(historyfile + " is not a rating history")
+            indptr = array("q")
+            indptr.fromfile(f, size + 1)
+            history = cls()
+            for columns, typecode in ((history.times, "d"),
+                                      (history.matches, "q"),
+                                      (history.ratings, "d")):
+                for pid in range(size):
+                    column = array(typecode)
+                    column.fromfile(f, indptr[pid + 1] - indptr[pid])
+                    columns.append(column)
+        for times in history.times:
+            if times:
+                history.last = max(history.last, times[-1])
+        return history
@@ -0,0 +1,335 @@
+#!/usr/bin/python3
+"""
+Serve the saved elos over a local HTTP API.
+
+The player data saved by calculate_elos.py is loaded once and kept in
+memory, so that queries do not have to start a new process and unpickle
+everything again. Rendered responses are kept in an
+LRU cache, which is cleared whenever a new snapshot is loaded.
+
+Endpoints (all GET, except /reload which is POST):
+    /leaderboard?start=0&count=25   Slice of the ranked players
+    /player?name=NAME               Player.summary of a player
+    /h2h?player=NAME&opponent=NAME  Player.h2h_details between two players
+    /whatif?winner=NAME&loser=NAME&score=2-1
+                                    Elos after a hypothetical set
+    /seed?names=NAME,NAME,...       Names sorted into seeding order
+    /reload                         Load output/players.pkl again
+
+Responses are JSON, except /player and /h2h which are plain text.
+Names are not case sensitive. If the players file cannot be loaded again,
+/reload answers 500 and the old snapshot keeps being served.
+
+Usage: ratings_server.py [-p port] [-s socket] [-c cachesize] [playersfile]
+"""
+
+import os
+import sys
+import json
+import time
+import getopt
+import signal
+import socketserver
+import threading
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from elo_list import EloList
+from player import SCOREWEIGHTS
+from elotomorrow import eloTomorrow
+
+HOST = "127.0.0.1"
+PORT = 8765
+# Number of rendered responses to keep
+CACHESIZE = 4096
+USAGE = "ratings_server.py [options] [playersfile]\nOptions:"\
+        "\n\t-h\tDisplay this help"\
+        "\n\t-p\tPort to listen on (default " + str(PORT) + ")"\
+        "\n\t-s\tListen on this Unix socket instead of a port"\
+        "\n\t-c\tNumber of responses to cache (default "\
+        + str(CACHESIZE) + ")"
+
+
+class QueryError(Exception):
+    """
+    A query that cannot be answered, with the HTTP status to reply with.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class RatingsService:
+    """
+    Answer queries about a snapshot of the elos.
+
+    Fields include:
+    elos            EloList (the snapshot currently being served)
+    loaded          float (time the snapshot was loaded)
+    generation      int (number of snapshots loaded so far)
+    """
+
+    def __init__(self, playersfile=os.path.join("output", "players.pkl"),
+                 cachesize=CACHESIZE):
+        self.playersfile = playersfile
+        self.elos = None
+        self.loaded = None
+        self.generation = 0
+        self._lock = threading.Lock()
+        # Snapshot the current thread is rendering from
+        self._local = threading.local()
+        self.render = lru_cache(maxsize=cachesize)(self._render)
+        self.reload()
+
+    def reload(self):
+        """
+        Load the players file again and forget every cached response.
+
+        Queries keep being answered from the old snapshot until the new one
+        is ready, and if it cannot be loaded the old one is kept.
+        """
+        elos = EloList()
+        elos.load(self.playersfile)
+        # Build the indexes now rather than on the first query
+        elos.ranked()
+        elos.player("")
+        with self._lock:
+            self.elos = elos
+            self.loaded = time.time()
+            self.generation += 1
+            self.render.cache_clear()
+        return {"players": len(elos.elolist), "loaded": self.loaded,
+                "generation": self.generation}
+
+    def query(self, path, params):
+        """
+        Answer a query.
+
+        Args:
+            path (str): Endpoint, e.g. "/leaderboard"
+            params (dict): Query parameters, one value each
+
+        Returns:
+            tuple: (content type, body as bytes)
+        """
+        if path == "/reload":
+            raise QueryError(405, "use POST to reload")
+        # The generation is part of the cache key, so a response rendered
+        # from an old snapshot is never returned for a new one, and the
+        # cache does not keep old snapshots alive
+        with self._lock:
+            generation, self._local.elos = self.generation, self.elos
+        try:
+            return self.render(generation, path,
+                               tuple(sorted(params.items())))
+        finally:
+            self._local.elos = None
+
+    def post(self, path):
+        """
+        Answer a POST request, which only /reload accepts.
+
+        Returns:
+            tuple: (content type, body as bytes)
+        """
+        if path != "/reload":
+            raise QueryError(405, "only /reload accepts POST")
+        return _json(self.reload())
+
+    def _render(self, generation, path, key):
+        elos = self._local.elos
+        params = dict(key)
+        if path == "/leaderboard":
+            return _json(self.leaderboard(elos, _int(params, "start", 0),
+                                          _int(params, "count", 25)))
+        if path == "/player":
+            player = self._player(elos, params, "name")
+            # Opponents in the order they were first played, the same as
+            # the summaries saved by calculate_elos.py
+            return _text(player.summary())
+        if path == "/h2h":
+            player = self._player(elos, params, "player")
+            opponent = self._player(elos, params, "opponent")
+            return _text(player.h2h_details(opponent))
+        if path == "/whatif":
+            return _json(self.whatif(elos, params))
+        if path == "/seed":
+            names = [name.strip() for name in
+                     _param(params, "names").split(",") if name.strip()]
+            return _json(elos.seed_order(names))
+        raise QueryError(404, "unknown endpoint " + path)
+
+    def leaderboard(self, elos, start, count):
+        """
+        Return ranks start + 1 to start + count as a list of dicts.
+        """
+        ranked = elos.ranked()
+        rows = []
+        for rank, player in enumerate(ranked[start:start + count],
+                                      start + 1):
+            rows.append({"rank": rank, "name": player.name,
+                         "elo": player.elo, "won": player.won,
+                         "played": player.played,
+                         "tournaments": len(player.placings)})
+        return {"total": len(ranked), "players": rows}
+
+    def whatif(self, elos, params):
+        """
+        Return the elos two players would have after a hypothetical set.
+        """
+        winner = self._player(elos, params, "winner")
+        loser = self._player(elos, params, "loser")
+        score = params.get("score", "2-0")
+        if score not in SCOREWEIGHTS:
+            raise QueryError(400, "invalid score " + score)
+        winnerelo, loserelo = eloTomorrow(winner, loser, score)
+        return {"winner": {"name": winner.name, "elo": winner.elo,
+                           "after": winnerelo},
+                "loser": {"name": loser.name, "elo": loser.elo,
+                          "after": loserelo}}
+
+    def _player(self, elos, params, name):
+        player = elos.player(_param(params, name))
+        if player is None:
+            raise QueryError(404, params[name] + " not found")
+        return player
+
+
+def _param(params, name):
+    if name not in params:
+        raise QueryError(400, "missing parameter " + name)
+    return params[name]
+
+
+def _int(params, name, default):
+    try:
+        return max(0, int(params.get(name, default)))
+    except ValueError:
+        raise QueryError(400, name + " must be a number")
+
+
+def _json(obj):
+    return "application/json", json.dumps(obj).encode("utf-8")
+
+
+def _text(string):
+    return "text/plain; charset=utf-8", string.encode("utf-8")
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    Pass HTTP requests on to the server's RatingsService.
+    """
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {name: values[-1] for name, values
+                  in parse_qs(url.query).items()}
+        self.respond(lambda: self.server.service.query(url.path, params))
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        self.respond(lambda: self.server.service.post(path))
+
+    def respond(self, answer):
+        """
+        Send the response returned by answer(), or the error it raised.
+        """
+        try:
+            status = 200
+            ctype, body = answer()
+        except QueryError as e:
+            status = e.status
+            ctype, body = _json({"error": str(e)})
+        except Exception as e:
+            # Keep serving; a failed reload leaves the old snapshot in place
+            status = 500
+            ctype, body = _json({"error": type(e).__name__ + ": " + str(e)})
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else "local"
+
+    def log_message(self, format, *args):
+        pass
+
+
+class UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    """
+    HTTP server listening on a Unix socket.
+    """
+
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("local", 0)
+
+
+def make_server(service, port=PORT, socketpath=None):
+    """
+    Create a server for the service, on a local port or a Unix socket.
+    """
+    if socketpath is not None:
+        if os.path.exists(socketpath):
+            os.remove(socketpath)
+        server = UnixHTTPServer(socketpath, RequestHandler)
+    else:
+        server = ThreadingHTTPServer((HOST, port), RequestHandler)
+    server.service = service
+    return server
+
+
+def main(playersfile=os.path.join("output", "players.pkl"), port=PORT,
+         socketpath=None, cachesize=CACHESIZE):
+    service = RatingsService(playersfile, cachesize)
+    server = make_server(service, port, socketpath)
+    if hasattr(signal, "SIGHUP"):
+        # Reload in another thread, since the handler runs in the one
+        # that is serving requests
+        signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(
+            target=service.reload, daemon=True).start())
+    # Stop cleanly when terminated, so the socket file is removed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit())
+    print("Serving " + str(len(service.elos.elolist)) + " players on "
+          + (socketpath or HOST + ":" + str(port)))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socketpath is not None and os.path.exists(socketpath):
+            os.remove(socketpath)
+
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hp:s:c:",
+                                   ["help", "port=", "socket=", "cache="])
+    except getopt.GetoptError:
+        print(USAGE)
+        sys.exit(2)
+    port = PORT
+    socketpath = None
+    cachesize = CACHESIZE
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print(USAGE)
+            sys.exit()
+        if opt in ("-p", "--port"):
+            port = int(arg)
+        if opt in ("-s", "--socket"):
+            socketpath = arg
+        if opt in ("-c", "--cache"):
+            cachesize = int(arg)
+    if args:
+        main(args[0], port, socketpath, cachesize)
+    else:
+        main(port=port, socketpath=socketpath, cachesize=cachesize)
@@ -3,11 +3,18 @@
 Save the calculated data from a list of tournaments for easy reference.
 
 Collects data on players and matches.
-Saves to three separate files.
+Saves to three separate files, plus a columnar copy of the matches
+(see match_store.py) and, if asked, an SQLite database (see tourney_db.py).
 """
 
+import sys
+import getopt
 import pickle
 import challonge
+from concurrent.futures import ThreadPoolExecutor
+from ratelimit import RateLimiter
+import tourney_cache
+import match_store
 
 try:
     import set_credentials
@@ -59,6 +66,77 @@ all_matches = []
 # Players and matches are grouped by tournament.
 
 
+USAGE = "save_tourneys.py [options]\nOptions:"\
+        "\n\t-h\tDisplay this help"\
+        "\n\t-j\tNumber of tournaments to fetch at once (default 1)"\
+        "\n\t-r\tMaximum API requests per second (default 0, no limit)"\
+        "\n\t-f\tDownload every tournament again, ignoring the cache"\
+        "\n\t-d\tAlso save everything to this SQLite database"
+
+
+def fetch_tourney(tourney_id, limiter=None):
+    """
+    Get info about a tournament through the challonge api.
+
+    Makes three requests, each of which waits on the limiter if one is given.
+
+    Args:
+        tourney_id (str): The id used in the URL of the tournament
+                         i.e. that part after http://challonge.com/
+        limiter (RateLimiter): Shared limiter for all fetching threads
+
+    Returns:
+        tuple: (tournament, participants, matches) json objects
+    """
+    if limiter is None:
+        limiter = RateLimiter(0)
+    with limiter:
+        tournament = challonge.tournaments.show(tourney_id)
+    print("Retreiving data from " + tournament["name"] + "...")
+    with limiter:
+        participants = challonge.participants.index(tournament["id"])
+    with limiter:
+        matches = challonge.matches.index(tournament["id"])
+    return tournament, participants, matches
+
+
+def fetch_tourney_cached(tourney_id, limiter=None):
+    """
+    Get info about a tournament, reusing the cache when possible.
+
+    The tournament itself is always fetched so that its updated-at and state
+    can be compared with the cached copy. Participants and matches are only
+    downloaded again if the tournament changed. Fresh data is written to the
+    cache straight away, so an interrupted run picks up where it stopped.
+
+    Args:
+        tourney_id (str): The id used in the URL of the tournament
+        limiter (RateLimiter): Shared limiter for all fetching threads
+
+    Returns:
+        tuple: (tournament, participants, matches) json objects
+    """
+    if limiter is None:
+        limiter = RateLimiter(0)
+    cached = tourney_cache.read_entry(tourney_id, with_matches=False)
+    with limiter:
+        tournament = challonge.tournaments.show(tourney_id)
+    if tourney_cache.is_current(cached, tournament):
+        # Matches are only unpickled once the tournament is known to be
+        # unchanged
+        matches = tourney_cache.read_matches(tourney_id)
+        if matches is not None:
+            return cached[:2] + (matches,)
+    print("Retreiving data from " + tournament["name"] + "...")
+    with limiter:
+        participants = challonge.participants.index(tournament["id"])
+    with limiter:
+        matches = challonge.matches.index(tournament["id"])
+    entry = (tournament, participants, matches)
+    tourney_cache.write_entry(tourney_id, entry)
+    return entry
+
+
 def read_tourney(tourney_id):
     """
     Get info about a tournament through the challonge api.
@@ -69,10 +147,7 @@ def read_tourney(tourney_id):
         tourney_id (str): The id used in the URL of the tournament
                          i.e. that part after http://challonge.com/
     """
-    tournament = challonge.tournaments.show(tourney_id)
-    print("Retreiving data from " + tournament["name"] + "...")
-    participants = challonge.participants.index(tournament["id"])
-    matches = challonge.matches.index(tournament["id"])
+    tournament, participants, matches = fetch_tourney(tourney_id)
 
     tournaments.append(tournament)
 
@@ -82,18 +157,87 @@ def read_tourney(tourney_id):
     # Go through matches
     all_matches.append(matches)
 
-def main():
+
+def fetch_all(tourney_ids, jobs=1, rate=0, fetch=fetch_tourney):
+    """
+    Fetch several tournaments, up to jobs of them at the same time.
+
+    Results come back in the same order as tourney_ids no matter which
+    tournament finishes downloading first.
+
+    Args:
+        tourney_ids (list of str): Tournament ids to fetch
+        jobs (int): Maximum number of tournaments being fetched at once
+        rate (float): Maximum requests per second across all threads
+        fetch (function): Called as fetch(tourney_id, limiter), should return
+                          a (tournament, participants, matches) tuple
+
+    Returns:
+        list of tuples: One (tournament, participants, matches) per id
+    """
+    limiter = RateLimiter(rate)
+    if jobs <= 1:
+        return [fetch(tourney_id, limiter) for tourney_id in tourney_ids]
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(lambda t: fetch(t, limiter), tourney_ids))
+
+
+def main(jobs=1, rate=0, refresh=False, dbfile=None):
     """
     Read and save data from tourneys defined in tournamentlist.py
+
+    Args:
+        jobs (int): Maximum number of tournaments being fetched at once
+        rate (float): Maximum requests per second across all threads
+        refresh (bool): Download everything again instead of using the cache
+        dbfile (str): Path of an SQLite database to save everything to too
     """
-    for tourney in tourneys:
-        read_tourney(tourney)
+    fetch = fetch_tourney_cached
+    if refresh:
+        def fetch(tourney_id, limiter):
+            entry = fetch_tourney(tourney_id, limiter)
+            tourney_cache.write_entry(tourney_id, entry)
+            return entry
+    fetched = fetch_all(tourneys, jobs, rate, fetch)
+    tourney_cache.write_index(tourneys)
+    for tournament, participants, matches in fetched:
+        tournaments.append(tournament)
+        raw_participants.append(participants)
+        all_matches.append(matches)
     with open("obj/tournaments.pkl", "wb") as f:
         pickle.dump(tournaments, f, pickle.HIGHEST_PROTOCOL)
     with open("obj/participants.pkl", "wb") as f:
         pickle.dump(raw_participants, f, pickle.HIGHEST_PROTOCOL)
     with open("obj/matches.pkl", "wb") as f:
         pickle.dump(all_matches, f, pickle.HIGHEST_PROTOCOL)
+    match_store.write_store(all_matches, match_store.STOREFILE,
+                            [tournament["id"] for tournament in tournaments],
+                            match_store.digest(tournaments))
+    if dbfile is not None:
+        import tourney_db
+        tourney_db.write(tournaments, raw_participants, all_matches, dbfile)
 
 if __name__ == "__main__":
-    main()
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hj:r:fd:",
+                                   ["jobs=", "rate=", "force", "database="])
+    except getopt.GetoptError:
+        print(USAGE)
+        sys.exit(2)
+    jobs = 1
+    rate = 0
+    refresh = False
+    dbfile = None
+    for opt, arg in opts:
+        if opt == "-h":
+            print(USAGE)
+            sys.exit()
+        if opt in ("-j", "--jobs"):
+            jobs = int(arg)
+        if opt in ("-r", "--rate"):
+            rate = float(arg)
+        if opt in ("-f", "--force"):
+            refresh = True
+        if opt in ("-d", "--database"):
+            dbfile = arg
+    main(jobs, rate, refresh, dbfile)
@@ -4,78 +4,236 @@ Given a challonge tournament ID, pulls down the list of participants and seeds
 according to a saved elo list.
 
 Participants who do not have any elo records will be seeded at the bottom.
+Several tournaments (e.g. pools or waves) can be seeded in one run.
+Elos are read from the snapshot saved with the players, which only has to
+be opened, not loaded.
+
+Usage: seed.py [options] tourney_id [tourney_id ...]
 """
 
-from elo_list import EloList
-from player import Player
-import challonge
-import requests
-from aliases import aliases
-
-try:
-    import set_credentials
-    # This is a file I made with two lines:
-    # import challonge
-    # challonge.set_credentials("USERNAME", "API_KEY")
-    # USERNAME and API_KEY were replaced with my info, quotes included
-    # The only reason I made the file is so that I don't accidentally upload my
-    # challonge API key
-
-    # Alternatively, uncomment the folliwing line and add your information:
-    # challonge.set_credentials("USERNAME", "API_KEY")
-except ImportError:
-    print("File set_credentials.py was not found. Prompting for credentials.")
-    print("Information provided will be written out to set_credentials.py.")
-    username = input("Username: ")
-    apikey = input("API Key: ")
-    challonge.set_credentials(username, apikey)
-    with open("set_credentials.py", "w") as f:
-        f.write("import challonge\n")
-        f.write("challonge.set_credentials(\"")
-        f.write(username)
-        f.write("\", \"")
-        f.write(apikey)
-        f.write("\")")
-
-
-def seed(tourney_id):
-    elolist = EloList()
-    elolist.load()
-    players_by_name = {player.name: player for player in elolist.elolist}
-    name_to_id = {}
-    print("Fetching tournament information...")
-    tournament = challonge.tournaments.show(tourney_id)
-    participants = challonge.participants.index(tournament["id"])
-    seeded = []
-    for participant in participants:
-        name = participant["name"]
-        name_to_id[name] = participant["id"]
-        print(name)
-        if name.upper() in players_by_name.keys():
-            player = players_by_name[name.upper()]
-            player.name = name
-        else:
-            player = Player(name)
-            player.elo = 1000
-        seeded.append(player)
-    seeded = sorted(seeded, key=lambda x: x.elo, reverse=True)
-    updatetournament(tourney_id, seeded, name_to_id)
-
-
-def updatetournament(tourney_id, participants, name_to_id):
+import sys
+import time
+import getopt
+from concurrent.futures import ThreadPoolExecutor
+from ratelimit import RateLimiter
+from snapshot import open_players
+# challonge and requests are imported when a session is made, so that -h
+# and bad arguments don't wait for them
+
+
+def get_credentials():
+    """
+    Return the (username, api key) given to challonge.set_credentials,
+    prompting for them if there is no set_credentials.py yet.
+    """
+    import challonge
+    try:
+        import set_credentials
+        # This is a file I made with two lines:
+        # import challonge
+        # challonge.set_credentials("USERNAME", "API_KEY")
+        # USERNAME and API_KEY were replaced with my info, quotes included
+        # The only reason I made the file is so that I don't accidentally
+        # upload my challonge API key
+
+        # Alternatively, uncomment the folliwing line and add your
+        # information:
+        # challonge.set_credentials("USERNAME", "API_KEY")
+    except ImportError:
+        print("File set_credentials.py was not found."
+              " Prompting for credentials.")
+        print("Information provided will be written out to"
+              " set_credentials.py.")
+        username = input("Username: ")
+        apikey = input("API Key: ")
+        challonge.set_credentials(username, apikey)
+        with open("set_credentials.py", "w") as f:
+            f.write("import challonge\n")
+            f.write("challonge.set_credentials(\"")
+            f.write(username)
+            f.write("\", \"")
+            f.write(apikey)
+            f.write("\")")
+    return challonge.get_credentials()
+
+
+API_URL = "https://api.challonge.com/v1"
+# Attempts per request before giving up, and the first delay between them
+RETRIES = 5
+BACKOFF = 0.5
+
+USAGE = "seed.py [options] tourney_id [tourney_id ...]\nOptions:"\
+        "\n\t-h\tDisplay this help"\
+        "\n\t-j\tNumber of tournaments to seed at once (default 4)"\
+        "\n\t-r\tMaximum API requests per second (default 5)"\
+        "\n\t--api-url\tBase URL of the Challonge API"
+
+
+class ChallongeSession:
+    """
+    Talk to the Challonge API over one reused HTTP connection pool.
+
+    Requests are spaced out by a shared RateLimiter, and retried with
+    exponential backoff when the connection fails or the server is
+    overloaded.
+    """
+
+    def __init__(self, api_url=API_URL, rate=5, credentials=None):
+        """
+        Constructor method
+
+        Args:
+            api_url (str): Base URL of the API, e.g. of a local mock server
+            rate (float): Maximum number of requests per second
+            credentials (tuple): (username, api key), defaults to the ones
+                                 given to challonge.set_credentials
+        """
+        import requests
+        self.api_url = api_url.rstrip("/")
+        self.limiter = RateLimiter(rate)
+        self.session = requests.Session()
+        self.session.auth = credentials or get_credentials()
+
+    def request(self, method, path, **kwargs):
+        """
+        Make a request and return the decoded json response.
+        """
+        import requests
+        url = self.api_url + "/" + path
+        for attempt in range(RETRIES):
+            with self.limiter:
+                try:
+                    response = self.session.request(method, url, **kwargs)
+                except requests.ConnectionError:
+                    response = None
+            if response is not None and response.status_code != 429 \
+                    and response.status_code < 500:
+                response.raise_for_status()
+                return response.json()
+            if attempt + 1 < RETRIES:
+                time.sleep(BACKOFF * 2 ** attempt)
+        if response is None:
+            raise requests.ConnectionError("Could not connect to " + url)
+        response.raise_for_status()
+
+    def participants(self, tourney_id):
+        """
+        Return the participants of a tournament, in their current seed order.
+        """
+        participants = self.request(
+            "GET", "tournaments/" + tourney_id + "/participants.json")
+        participants = [entry["participant"] for entry in participants]
+        return sorted(participants, key=lambda x: x["seed"])
+
+    def set_seed(self, tourney_id, participant_id, seed):
+        """
+        Move one participant to the given seed.
+        """
+        self.request("PUT", "tournaments/" + tourney_id + "/participants/"
+                     + str(participant_id) + ".json",
+                     data={"participant[seed]": seed})
+
+
+def seed_updates(current, desired):
+    """
+    Work out which seed changes turn the current order into the desired one.
+
+    Challonge shifts everyone else down when a participant is moved, so the
+    changes only work if they are made in order. Participants that are
+    already in the right place are skipped.
+
+    Args:
+        current (list): participant ids by current seed
+        desired (list): participant ids by the seed they should have
+
+    Returns:
+        list of tuples: (participant id, seed) to send, in order
+    """
+    current = list(current)
+    updates = []
+    for i, pid in enumerate(desired):
+        if current[i] != pid:
+            current.remove(pid)
+            current.insert(i, pid)
+            updates.append((pid, i + 1))
+    return updates
+
+
+def seed(tourney_id, elolist=None, session=None):
+    """
+    Seed a tournament according to the saved elo list.
+
+    Args:
+        tourney_id (str): id of the tournament to seed
+        elolist (EloList or Snapshot): elos to seed by, opened from disk
+                                       if not given
+        session (ChallongeSession): session to send requests through
+    """
+    if elolist is None:
+        elolist = open_players()
+    if session is None:
+        session = ChallongeSession()
+    print("Fetching tournament information for " + tourney_id + "...")
+    participants = session.participants(tourney_id)
+    seeded = elolist.seed_order(participants, lambda x: x["name"])
+    names = {participant["id"]: participant["name"]
+             for participant in participants}
+    updates = seed_updates([participant["id"] for participant in participants],
+                           [participant["id"] for participant in seeded])
+    updatetournament(tourney_id, updates, names, session)
+
+
+def updatetournament(tourney_id, updates, names, session):
     """
     Args:
         tourney_id (str): id of the tournament to set participants for
-        participants (list of Players): ordered list of participants
+        updates (list of tuples): (participant id, seed) in order
+        names (dict): participant names by id, for printing
+        session (ChallongeSession): session to send requests through
     """
-    seed = 1
-    for player in participants:
-        print("Updating %s as seed %d" % (player.name, seed))
-        challonge.participants.update(tourney_id, name_to_id[player.name],
-                name=player.name, seed=seed)
-        seed += 1
+    for pid, seed in updates:
+        print("%s: updating %s as seed %d" % (tourney_id, names[pid], seed))
+        session.set_seed(tourney_id, pid, seed)
+    print("%s: seeded, %d participants moved" % (tourney_id, len(updates)))
 
 
-if __name__ == "__main__":
-    seed("rocnysmash-tpg32s4s")
+def seed_all(tourney_ids, jobs=4, rate=5, api_url=API_URL):
+    """
+    Seed several tournaments at once from a single opening of the elos.
+
+    Seed changes within a tournament depend on each other and are sent in
+    order; different tournaments are seeded concurrently, sharing one
+    session and rate limit.
+    """
+    elolist = open_players()
+    session = ChallongeSession(api_url, rate)
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+        futures = [pool.submit(seed, tourney_id, elolist, session)
+                   for tourney_id in tourney_ids]
+        for future in futures:
+            future.result()
 
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hj:r:", ["api-url="])
+    except getopt.GetoptError:
+        print(USAGE)
+        sys.exit(2)
+    jobs = 4
+    rate = 5
+    api_url = API_URL
+    for opt, arg in opts:
+        if opt == "-h":
+            print(USAGE)
+            sys.exit()
+        if opt == "-j":
+            jobs = int(arg)
+        if opt == "-r":
+            rate = float(arg)
+        if opt == "--api-url":
+            api_url = arg
+    if not args:
+        print(USAGE)
+        sys.exit(2)
+    seed_all(args, jobs, rate, api_url)
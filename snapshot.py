@@ -0,0 +1,330 @@
+"""
+Save players in a form read-only commands can open without loading it all.
+
+The file starts with what a leaderboard or seeding needs: every name, elo,
+win and set count, and the ranking. Each player's full record (placings,
+head-to-heads) follows as its own pickle, only read when that player is
+asked for. Opening a snapshot reads the first part and maps the rest.
+Tournaments are pickled once, and records refer to them by index.
+
+The header holds the roster hash of the players (see h2h_matrix.roster_hash),
+which is also saved with the head-to-head matrix next to players.pkl, so
+that a snapshot is only used for the players it was written from.
+
+Layout, all little-endian:
+    header          magic, version, number of players, number ranked,
+                    length of the names, length of the tournaments, roster
+                    hash
+    names           offsets (size + 1 int64), then the names in UTF-8
+    elos            float64 per player, by id
+    won, played     int64 per player, by id
+    ranking         int64 ids of the players in the elo list, best first
+    tournaments     pickled list of every tournament placed in
+    records         offsets (size + 1 int64), then one pickle per player
+"""
+
+import io
+import os
+import sys
+import mmap
+import pickle
+import struct
+from array import array
+from player import Player, UNKNOWN_ELO
+from h2h_matrix import read_roster, roster_hash
+
+SCRIPTDIR = os.path.dirname(os.path.realpath(__file__))
+SNAPSHOTFILE = os.path.join("output", "snapshot.bin")
+PLAYERSFILE = os.path.join("output", "players.pkl")
+MATRIXFILE = os.path.join("output", "h2h.bin")
+MAGIC = b"CESNAPSH"
+# Changed whenever the layout or the player records change
+VERSION = 2
+# magic, version, number of players, number ranked, length of the names,
+# length of the tournaments, roster hash
+HEADER = struct.Struct("<8sqqqqq32s")
+# Fields of a player's record; roster is restored when it is read
+FIELDS = tuple(field for field in Player.__slots__ if field != "roster")
+# Arrays have to be byte swapped on big-endian machines
+SWAP = sys.byteorder != "little"
+
+
+def _tobytes(column):
+    """
+    Return the bytes of an array, little-endian.
+    """
+    if SWAP:
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def write(elolist, snapshotfile=SNAPSHOTFILE):
+    """
+    Write a snapshot of an EloList.
+
+    Every player in roster() is written, so that filtered players can
+    still be looked up; the ranking is that of the (filtered) list.
+    """
+    roster = elolist.roster() or list(elolist.elolist)
+    names = [player.name.encode("utf-8") for player in roster]
+    nameoffsets = array("q", [0])
+    for name in names:
+        nameoffsets.append(nameoffsets[-1] + len(name))
+    tournaments = []
+    indexes = {}
+    for player in roster:
+        for placing in player.placings:
+            if id(placing.tourney) not in indexes:
+                indexes[id(placing.tourney)] = len(tournaments)
+                tournaments.append(placing.tourney)
+    tournamentdata = pickle.dumps(tournaments, pickle.HIGHEST_PROTOCOL)
+    records = []
+    for player in roster:
+        buffer = io.BytesIO()
+        pickler = pickle.Pickler(buffer, pickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = lambda obj: indexes.get(id(obj)) \
+            if isinstance(obj, dict) else None
+        pickler.dump(tuple(getattr(player, field) for field in FIELDS))
+        records.append(buffer.getvalue())
+    recordoffsets = array("q", [0])
+    for record in records:
+        recordoffsets.append(recordoffsets[-1] + len(record))
+    ranking = array("q", [player.id for player in elolist.ranked()])
+    path = os.path.join(SCRIPTDIR, snapshotfile)
+    dirpath = os.path.dirname(path)
+    if dirpath:
+        os.makedirs(dirpath, exist_ok=True)
+    temppath = path + ".tmp"
+    with open(temppath, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(roster), len(ranking),
+                            nameoffsets[-1], len(tournamentdata),
+                            roster_hash(roster)))
+        f.write(_tobytes(nameoffsets))
+        f.writelines(names)
+        f.write(_tobytes(array("d", [player.elo for player in roster])))
+        f.write(_tobytes(array("q", [player.won for player in roster])))
+        f.write(_tobytes(array("q", [player.played for player in roster])))
+        f.write(_tobytes(ranking))
+        f.write(tournamentdata)
+        f.write(_tobytes(recordoffsets))
+        f.writelines(records)
+    os.replace(temppath, path)
+
+
+class LazyRoster:
+    """
+    Stand-in for the roster list of a snapshot, reading players as they
+    are indexed.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def __len__(self):
+        return len(self.snapshot)
+
+    def __getitem__(self, pid):
+        return self.snapshot.load_player(pid)
+
+
+class Snapshot:
+    """
+    A snapshot opened for reading.
+
+    Answers the same lookups as an EloList (player, seed_order) for the
+    commands that only read ratings.
+
+    Fields include:
+    names           list of str (name of each player, by id)
+    elos            array of float (elo of each player, by id)
+    won             array of int (sets won by each player, by id)
+    played          array of int (sets played by each player, by id)
+    ranking         array of int (ids in the elo list, best first)
+    rosterhash      bytes (roster_hash() of the players written)
+    """
+
+    def __init__(self, snapshotfile=SNAPSHOTFILE):
+        """
+        Open a snapshot, reading everything but the player records.
+
+        Raises:
+            ValueError: if the file is not a snapshot of this version
+        """
+        path = os.path.join(SCRIPTDIR, snapshotfile)
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size:
+            self._map.close()
+            raise ValueError(path + " is not a version " + str(VERSION)
+                             + " snapshot")
+        magic, version, size, ranked, namebytes, tournamentbytes, \
+            self.rosterhash = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError(path + " is not a version " + str(VERSION)
+                             + " snapshot")
+        position = HEADER.size
+        offsets = self._array("q", position, size + 1)
+        position += 8 * (size + 1)
+        namedata = self._map[position:position + namebytes].decode("utf-8")
+        # Offsets are in bytes, so names are sliced from the bytes if any
+        # of them aren't ASCII
+        if len(namedata) == namebytes:
+            self.names = [namedata[offsets[i]:offsets[i + 1]]
+                          for i in range(size)]
+        else:
+            raw = self._map[position:position + namebytes]
+            self.names = [raw[offsets[i]:offsets[i + 1]].decode("utf-8")
+                          for i in range(size)]
+        position += namebytes
+        self.elos = self._array("d", position, size)
+        position += 8 * size
+        self.won = self._array("q", position, size)
+        position += 8 * size
+        self.played = self._array("q", position, size)
+        position += 8 * size
+        self.ranking = self._array("q", position, ranked)
+        position += 8 * ranked
+        self._tournamentspan = (position, position + tournamentbytes)
+        self._tournaments = None
+        position += tournamentbytes
+        self._records = self._array("q", position, size + 1)
+        self._start = position + 8 * (size + 1)
+        self._players = [None] * size
+        self._roster = LazyRoster(self)
+        self._byname = None
+
+    def _array(self, typecode, position, count):
+        values = array(typecode)
+        values.frombytes(self._map[position:position + 8 * count])
+        if SWAP:
+            values.byteswap()
+        return values
+
+    def __len__(self):
+        return len(self.names)
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def roster(self):
+        """
+        Return every player, read as they are indexed.
+        """
+        return self._roster
+
+    def load_player(self, pid):
+        """
+        Return the Player with the given id, reading it the first time.
+        """
+        player = self._players[pid]
+        if player is None:
+            if self._tournaments is None:
+                self._tournaments = pickle.loads(
+                    self._map[slice(*self._tournamentspan)])
+            start = self._start + self._records[pid]
+            end = self._start + self._records[pid + 1]
+            unpickler = pickle.Unpickler(io.BytesIO(self._map[start:end]))
+            unpickler.persistent_load = self._tournaments.__getitem__
+            values = unpickler.load()
+            player = Player.__new__(Player)
+            for field, value in zip(FIELDS, values):
+                setattr(player, field, value)
+            player.roster = self._roster
+            self._players[pid] = player
+        return player
+
+    def find(self, name):
+        """
+        Return the id of the player with the given name, or None.
+
+        Names are looked up the same way as EloList.player.
+        """
+        if self._byname is None:
+            self._byname = {}
+            for pid, playername in enumerate(self.names):
+                self._byname.setdefault(playername.upper(), pid)
+        pid = self._byname.get(name.upper())
+        if pid is None:
+            import name_resolver
+            pid = self._byname.get(name_resolver.resolve(name))
+        return pid
+
+    def player(self, name):
+        """
+        Return the Player with the given name, or None.
+        """
+        pid = self.find(name)
+        return None if pid is None else self.load_player(pid)
+
+    def elo(self, name):
+        """
+        Return the elo of the player with the given name, or None.
+        """
+        pid = self.find(name)
+        return None if pid is None else self.elos[pid]
+
+    def seed_order(self, entrants, name=lambda x: x):
+        """
+        Sort entrants of a tournament by elo, best first.
+
+        Same as EloList.seed_order, without reading any player records.
+        """
+        def elo(entrant):
+            value = self.elo(name(entrant))
+            return UNKNOWN_ELO if value is None else value
+        return sorted(entrants, key=elo, reverse=True)
+
+    def leaderboard(self, count=None):
+        """
+        Return the ranked players without reading their records.
+
+        Returns:
+            list of tuples: (name, elo, sets won, sets played), best first
+        """
+        ranking = self.ranking if count is None else self.ranking[:count]
+        return [(self.names[pid], self.elos[pid], self.won[pid],
+                 self.played[pid]) for pid in ranking]
+
+
+def open_players(snapshotfile=SNAPSHOTFILE, playersfile=PLAYERSFILE,
+                 matrixfile=MATRIXFILE):
+    """
+    Open the saved players for reading.
+
+    The snapshot is used if it was written from the same roster as the
+    players file, going by the roster hash saved with the head-to-head
+    matrix next to it, or if there is no players file. Otherwise, e.g. if
+    it was never written or is from another version, the players are
+    loaded into an EloList.
+
+    Returns:
+        Snapshot or EloList: either answers player() and seed_order()
+    """
+    playerspath = os.path.join(SCRIPTDIR, playersfile)
+    matrixpath = os.path.join(SCRIPTDIR, matrixfile)
+    try:
+        snapshot = Snapshot(snapshotfile)
+    except (OSError, ValueError):
+        snapshot = None
+    if snapshot is not None:
+        if not os.path.exists(playerspath):
+            return snapshot
+        try:
+            if read_roster(matrixpath) == snapshot.rosterhash:
+                return snapshot
+        except OSError:
+            pass
+        snapshot.close()
+    from elo_list import EloList
+    elolist = EloList()
+    elolist.load(playersfile, matrixfile)
+    return elolist
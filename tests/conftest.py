@@ -0,0 +1,43 @@
+"""
+Shared fixtures for the tests.
+
+Tournaments are generated with benchmarks/synthetic.py, so that no data
+downloaded from Challonge (or aliases.py, tournamentlist.py or
+set_credentials.py) is needed. aliases.py is replaced by an empty one, so
+the tests never depend on the aliases of whoever runs them.
+"""
+
+import os
+import sys
+import types
+
+import pytest
+
+ROOTDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOTDIR)
+sys.path.insert(0, os.path.join(ROOTDIR, "benchmarks"))
+import synthetic  # noqa: E402
+from name_resolver import NameResolver  # noqa: E402
+
+aliases = types.ModuleType("aliases")
+aliases.aliases = {}
+sys.modules["aliases"] = aliases
+
+
+@pytest.fixture(scope="session")
+def data():
+    """
+    (tournaments, participants, matches) of a small synthetic history.
+
+    Players are split into three regions that never meet, so that the
+    parallel engine has more than one group of players to replay.
+    """
+    return synthetic.generate(300, 24, size=16, regions=3)
+
+
+@pytest.fixture
+def resolver():
+    """
+    A resolver without any aliases or patterns.
+    """
+    return NameResolver({}, [])
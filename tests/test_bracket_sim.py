@@ -0,0 +1,164 @@
+"""
+Tests of bracket_sim.py: the brackets made from seeds, the places given out,
+and the two ways of playing runs.
+"""
+
+import sys
+import types
+import random
+
+import pytest
+
+import bracket_sim
+from bracket_sim import Bracket, ENTRANT, WINNER, LOSER, EMPTY
+
+numpy = bracket_sim.numpy
+needs_numpy = pytest.mark.skipif(numpy is None, reason="needs numpy")
+
+
+def names(count):
+    return ["p{}".format(i) for i in range(count)]
+
+
+@pytest.mark.parametrize("count, double, matches, places", [
+    (8, True, 15, [1, 2, 3, 4, 5, 7]),
+    (8, False, 7, [1, 2, 3, 5]),
+    (6, True, 15, [1, 2, 3, 4, 5]),
+    (6, False, 7, [1, 2, 3, 5]),
+    (2, True, 3, [1, 2]),
+    (1, True, 1, [1]),
+])
+def test_from_seeds_size(count, double, matches, places):
+    bracket = Bracket.from_seeds(names(count), double)
+    assert len(bracket) == matches
+    assert bracket.places == places
+
+
+def test_from_seeds_first_round():
+    # 1 plays 8, 4 plays 5, 2 plays 7, 3 plays 6; with 6 entrants the top
+    # two seeds get byes
+    bracket = Bracket.from_seeds(names(8))
+    assert [bracket.refs[i] for i in range(4)] \
+        == [(0, 7), (3, 4), (1, 6), (2, 5)]
+    bracket = Bracket.from_seeds(names(6))
+    assert [bracket.kinds[i] for i in range(4)] \
+        == [(ENTRANT, EMPTY), (ENTRANT, ENTRANT), (ENTRANT, EMPTY),
+            (ENTRANT, ENTRANT)]
+
+
+def test_from_seeds_grand_finals():
+    bracket = Bracket.from_seeds(names(8))
+    final = len(bracket) - 2
+    # Winner of the winners' bracket against the winner of the losers'
+    assert bracket.kinds[final] == (WINNER, WINNER)
+    assert bracket.refs[final] == (6, 12)
+    assert bracket.kinds[-1] == (WINNER, LOSER)
+    assert bracket.refs[-1] == (final, final)
+    assert bracket.resets == [0] * final + [0, 2]
+    assert bracket.winplaces[-1] == 1
+    assert bracket.lossplaces[-1] == 2
+    assert not any(Bracket.from_seeds(names(8), False).resets)
+
+
+def test_from_seeds_losers_bracket():
+    bracket = Bracket.from_seeds(names(8))
+    # Losers of the first round play each other
+    assert [(bracket.kinds[i], bracket.refs[i]) for i in (7, 8)] \
+        == [((LOSER, LOSER), (0, 1)), ((LOSER, LOSER), (2, 3))]
+    # then drop in reverse order to put off rematches
+    assert [(bracket.kinds[i], bracket.refs[i]) for i in (9, 10)] \
+        == [((WINNER, LOSER), (7, 5)), ((WINNER, LOSER), (8, 4))]
+
+
+def check_places(bracket, counts, runs):
+    """
+    Check that every entrant finished exactly once in every run, and that
+    each place was given to as many entrants as it is wide.
+    """
+    bye = len(bracket.names)
+    assert all(sum(row) == runs for row in counts[:bye])
+    assert not any(counts[bye])
+    widths = [after - place for place, after in
+              zip(bracket.places, bracket.places[1:] + [bye + 1])]
+    assert [sum(row[i] for row in counts) for i in range(len(widths))] \
+        == [runs * width for width in widths]
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 6, 8, 13])
+@pytest.mark.parametrize("double", [True, False])
+def test_assign_places(count, double):
+    bracket = Bracket.from_seeds(names(count), double)
+    elos = [1500.0] * count
+    kconsts = [32.0] * count
+    counts = bracket_sim._play_runs(bracket, elos, kconsts, 200,
+                                    random.Random(0), False)
+    check_places(bracket, counts, 200)
+
+
+class FixedRandom:
+    """
+    A generator that always gives the same number, or the same array of
+    numbers, one for each run.
+    """
+
+    def __init__(self, values):
+        self.values = values
+
+    def random(self, size=None):
+        if size is None:
+            return self.values
+        assert len(self.values) == size
+        return self.values
+
+
+@needs_numpy
+@pytest.mark.parametrize("count", [6, 8])
+@pytest.mark.parametrize("double", [True, False])
+@pytest.mark.parametrize("update", [False, True])
+@pytest.mark.parametrize("fixed", [False, True])
+def test_arrays_match_runs(count, double, update, fixed):
+    bracket = Bracket.from_seeds(names(count), double)
+    if fixed:
+        # The fourth seed has already beaten the fifth
+        bracket.fixed[1] = 3
+    elos = [1700.0 - 40 * i for i in range(count)]
+    kconsts = [32.0 + 8 * (i % 3) for i in range(count)]
+    draws = numpy.linspace(0.01, 0.99, 99)
+    counts = bracket_sim._play_arrays(bracket, elos, kconsts, len(draws),
+                                      FixedRandom(draws), update)
+    expected = [[0] * len(bracket.places) for _ in range(count + 1)]
+    for draw in draws:
+        run = bracket_sim._play_runs(bracket, elos, kconsts, 1,
+                                     FixedRandom(float(draw)), update)
+        for row, added in zip(expected, run):
+            for i, n in enumerate(added):
+                row[i] += n
+    assert counts == expected
+    check_places(bracket, counts, len(draws))
+
+
+def test_simulate_does_not_depend_on_jobs(monkeypatch):
+    monkeypatch.setattr(bracket_sim, "CHUNKSIZE", 100)
+    elolist = types.SimpleNamespace(player=lambda name: None)
+    bracket = Bracket.from_seeds(names(6))
+    serial = bracket_sim.simulate(bracket, elolist, 300, jobs=1, seed=3)
+    pooled = bracket_sim.simulate(bracket, elolist, 300, jobs=2, seed=3)
+    assert serial == pooled
+    assert all(sum(places.values()) == pytest.approx(1)
+               for places in serial.values())
+
+
+def test_fetch_tourney(monkeypatch):
+    tournament = {"id": 10, "name": "Weekly"}
+    participants = [{"id": 1, "name": "a", "seed": 1}]
+    challonge = types.ModuleType("challonge")
+    challonge.tournaments = types.SimpleNamespace(
+        show=lambda tourney_id: tournament)
+    challonge.participants = types.SimpleNamespace(
+        index=lambda tourney_id: participants)
+    challonge.matches = types.SimpleNamespace(index=lambda tourney_id: [])
+    monkeypatch.setitem(sys.modules, "challonge", challonge)
+    import seed
+    monkeypatch.setattr(seed, "get_credentials", lambda: ("user", "key"))
+    assert bracket_sim.fetch_tourney("weekly") \
+        == (tournament, participants, [])
@@ -0,0 +1,209 @@
+"""
+Tests of EloList queries: select and filter, saving and loading, and
+reading from the cache.
+"""
+
+import copy
+import pickle
+import random
+
+import pytest
+
+import match_store
+import tourney_cache
+from elo_calculator import EloCalculator
+from elo_list import EloList
+from name_resolver import NameResolver
+from player import Player
+from test_engines import results
+
+KINDS = ("games", "wins", "tournaments", "elo", "rank")
+
+
+@pytest.fixture(scope="module")
+def players(data):
+    calculator = EloCalculator(resolver=NameResolver({}, []))
+    calculator.calculate_data(*data)
+    return calculator.get_elo_list()
+
+
+def elo_list(players):
+    elos = EloList()
+    elos.elolist = list(players)
+    return elos
+
+
+def one_at_a_time(players, criteria):
+    """
+    Apply criteria the slow way, each one to what the last one left.
+    """
+    left = sorted(players, key=lambda x: x.elo, reverse=True)
+    for kind, value in criteria:
+        if kind == "rank":
+            left = left[:value]
+        elif kind == "games":
+            left = [player for player in left if player.played >= value]
+        elif kind == "wins":
+            left = [player for player in left if player.won >= value]
+        elif kind == "tournaments":
+            left = [player for player in left
+                    if len(player.placings) >= value]
+        else:
+            left = [player for player in left if player.elo >= value]
+    return left
+
+
+def random_criteria(rng, players):
+    elos = sorted(player.elo for player in players)
+    values = {
+        "games": lambda: rng.randint(0, 30),
+        "wins": lambda: rng.randint(0, 15),
+        "tournaments": lambda: rng.randint(0, 6),
+        "elo": lambda: rng.choice(elos),
+        "rank": lambda: rng.randint(0, len(players)),
+    }
+    return [(kind, values[kind]()) for kind
+            in rng.choices(KINDS, k=rng.randint(0, 4))]
+
+
+def test_select_matches_one_at_a_time(players):
+    rng = random.Random(0)
+    elos = elo_list(players)
+    for _ in range(300):
+        criteria = random_criteria(rng, players)
+        assert elos.select(*criteria) == one_at_a_time(players, criteria), \
+            criteria
+
+
+def test_filter_matches_select(players):
+    rng = random.Random(1)
+    for _ in range(100):
+        criteria = random_criteria(rng, players)
+        elos = elo_list(players)
+        selected = elos.select(*criteria)
+        elos.filter(*criteria)
+        assert elos.ranked() == selected
+        assert sorted(elos.elolist, key=lambda x: x.id) \
+            == sorted(selected, key=lambda x: x.id)
+        # Filtering only keeps players, it never reorders them
+        order = [player.id for player in players]
+        assert [player.id for player in elos.elolist] \
+            == [pid for pid in order if pid in {p.id for p in selected}]
+
+
+def test_filter_methods_match_select(players):
+    elos = elo_list(players)
+    elos.filter_by_games(5)
+    elos.filter_by_tournaments(2)
+    elos.filter_by_rank(60)
+    elos.filter_by_wins(3)
+    elos.filter_by_elo(1150)
+    criteria = [("games", 5), ("tournaments", 2), ("rank", 60), ("wins", 3),
+                ("elo", 1150)]
+    assert elos.ranked() == elo_list(players).select(*criteria)
+    assert elos.ranked() == one_at_a_time(players, criteria)
+
+
+def test_unknown_criterion(players):
+    with pytest.raises(ValueError):
+        elo_list(players).select(("losses", 3))
+
+
+def test_saved_matrix_only_used_for_same_players(players, tmp_path):
+    paths = {name: str(tmp_path / name) for name in
+             ("players.pkl", "h2h.bin", "history.bin", "snapshot.bin")}
+    elos = elo_list(players)
+    elos.save(paths["players.pkl"], paths["h2h.bin"], paths["history.bin"],
+              paths["snapshot.bin"])
+    loaded = EloList()
+    loaded.load(paths["players.pkl"], paths["h2h.bin"], paths["history.bin"])
+    assert loaded._matrix is not None
+    assert list(loaded.h2h_matrix().wins) == list(elos.h2h_matrix().wins)
+    # Players saved elsewhere, with the same number of players
+    other = str(tmp_path / "other.pkl")
+    elos.roster()[0].won += 1
+    try:
+        elos.save(other, str(tmp_path / "other.bin"), paths["history.bin"],
+                  paths["snapshot.bin"])
+    finally:
+        elos.roster()[0].won -= 1
+    loaded = EloList()
+    loaded.load(other, paths["h2h.bin"], paths["history.bin"])
+    assert loaded._matrix is None
+
+
+def test_stale_match_store_is_not_used(data, tmp_path, monkeypatch):
+    cachedir = str(tmp_path / "cache")
+    storefile = str(tmp_path / "matches.cols")
+    tournaments, participants, all_matches = copy.deepcopy(data)
+    urls = [tournament["url"] for tournament in tournaments]
+    for entry in zip(tournaments, participants, all_matches):
+        tourney_cache.write_entry(entry[0]["url"], entry, cachedir)
+    tourney_cache.write_index(urls, cachedir)
+    match_store.write_store(all_matches, storefile,
+                            [tournament["id"] for tournament in tournaments],
+                            match_store.digest(tournaments))
+    loaded = []
+    load_matches = tourney_cache.load_matches
+
+    def counting(cachedir):
+        loaded.append(cachedir)
+        return load_matches(cachedir)
+
+    monkeypatch.setattr(tourney_cache, "load_matches", counting)
+
+    def from_cache():
+        elos = EloList()
+        elos.calculate_elos_from_cache(cachedir, storefile=storefile)
+        return results(elos.elolist)
+
+    def replayed(data):
+        calculator = EloCalculator()
+        calculator.calculate_data(*data)
+        return results(calculator.get_elo_list())
+
+    assert from_cache() == replayed(data)
+    assert loaded == []
+    # A tournament updated in the cache by a run that stopped before
+    # writing the store
+    tournaments[3]["updated-at"] = tournaments[-1]["updated-at"]
+    match = all_matches[3][0]
+    match["winner-id"], match["loser-id"] = \
+        match["loser-id"], match["winner-id"]
+    tourney_cache.write_entry(urls[3], (tournaments[3], participants[3],
+                                        all_matches[3]), cachedir)
+    assert from_cache() == replayed((tournaments, participants, all_matches))
+    assert loaded == [cachedir]
+
+
+class OldPlayer:
+    """
+    Pickles like a Player saved before players had __slots__.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.elo = Player.DEFAULT_ELO
+        self.won = 0
+        self.played = 0
+        self.placings = []
+        self.h2hwins = {}
+        self.h2hlosses = {}
+
+    def __reduce__(self):
+        return object.__new__, (Player,), self.__dict__
+
+
+def test_old_players_file(players, tmp_path):
+    paths = [str(tmp_path / name) for name in
+             ("players.pkl", "h2h.bin", "history.bin")]
+    with open(paths[0], "wb") as f:
+        pickle.dump([OldPlayer("A"), OldPlayer("B")], f,
+                    pickle.HIGHEST_PROTOCOL)
+    with pytest.raises(ValueError, match="regenerate players.pkl"):
+        EloList().load(*paths)
+    # Players saved now still load
+    elo_list(players).save(*paths, str(tmp_path / "snapshot.bin"))
+    loaded = EloList()
+    loaded.load(*paths)
+    assert results(loaded.elolist) == results(players)
@@ -0,0 +1,105 @@
+"""
+Tests of elotomorrow.py: hypothetical sets applied through a RatingOverlay,
+one scenario at a time and many together, against Player objects.
+"""
+
+import random
+
+import pytest
+
+import elotomorrow
+import name_resolver
+from elo_calculator import EloCalculator
+from elo_list import EloList
+from name_resolver import NameResolver
+from player import Player
+
+numpy = elotomorrow.numpy
+needs_numpy = pytest.mark.skipif(numpy is None, reason="needs numpy")
+SCORES = ("2-0", "2-1", "3-0", "3-1", "3-2", "1-0", "0-2", None, "4-4")
+
+
+@pytest.fixture(scope="module")
+def elos(data):
+    calculator = EloCalculator(resolver=NameResolver({}, []))
+    calculator.calculate_data(*data)
+    elos = EloList()
+    elos.elolist = calculator.get_elo_list()
+    return elos
+
+
+@pytest.fixture(scope="module")
+def scenarios(elos):
+    rng = random.Random(14)
+    names = [player.name for player in elos.elolist] + ["NEWCOMER"]
+    scenarios = []
+    for _ in range(200):
+        # Few players, so most of them play several sets, sometimes
+        # against themselves
+        pool = rng.sample(names, rng.randint(1, 8))
+        scenarios.append([(rng.choice(pool), rng.choice(pool),
+                           rng.choice(SCORES))
+                          for _ in range(rng.randint(0, 12))])
+    return scenarios
+
+
+def replay_objects(elos, results):
+    """
+    Apply sets to copies of the players with calculateWin and
+    calculateLoss, and return the change in elo of each.
+    """
+    copies = {}
+    before = {}
+
+    def copy(name):
+        player = elos.player(name)
+        if player is None:
+            player = Player(name_resolver.resolve(name))
+        if player.name not in copies:
+            copies[player.name] = Player(player.name, len(copies))
+            copies[player.name].elo = player.elo
+            before[player.name] = player.elo
+        return copies[player.name]
+
+    for winner, loser, score in results:
+        winner = copy(winner)
+        loser = copy(loser)
+        match = {"scores-csv": score, "started-at": None}
+        winner.calculateWin(loser, match)
+        loser.calculateLoss(winner, match)
+    return {name: copies[name].elo - before[name] for name in copies}
+
+
+def test_simulate_matches_players(elos, scenarios):
+    for results in scenarios:
+        deltas = elotomorrow.simulate(elos, results)
+        expected = replay_objects(elos, results)
+        assert list(deltas) == list(expected)
+        assert deltas == expected
+
+
+def test_simulate_many_without_numpy(elos, scenarios, monkeypatch):
+    monkeypatch.setattr(elotomorrow, "numpy", None)
+    assert elotomorrow.simulate_many(elos, scenarios) \
+        == [replay_objects(elos, results) for results in scenarios]
+
+
+@needs_numpy
+def test_simulate_many_with_numpy(elos, scenarios):
+    many = elotomorrow.simulate_many(elos, scenarios)
+    assert len(many) == len(scenarios)
+    for deltas, results in zip(many, scenarios):
+        expected = replay_objects(elos, results)
+        # Players in the order they first appear in the scenario
+        assert list(deltas) == list(expected)
+        assert deltas == pytest.approx(expected, abs=1e-9)
+
+
+def test_players_unchanged(elos, scenarios):
+    state = [(player.elo, player.won, player.played)
+             for player in elos.elolist]
+    elotomorrow.simulate_many(elos, scenarios)
+    for results in scenarios[:20]:
+        elotomorrow.simulate(elos, results)
+    assert [(player.elo, player.won, player.played)
+            for player in elos.elolist] == state
@@ -0,0 +1,107 @@
+"""
+Every engine and match order must give the same ratings as a plain replay.
+"""
+
+import copy
+import random
+
+import pytest
+
+import match_store
+import player
+from elo_calculator import EloCalculator
+
+ENGINES = ("object", "array", "parallel")
+ORDERS = ("file", "started", "completed")
+
+
+def results(players):
+    """
+    Return everything a replay decides about each player, by name.
+    """
+    return {player.name: (player.elo, player.won, player.played,
+                          sorted((pid, len(sets)) for pid, sets
+                                 in player.h2hwins.items()),
+                          sorted((pid, len(sets)) for pid, sets
+                                 in player.h2hlosses.items()))
+            for player in players}
+
+
+def replay(data, resolver, engine="object", order="file"):
+    calculator = EloCalculator(engine, resolver=resolver, order=order,
+                               jobs=2)
+    calculator.calculate_data(*data)
+    return results(calculator.get_elo_list())
+
+
+@pytest.fixture(scope="module")
+def shuffled(data):
+    """
+    The synthetic data with the matches of every tournament out of order,
+    so that replaying by time differs from replaying in file order.
+    """
+    rng = random.Random(1)
+    tournaments, participants, all_matches = copy.deepcopy(data)
+    for matches in all_matches:
+        rng.shuffle(matches)
+    return tournaments, participants, all_matches
+
+
+@pytest.mark.parametrize("order", ORDERS)
+@pytest.mark.parametrize("engine", ENGINES[1:])
+def test_engines_agree(shuffled, resolver, engine, order):
+    assert replay(shuffled, resolver, engine, order) \
+        == replay(shuffled, resolver, "object", order)
+
+
+def test_orders_differ_on_shuffled_matches(shuffled, resolver):
+    # Otherwise the test above would not be checking the orders at all
+    assert replay(shuffled, resolver, order="started") \
+        != replay(shuffled, resolver, order="file")
+
+
+@pytest.mark.parametrize("order", ORDERS)
+def test_orders_agree_when_matches_are_in_order(data, resolver, order):
+    assert replay(data, resolver, order=order) == replay(data, resolver)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_match_store(shuffled, resolver, tmp_path, engine):
+    tournaments, participants, all_matches = shuffled
+    storefile = str(tmp_path / "matches.cols")
+    match_store.write_store(all_matches, storefile)
+    store = match_store.MatchStore(storefile)
+    for order in ORDERS:
+        assert replay((tournaments, participants, store), resolver, engine,
+                      order) \
+            == replay(shuffled, resolver, engine, order)
+
+
+def test_match_store_refs(data, tmp_path):
+    tournaments, participants, all_matches = copy.deepcopy(data)
+    # Matches without a time, or with a local one, go through datetimes
+    all_matches[0][0]["started-at"] = None
+    all_matches[0][1]["started-at"] = \
+        all_matches[0][1]["started-at"].replace(tzinfo=None)
+    all_matches[0][2]["scores-csv"] = None
+    storefile = str(tmp_path / "matches.cols")
+    match_store.write_store(all_matches, storefile)
+    store = match_store.MatchStore(storefile)
+    for tournament, matches in zip(store, all_matches):
+        for view, match in zip(tournament, matches):
+            assert store.ref(view.index) == player.match_ref(match)
+
+
+@pytest.mark.parametrize("engine", ("array", "glicko"))
+def test_match_store_history(shuffled, resolver, tmp_path, engine):
+    tournaments, participants, all_matches = shuffled
+    storefile = str(tmp_path / "matches.cols")
+    match_store.write_store(all_matches, storefile)
+    histories = []
+    for matches in (all_matches, match_store.MatchStore(storefile)):
+        calculator = EloCalculator(engine, history=True, resolver=resolver)
+        calculator.calculate_data(tournaments, participants, matches)
+        history = calculator.history
+        histories.append((history.times, history.matches, history.ratings,
+                          results(calculator.get_elo_list())))
+    assert histories[0] == histories[1]
@@ -0,0 +1,75 @@
+"""
+Tests of the Glicko-2 engine, against Glickman's worked example and with
+and without numpy.
+"""
+
+import pytest
+
+import glicko
+from elo_calculator import EloCalculator
+
+numpy = glicko.numpy
+needs_numpy = pytest.mark.skipif(numpy is None, reason="needs numpy")
+
+# Glickman, "Example of the Glicko-2 system": a player rated 1500 with a
+# deviation of 200 beats a 1400 (deviation 30), then loses to a 1550
+# (deviation 100) and to a 1700 (deviation 300)
+RATINGS = [1500, 1400, 1550, 1700]
+DEVIATIONS = [200, 30, 100, 300]
+WINNERS = [0, 2, 3]
+LOSERS = [1, 0, 0]
+
+
+def example():
+    mus = [(rating - 1500) / glicko.SCALE for rating in RATINGS]
+    phis = [deviation / glicko.SCALE for deviation in DEVIATIONS]
+    sigmas = [glicko.DEFAULT_VOLATILITY] * len(RATINGS)
+    return mus, phis, sigmas, WINNERS, LOSERS, [1.0] * 3, [0.0] * 3
+
+
+def check_example(mu, phi, sigma):
+    assert 1500 + mu * glicko.SCALE == pytest.approx(1464.06, abs=0.01)
+    assert phi * glicko.SCALE == pytest.approx(151.52, abs=0.01)
+    assert sigma == pytest.approx(0.05999, abs=1e-5)
+
+
+def test_worked_example():
+    mus, phis, sigmas, *sets = example()
+    rated = glicko._rate_period(dict(enumerate(mus)), dict(enumerate(phis)),
+                                dict(enumerate(sigmas)), *sets)
+    check_example(*rated[0])
+
+
+@needs_numpy
+def test_worked_example_arrays():
+    columns = [numpy.array(column) for column in example()]
+    mus, phis, sigmas = glicko._rate_period_arrays(*columns)
+    check_example(mus[0], phis[0], sigmas[0])
+
+
+def rate(data, resolver, module, monkeypatch):
+    monkeypatch.setattr(glicko, "numpy", module)
+    calculator = EloCalculator("glicko", resolver=resolver)
+    calculator.calculate_data(*data)
+    return calculator
+
+
+@needs_numpy
+def test_arrays_match_one_player_at_a_time(data, resolver, monkeypatch):
+    arrays = rate(data, resolver, numpy, monkeypatch)
+    players = rate(data, resolver, None, monkeypatch)
+    # Sums are added up in a different order, so only rounding differs
+    assert [player.elo for player in arrays.roster] \
+        == pytest.approx([player.elo for player in players.roster],
+                         abs=1e-9)
+    state, expected = arrays.glicko, players.glicko
+    assert list(state.deviations) \
+        == pytest.approx(list(expected.deviations), abs=1e-12)
+    assert list(state.volatilities) \
+        == pytest.approx(list(expected.volatilities), abs=1e-12)
+    assert list(state.last) == list(expected.last)
+    assert state.periods == expected.periods == len(data[0])
+    assert [(player.won, player.played, player.h2hwins, player.h2hlosses)
+            for player in arrays.roster] \
+        == [(player.won, player.played, player.h2hwins, player.h2hlosses)
+            for player in players.roster]
@@ -0,0 +1,112 @@
+"""
+Runs restored from a checkpoint must match replaying everything.
+"""
+
+import copy
+
+import pytest
+
+import player
+from elo_calculator import EloCalculator
+from name_resolver import NameResolver
+from test_engines import results
+
+
+@pytest.fixture
+def replayed(monkeypatch):
+    """
+    List of the number of tournaments each calculate_data call replayed.
+    """
+    counts = []
+    calculate_data = EloCalculator.calculate_data
+
+    def counting(self, tournaments, participants, all_matches):
+        counts.append(len(tournaments))
+        calculate_data(self, tournaments, participants, all_matches)
+
+    monkeypatch.setattr(EloCalculator, "calculate_data", counting)
+    return counts
+
+
+def head(data, count):
+    return tuple(column[:count] for column in data)
+
+
+def incremental(data, resolver, checkpointfile, engine="object",
+                order="file"):
+    calculator = EloCalculator(engine, resolver=resolver, order=order,
+                               jobs=2)
+    calculator.calculate_incremental(*data, checkpointfile=checkpointfile)
+    return results(calculator.get_elo_list())
+
+
+def full(data, resolver, engine="object", order="file"):
+    calculator = EloCalculator(engine, resolver=resolver, order=order)
+    calculator.calculate_data(*data)
+    return results(calculator.get_elo_list())
+
+
+@pytest.mark.parametrize("order", ("file", "started", "completed"))
+@pytest.mark.parametrize("engine", ("object", "array", "parallel"))
+def test_new_tournaments(data, resolver, tmp_path, replayed, engine, order):
+    checkpointfile = str(tmp_path / "checkpoint.pkl")
+    incremental(head(data, 10), resolver, checkpointfile, engine, order)
+    incremental(head(data, 17), resolver, checkpointfile, engine, order)
+    after = incremental(data, resolver, checkpointfile, engine, order)
+    assert replayed[:3] == [10, 7, 7]
+    assert after == full(data, resolver, engine, order)
+
+
+def test_nothing_new(data, resolver, tmp_path, replayed):
+    checkpointfile = str(tmp_path / "checkpoint.pkl")
+    incremental(data, resolver, checkpointfile)
+    assert incremental(data, resolver, checkpointfile) \
+        == full(data, resolver)
+    assert replayed[:2] == [len(data[0]), 0]
+
+
+def test_updated_tournament(data, resolver, tmp_path, replayed):
+    checkpointfile = str(tmp_path / "checkpoint.pkl")
+    incremental(head(data, 12), resolver, checkpointfile)
+    tournaments, participants, all_matches = copy.deepcopy(data)
+    # A set reported late in an early tournament
+    tournaments[3]["updated-at"] = tournaments[-1]["updated-at"]
+    match = all_matches[3][0]
+    match["winner-id"], match["loser-id"] = \
+        match["loser-id"], match["winner-id"]
+    changed = (tournaments, participants, all_matches)
+    after = incremental(changed, resolver, checkpointfile)
+    assert replayed[:2] == [12, len(tournaments)]
+    assert after == full(changed, resolver)
+    assert after != full(data, resolver)
+
+
+def test_earlier_matches(data, resolver, tmp_path, replayed):
+    # Replayed by time, a new tournament with matches before the latest
+    # one in the checkpoint means replaying everything
+    checkpointfile = str(tmp_path / "checkpoint.pkl")
+    incremental(head(data, 12), resolver, checkpointfile, order="started")
+    early = tuple(column[:12] + copy.deepcopy(column[12:13])
+                  for column in data)
+    for match in early[2][12]:
+        match["started-at"] = match["started-at"].replace(
+            year=match["started-at"].year - 1)
+    after = incremental(early, resolver, checkpointfile, order="started")
+    assert replayed[:2] == [12, 13]
+    assert after == full(early, resolver, order="started")
+
+
+def test_changed_aliases(data, resolver, tmp_path, replayed):
+    checkpointfile = str(tmp_path / "checkpoint.pkl")
+    incremental(head(data, 12), resolver, checkpointfile)
+    merged = NameResolver({"PLAYER 1": "PLAYER 2"}, [])
+    assert incremental(data, merged, checkpointfile) == full(data, merged)
+    assert replayed[:2] == [12, len(data[0])]
+
+
+def test_changed_kfactor(data, resolver, tmp_path, replayed, monkeypatch):
+    checkpointfile = str(tmp_path / "checkpoint.pkl")
+    incremental(head(data, 12), resolver, checkpointfile)
+    monkeypatch.setattr(player, "KFACTOR", player.KFACTOR * 2)
+    assert incremental(data, resolver, checkpointfile) == full(data, resolver)
+    assert replayed[:2] == [12, len(data[0])]
@@ -0,0 +1,79 @@
+"""
+Tests of the phases and counters calculate_elos.py records with --metrics.
+"""
+
+import copy
+import os
+
+import pytest
+
+import calculate_elos
+import elo_list
+import metrics
+import synthetic
+from elo_calculator import EloCalculator
+from player import classify_score
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    # Turned off again afterwards, so other tests aren't recorded
+    monkeypatch.setattr(metrics, "_enabled", False)
+    metrics.enable()
+
+
+def test_run_records_phases_and_counters(data, tmp_path, monkeypatch,
+                                         enabled):
+    data = copy.deepcopy(data)
+    # A set that was never played and one with a score that isn't counted
+    data[2][0][0]["winner-id"] = data[2][0][0]["loser-id"] = None
+    data[2][1][0]["scores-csv"] = "9-9"
+    synthetic.write(data, str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(elo_list, "SCRIPTDIR", str(tmp_path))
+    calculate_elos.run([("-g", "3")], outputs=("elos", "summaries"),
+                       jobs=1)
+    report = metrics.report()
+    phases = report["phases"]
+    for name in ("unpickle", "read_tournaments", "read_participants",
+                 "read_matches", "calculate", "filter", "write_outputs",
+                 "write elos", "write summaries"):
+        assert phases[name]["calls"] >= 1
+        assert phases[name]["wall"] >= 0
+        assert phases[name]["cpu"] >= 0
+    for name in ("calculate", "filter", "write_outputs"):
+        assert phases[name]["calls"] == 1
+    # Only asked for elos and summaries
+    assert "h2h_matrix" not in phases
+    assert "write players" not in phases
+
+    tournaments, participants, all_matches = data
+    matches = [match for tournament in all_matches for match in tournament]
+    played = [match for match in matches if match["winner-id"] is not None]
+    calculator = EloCalculator()
+    calculator.calculate_data(*data)
+    players = calculator.get_elo_list()
+    assert report["counters"] == {
+        "participants read": sum(map(len, participants)),
+        "players created": len(calculator.roster),
+        "alias hits": 0,
+        "matches read": len(matches),
+        "matches without a winner": len(matches) - len(played),
+        "matches with an unrecognized score": sum(
+            classify_score(match["scores-csv"]) is None for match in played),
+        "players": len(players),
+        "players after filtering": sum(player.played >= 3
+                                       for player in players),
+    }
+    assert report["counters"]["matches without a winner"] == 1
+    assert report["counters"]["matches with an unrecognized score"] >= 1
+    assert os.path.exists(os.path.join("output", "elos.txt"))
+    assert os.path.exists(os.path.join("output", "summaries.txt"))
+
+
+def test_disabled():
+    assert not metrics.enabled()
+    with metrics.phase("nothing"):
+        metrics.count("nothing")
+    assert "nothing" not in metrics.report()["phases"]
+    assert "nothing" not in metrics.report()["counters"]
@@ -0,0 +1,85 @@
+"""
+Tests of resolving display names to player names.
+"""
+
+import sys
+import types
+
+import pytest
+
+import name_resolver
+
+
+def test_missing_aliases_file_is_reported(monkeypatch, capsys):
+    # None in sys.modules makes importing it fail
+    monkeypatch.setitem(sys.modules, "aliases", None)
+    assert name_resolver.load_aliases() == ({}, None)
+    assert "aliases.py was not found" in capsys.readouterr().err
+
+
+def test_aliases_file(monkeypatch, capsys):
+    aliases = types.ModuleType("aliases")
+    aliases.aliases = {"JEREMY LEFURGE": "NERFAN"}
+    monkeypatch.setitem(sys.modules, "aliases", aliases)
+    assert name_resolver.load_aliases() == (aliases.aliases, None)
+    aliases.patterns = [("^NERF", "NERFAN")]
+    assert name_resolver.load_aliases() == (aliases.aliases,
+                                            aliases.patterns)
+    assert capsys.readouterr().err == ""
+
+
+def baseline(displayname, aliases):
+    """
+    Resolve a name the way elo_calculator.py first did: one alias, then
+    every name containing JUSTIN is JUSTIN.
+    """
+    name = displayname.upper()
+    if name in aliases:
+        name = aliases[name]
+    if "JUSTIN" in name:
+        name = "JUSTIN"
+    return name
+
+
+def test_matches_baseline_without_chains():
+    aliases = {"JEREMY LEFURGE": "NERFAN", "JUSTIN TIME": "JT",
+               "NERF": "JUSTIN", "OLD": "JUSTINE", "JT2": "JT"}
+    resolver = name_resolver.NameResolver(aliases)
+    for name in ("Jeremy Lefurge", "Justin Time", "justin", "Nerf", "old",
+                 "jt2", "JT", "NERFAN", "somebody", "Ajustin"):
+        assert resolver.resolve(name) == baseline(name, aliases), name
+
+
+def test_pattern_targets_are_not_aliased():
+    resolver = name_resolver.NameResolver({"NERFAN": "NERF"},
+                                          [("^NERF", "NERFAN")])
+    # NERFAN is an alias, then the rule matches what it became
+    assert resolver.resolve("nerfan") == "NERFAN"
+    assert resolver.resolve("Nerf Herder") == "NERFAN"
+
+
+def test_chained_aliases():
+    resolver = name_resolver.NameResolver({"A": "B", "B": "C", "C": "D",
+                                           "E": "C"}, [])
+    assert [resolver.resolve(name) for name in "ABCDE"] == list("DDDDD")
+
+
+def test_self_aliases():
+    resolver = name_resolver.NameResolver({"A": "A", "B": "A", "C": "C",
+                                           "D": "C"}, [])
+    assert resolver.aliases == {"B": "A", "D": "C"}
+    assert [resolver.resolve(name) for name in "ABCD"] == list("AACC")
+
+
+def test_self_alias_ends_a_chain():
+    resolver = name_resolver.NameResolver({"A": "B", "B": "B"}, [])
+    assert resolver.resolve("A") == resolver.resolve("B") == "B"
+
+
+@pytest.mark.parametrize("aliases", [{"A": "B", "B": "A"},
+                                     {"A": "B", "B": "C", "C": "A"},
+                                     {"X": "A", "A": "B", "B": "C",
+                                      "C": "A"}])
+def test_cycles_are_refused(aliases):
+    with pytest.raises(ValueError, match="cycle"):
+        name_resolver.NameResolver(aliases, [])
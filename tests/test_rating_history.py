@@ -0,0 +1,102 @@
+"""
+Tests of the rating history: how changes are timed, saving and loading,
+and looking ratings up against replaying the matches up to that time.
+"""
+
+import math
+from datetime import timedelta
+
+import pytest
+
+from elo_calculator import EloCalculator
+from elo_list import EloList
+from name_resolver import NameResolver
+from rating_history import RatingHistory, to_time
+from test_incremental import head
+
+
+def test_times_never_go_back():
+    history = RatingHistory()
+    history.record_match(0, 1510, 1, 1490, 100.0, 0)
+    # Started earlier than player 0's last change, but not player 2's
+    history.record_match(2, 1520, 0, 1500, 50.0, 1)
+    assert history.series(0) == [(100.0, 0, 1510), (100.0, 1, 1500)]
+    assert history.series(2) == [(50.0, 1, 1520)]
+    assert history.rating_at(0, 99.0) is None
+    assert history.rating_at(0, 100.0) == 1500
+
+
+def test_undated_matches_inherit_last_time():
+    history = RatingHistory()
+    # Nothing dated yet, so from the start of time
+    history.record_match(0, 1510, 1, 1490, None, 0)
+    assert history.series(1) == [(-math.inf, 0, 1490)]
+    history.record_match(0, 1520, 2, 1480, "2017-01-07T18:00:00-05:00", 1)
+    history.record_match(1, 1500, 2, 1470, None, 2)
+    when = to_time("2017-01-07T18:00:00-05:00")
+    assert history.last == when
+    assert history.series(2) == [(when, 1, 1480), (when, 2, 1470)]
+    assert history.rating_at(1, when - 1) == 1490
+    assert history.rating_at(1, when) == 1500
+
+
+def test_to_time():
+    assert math.isnan(to_time(None))
+    assert to_time(12) == 12.0
+    # A date means the end of that day
+    end = to_time("2017-01-07")
+    assert to_time("2017-01-07T23:59:59") < end < to_time("2017-01-08T00:00")
+
+
+@pytest.fixture(scope="module")
+def rated(data):
+    calculator = EloCalculator("array", history=True,
+                               resolver=NameResolver({}, []))
+    calculator.calculate_data(*data)
+    elos = EloList()
+    elos.elolist = calculator.get_elo_list()
+    elos.history = calculator.history
+    return elos
+
+
+def test_save_and_load(rated, tmp_path):
+    path = str(tmp_path / "history.bin")
+    history = rated.history
+    history.save(path)
+    loaded = RatingHistory.load(path)
+    assert len(loaded) == len(history)
+    assert loaded.times == history.times
+    assert loaded.matches == history.matches
+    assert loaded.ratings == history.ratings
+    assert loaded.last == max(times[-1] for times in history.times if times)
+    (tmp_path / "other.bin").write_bytes(b"CEHIST00" + bytes(16))
+    with pytest.raises(ValueError):
+        RatingHistory.load(str(tmp_path / "other.bin"))
+
+
+@pytest.mark.parametrize("count", [1, 5, 12, 23])
+def test_lookups_match_replaying(data, rated, count):
+    # Tournaments are a week apart and take a few hours, so everything up
+    # to the start of the next one is every match of the first count
+    when = data[0][count]["started-at"] - timedelta(seconds=1)
+    calculator = EloCalculator("array", resolver=NameResolver({}, []))
+    calculator.calculate_data(*head(data, count))
+    expected = {player.name: player.elo for player in
+                calculator.get_elo_list() if player.played}
+    assert {player.name: rated.rating_at(player.name, when)
+            for player in rated.elolist
+            if rated.rating_at(player.name, when) is not None} == expected
+    assert [(player.name, elo) for player, elo in
+            rated.leaderboard_as_of(when)] \
+        == sorted(expected.items(), key=lambda x: x[1], reverse=True)
+
+
+def test_lookups_after_everything(rated):
+    assert [(player, elo) for player, elo in
+            rated.leaderboard_as_of("2100-01-01")] \
+        == [(player, player.elo) for player in rated.ranked()
+            if player.played]
+    player = rated.ranked()[0]
+    assert rated.rating_at(player.name, 2 ** 40) == player.elo
+    assert rated.rating_at(player.name, "2000-01-01") is None
+    assert rated.rating_at("NOBODY", "2100-01-01") is None
@@ -0,0 +1,146 @@
+"""
+Tests of ratings_server.py, served on a local port.
+"""
+
+import threading
+
+import pytest
+import requests
+
+import ratings_server
+from elo_calculator import EloCalculator
+from elo_list import EloList
+from elotomorrow import eloTomorrow
+from name_resolver import NameResolver
+
+
+def save(elos, directory):
+    """
+    Save players and everything saved with them into a directory.
+
+    Returns:
+        str: path of the players file
+    """
+    playersfile = str(directory / "players.pkl")
+    elos.save(playersfile, str(directory / "h2h.bin"),
+              str(directory / "history.bin"), str(directory / "snapshot.bin"))
+    return playersfile
+
+
+@pytest.fixture(scope="module")
+def elos(data):
+    calculator = EloCalculator(resolver=NameResolver({}, []))
+    calculator.calculate_data(*data)
+    elos = EloList()
+    elos.elolist = calculator.get_elo_list()
+    return elos
+
+
+@pytest.fixture
+def served(elos, tmp_path):
+    """
+    A service for saved players, and the URL of a server answering for it.
+    """
+    service = ratings_server.RatingsService(save(elos, tmp_path))
+    server = ratings_server.make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever,
+                              kwargs={"poll_interval": 0.01}, daemon=True)
+    thread.start()
+    yield service, "http://127.0.0.1:%d" % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def test_leaderboard(served, elos):
+    service, url = served
+    answer = requests.get(url + "/leaderboard",
+                          params={"start": 5, "count": 10})
+    assert answer.status_code == 200
+    body = answer.json()
+    ranked = elos.ranked()
+    assert body["total"] == len(ranked)
+    assert [(row["rank"], row["name"], row["elo"])
+            for row in body["players"]] \
+        == [(rank, player.name, player.elo)
+            for rank, player in enumerate(ranked[5:15], 6)]
+
+
+def test_player_summary_matches_saved_summaries(served, elos):
+    service, url = served
+    for player in elos.ranked()[:20]:
+        answer = requests.get(url + "/player",
+                              params={"name": player.name.lower()})
+        assert answer.status_code == 200
+        # Opponents in the order they were first played, not by id
+        assert answer.text == player.summary()
+
+
+def test_h2h_whatif_and_seed(served, elos):
+    service, url = served
+    first, second = elos.ranked()[:2]
+    answer = requests.get(url + "/h2h", params={"player": first.name,
+                                                 "opponent": second.name})
+    assert answer.text == first.h2h_details(second)
+    answer = requests.get(url + "/whatif", params={
+        "winner": second.name, "loser": first.name, "score": "2-1"})
+    after = eloTomorrow(second, first, "2-1")
+    body = answer.json()
+    assert (body["winner"]["after"], body["loser"]["after"]) \
+        == pytest.approx(after)
+    names = [player.name for player in elos.ranked()[10::-3]] + ["NOBODY"]
+    answer = requests.get(url + "/seed", params={"names": ",".join(names)})
+    assert answer.json() == elos.seed_order(names)
+
+
+@pytest.mark.parametrize("path, params, status", [
+    ("/player", {"name": "NOBODY"}, 404),
+    ("/player", {}, 400),
+    ("/leaderboard", {"count": "many"}, 400),
+    ("/whatif", {"winner": "{}", "loser": "{}", "score": "3-3"}, 400),
+    ("/nothing", {}, 404),
+])
+def test_bad_queries(served, elos, path, params, status):
+    service, url = served
+    name = elos.ranked()[0].name
+    params = {key: value.format(name) for key, value in params.items()}
+    answer = requests.get(url + path, params=params)
+    assert answer.status_code == status
+    assert "error" in answer.json()
+
+
+def test_responses_cached_per_generation(served, elos, tmp_path):
+    service, url = served
+    name = elos.ranked()[0].name
+    service.query("/player", {"name": name})
+    service.query("/player", {"name": name})
+    assert service.render.cache_info().hits == 1
+    # Players saved again with a different elo are served after a reload
+    changed = EloList()
+    changed.load(str(tmp_path / "players.pkl"), str(tmp_path / "h2h.bin"),
+                 str(tmp_path / "history.bin"))
+    changed.player(name).elo += 100
+    save(changed, tmp_path)
+    assert service.reload()["generation"] == 2
+    assert service.render.cache_info().currsize == 0
+    ctype, body = service.query("/leaderboard", {"count": "1"})
+    assert b'"elo": %r' % (elos.ranked()[0].elo + 100) in body
+
+
+def test_reload_only_by_post(served):
+    service, url = served
+    assert requests.get(url + "/reload").status_code == 405
+    assert requests.post(url + "/leaderboard").status_code == 405
+    answer = requests.post(url + "/reload")
+    assert answer.status_code == 200
+    assert answer.json()["generation"] == service.generation == 2
+
+
+def test_failed_reload_keeps_serving(served, tmp_path):
+    service, url = served
+    before = requests.get(url + "/leaderboard").json()
+    (tmp_path / "players.pkl").write_bytes(b"not a pickle")
+    answer = requests.post(url + "/reload")
+    assert answer.status_code == 500
+    assert "error" in answer.json()
+    assert service.generation == 1
+    assert requests.get(url + "/leaderboard").json() == before
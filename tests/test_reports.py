@@ -0,0 +1,132 @@
+"""
+Tests of the text reports: streamed to files, plain or gzip compressed,
+they must be byte for byte what building the whole string gave.
+"""
+
+import gzip
+
+import pytest
+
+from elo_calculator import EloCalculator
+from elo_list import EloList
+from name_resolver import NameResolver
+from player import NOTABLEELO
+
+
+@pytest.fixture(scope="module")
+def elos(data):
+    calculator = EloCalculator(resolver=NameResolver({}, []))
+    calculator.calculate_data(*data)
+    elos = EloList()
+    elos.elolist = calculator.get_elo_list()
+    return elos
+
+
+# The reports as they were built before they were streamed, one string
+# at a time, reading the records as they are kept now
+
+def elos_string(elos):
+    this = "    NAME                  ELO    W    G     W/G     AVG\n"
+    rank = 1
+    for player in sorted(elos.elolist, key=lambda x: x.elo, reverse=True):
+        this += "{:>3d}".format(rank) + " " + str(player) + "\n"
+        rank += 1
+    return this
+
+
+def summary_string(player):
+    string = "Player: " + player.name + "\n"
+    string += "Placings:\n"
+    for placing in player.placings:
+        string += "\t" + str(placing) + "\n"
+    string += "Notable wins:  "
+    for pid in player.h2hwins:
+        if player.opponent(pid).elo >= player.elo + NOTABLEELO:
+            string += player.opponent(pid).name + ", "
+    string = string[:-2] + "\n"
+    string += "Notable losses:  "
+    for pid in player.h2hlosses:
+        if player.opponent(pid).elo <= player.elo + NOTABLEELO:
+            string += player.opponent(pid).name + ", "
+    string = string[:-2] + "\n"
+    return string
+
+
+def h2h_list_string(player):
+    string = player.name + "'s head-to-head records:\n"
+    for pid in player.h2hwins:
+        string += "{:20s}".format(player.opponent(pid).name)
+        string += ": " + str(len(player.h2hwins[pid])) + "-"
+        if pid in player.h2hlosses:
+            string += str(len(player.h2hlosses[pid]))
+        else:
+            string += "0"
+        string += "\n"
+    for pid in player.h2hlosses:
+        if pid not in player.h2hwins:
+            string += "{:20s}".format(player.opponent(pid).name)
+            string += ": 0-" + str(len(player.h2hlosses[pid]))
+            string += "\n"
+    return string
+
+
+def h2h_details_string(player, other):
+    if not (other.id in player.h2hwins or other.id in player.h2hlosses):
+        return "No matches against " + other.name + " recorded."
+    string = player.name + "'s detailed head-to-head against " \
+        + other.name + ":\n"
+    string += "Wins:\n"
+    for date, score in player.h2hwins.get(other.id, ()):
+        string += date + ": " + str(score) + "\n"
+    string += "Losses:\n"
+    for date, score in player.h2hlosses.get(other.id, ()):
+        string += date + ": " + str(score) + "\n"
+    return string
+
+
+def written(string, path):
+    """
+    Write a string the way the reports used to be, and read the bytes.
+    """
+    with open(path, "w", newline="\r\n") as f:
+        f.write(string)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def read(path):
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("suffix", ["", ".gz"])
+def test_write_elos(elos, tmp_path, suffix):
+    path = tmp_path / ("elos.txt" + suffix)
+    elos.write_elos(str(path))
+    assert read(path) \
+        == written(elos_string(elos), tmp_path / "expected.txt")
+    assert str(elos) == elos_string(elos)
+
+
+@pytest.mark.parametrize("suffix", ["", ".gz"])
+def test_save_summaries(elos, tmp_path, suffix):
+    path = tmp_path / ("summaries.txt" + suffix)
+    elos.save_summaries(str(path))
+    expected = "".join(summary_string(player) + "\n" for player in
+                       sorted(elos.elolist, key=lambda x: x.elo,
+                              reverse=True))
+    assert read(path) == written(expected, tmp_path / "expected.txt")
+    if suffix:
+        # Compressed for real, not just renamed
+        assert read(path) != path.read_bytes()
+
+
+def test_player_strings(elos):
+    players = elos.ranked()
+    for player in players:
+        assert player.summary() == summary_string(player)
+        assert player.h2h_list() == h2h_list_string(player)
+        for other in players[:10]:
+            assert player.h2h_details(other) \
+                == h2h_details_string(player, other)
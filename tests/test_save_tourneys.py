@@ -0,0 +1,207 @@
+"""
+Tests of fetching and refreshing tournaments in save_tourneys.py.
+
+save_tourneys.py talks to Challonge through the challonge module, which is
+replaced here by a fake one answering from synthetic tournaments and
+counting every request. tournamentlist.py and set_credentials.py are
+replaced too, so nothing is downloaded and no credentials are asked for.
+"""
+
+import copy
+import importlib
+import os
+import pickle
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+import match_store
+import tourney_cache
+
+
+class FakeChallonge:
+    """
+    Answer the calls save_tourneys.py makes, like the challonge module.
+
+    Fields include:
+    tournaments     dict (url to tournament json object)
+    participants    dict (tournament id to participant json objects)
+    matches         dict (tournament id to match json objects)
+    requests        list of tuples: (call, argument) of every request
+    delay           float (seconds every request takes)
+    """
+
+    def __init__(self, data):
+        tournaments, participants, all_matches = copy.deepcopy(data)
+        self.tournaments = {t["url"]: t for t in tournaments}
+        self.participants = {t["id"]: p
+                             for t, p in zip(tournaments, participants)}
+        self.matches = {t["id"]: m for t, m in zip(tournaments, all_matches)}
+        self.requests = []
+        self.delay = 0
+        self.lock = threading.Lock()
+        self.busy = 0
+        self.most_busy = 0
+
+    def module(self):
+        """
+        Return a module standing in for challonge.
+        """
+        challonge = types.ModuleType("challonge")
+        challonge.set_credentials = lambda username, apikey: None
+        challonge.tournaments = types.SimpleNamespace(
+            show=lambda url: self.request("show", url, self.tournaments))
+        challonge.participants = types.SimpleNamespace(
+            index=lambda tid: self.request("participants", tid,
+                                           self.participants))
+        challonge.matches = types.SimpleNamespace(
+            index=lambda tid: self.request("matches", tid, self.matches))
+        return challonge
+
+    def request(self, call, key, table):
+        with self.lock:
+            self.requests.append((call, key))
+            self.busy += 1
+            self.most_busy = max(self.most_busy, self.busy)
+        time.sleep(self.delay)
+        with self.lock:
+            self.busy -= 1
+        # A fresh copy every time, as if it had been downloaded
+        return copy.deepcopy(table[key])
+
+    def calls(self, call):
+        return [key for name, key in self.requests if name == call]
+
+
+@pytest.fixture
+def server(data):
+    return FakeChallonge(data)
+
+
+@pytest.fixture
+def save_tourneys(server, monkeypatch, tmp_path):
+    """
+    save_tourneys imported against the fake server, run in a directory of
+    its own.
+    """
+    tournamentlist = types.ModuleType("tournamentlist")
+    tournamentlist.tourneys = list(server.tournaments)
+    monkeypatch.setitem(sys.modules, "challonge", server.module())
+    monkeypatch.setitem(sys.modules, "tournamentlist", tournamentlist)
+    monkeypatch.setitem(sys.modules, "set_credentials",
+                        types.ModuleType("set_credentials"))
+    # Imported again every time, since it keeps what it saved in globals
+    monkeypatch.delitem(sys.modules, "save_tourneys", raising=False)
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("obj")
+    yield importlib.import_module("save_tourneys")
+    sys.modules.pop("save_tourneys", None)
+
+
+def saved():
+    data = []
+    for name in ("tournaments", "participants", "matches"):
+        with open(os.path.join("obj", name + ".pkl"), "rb") as f:
+            data.append(pickle.load(f))
+    return tuple(data)
+
+
+def run(save_tourneys, jobs=1, refresh=False):
+    """
+    Run save_tourneys.py again, as a new process would.
+    """
+    module = importlib.reload(save_tourneys)
+    module.main(jobs=jobs, refresh=refresh)
+    return saved()
+
+
+def test_fetch_all_keeps_order(save_tourneys, server, data):
+    server.delay = 0.01
+    urls = list(server.tournaments)
+    fetched = save_tourneys.fetch_all(urls, jobs=4)
+    assert [entry[0] for entry in fetched] == data[0]
+    assert [entry[1] for entry in fetched] == data[1]
+    assert [entry[2] for entry in fetched] == data[2]
+    assert 1 < server.most_busy <= 4
+    assert fetched == save_tourneys.fetch_all(urls, jobs=1)
+
+
+def test_rate_limit(save_tourneys, server):
+    urls = list(server.tournaments)[:5]
+    start = time.monotonic()
+    save_tourneys.fetch_all(urls, jobs=3, rate=50)
+    # 15 requests, at most 50 a second, the first one straight away
+    assert time.monotonic() - start >= 14 / 50
+
+
+def test_fetch_and_save(save_tourneys, server, data):
+    assert run(save_tourneys, jobs=4) == data
+    assert len(server.calls("show")) == len(data[0])
+    assert len(server.calls("matches")) == len(data[0])
+    store = match_store.MatchStore(match_store.STOREFILE)
+    assert list(store.tournament_ids) == [t["id"] for t in data[0]]
+    assert store.digest == match_store.digest(data[0])
+    assert [[match["id"] for match in matches] for matches in store] \
+        == [[match["id"] for match in matches] for matches in data[2]]
+    assert tourney_cache.load_all() == data
+
+
+def test_unchanged_tournaments_come_from_the_cache(save_tourneys, server,
+                                                   data):
+    run(save_tourneys, jobs=4)
+    server.requests.clear()
+    assert run(save_tourneys, jobs=4) == data
+    # Only the tournaments themselves are fetched, to check for changes
+    assert len(server.calls("show")) == len(data[0])
+    assert server.calls("participants") == []
+    assert server.calls("matches") == []
+
+
+def test_changed_tournament_is_fetched_again(save_tourneys, server, data):
+    run(save_tourneys)
+    url = data[0][5]["url"]
+    tournament = server.tournaments[url]
+    server.matches[tournament["id"]][0]["scores-csv"] = "9-8"
+    tournament["updated-at"] = data[0][-1]["updated-at"]
+    server.requests.clear()
+    tournaments, participants, all_matches = run(save_tourneys)
+    assert server.calls("matches") == [tournament["id"]]
+    assert tournaments[5] == tournament
+    assert all_matches[5][0]["scores-csv"] == "9-8"
+    assert all_matches[:5] == data[2][:5]
+    assert all_matches[6:] == data[2][6:]
+
+
+def test_refresh_fetches_everything(save_tourneys, server, data):
+    run(save_tourneys)
+    # A change the cache cannot notice, since updated-at is the same
+    tournament = data[0][2]
+    server.matches[tournament["id"]][0]["scores-csv"] = "9-8"
+    assert run(save_tourneys)[2][2][0]["scores-csv"] \
+        == data[2][2][0]["scores-csv"]
+    server.requests.clear()
+    all_matches = run(save_tourneys, jobs=2, refresh=True)[2]
+    assert len(server.calls("matches")) == len(data[0])
+    assert all_matches[2][0]["scores-csv"] == "9-8"
+    # And the cache was refreshed too
+    server.requests.clear()
+    assert run(save_tourneys)[2][2][0]["scores-csv"] == "9-8"
+    assert server.calls("matches") == []
+
+
+def test_interrupted_run_resumes(save_tourneys, server, data):
+    # A failure half way still leaves the tournaments fetched before it
+    # in the cache
+    failing = data[0][10]["url"]
+    tournaments = server.tournaments
+    server.tournaments = {url: tournament for url, tournament
+                          in tournaments.items() if url != failing}
+    with pytest.raises(KeyError):
+        run(save_tourneys)
+    server.tournaments = tournaments
+    server.requests.clear()
+    assert run(save_tourneys) == data
+    assert len(server.calls("matches")) == len(data[0]) - 10
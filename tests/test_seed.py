@@ -0,0 +1,233 @@
+"""
+Tests of seed.py, against a fake Challonge server on a local port.
+"""
+
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+import requests
+
+import seed
+from elo_calculator import EloCalculator
+from elo_list import EloList
+from name_resolver import NameResolver
+
+CREDENTIALS = ("user", "key")
+
+
+def apply_updates(current, updates):
+    """
+    Move participants the way Challonge does, shifting the others.
+    """
+    current = list(current)
+    for pid, position in updates:
+        current.remove(pid)
+        current.insert(position - 1, pid)
+    return current
+
+
+class FakeChallonge(ThreadingHTTPServer):
+    """
+    Serve the participants endpoints of the Challonge API.
+
+    Fields include:
+    tournaments     dict (tournament id to participant json objects)
+    requests        list of tuples: (method, path) of every request
+    failures        int (number of requests still to answer with 503)
+    """
+
+    daemon_threads = True
+
+    def __init__(self, tournaments):
+        super().__init__(("127.0.0.1", 0), FakeHandler)
+        self.tournaments = tournaments
+        self.requests = []
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d/v1" % self.server_address[1]
+
+    def seeds(self, tourney_id):
+        """
+        Return the participant ids of a tournament by seed.
+        """
+        participants = sorted(self.tournaments[tourney_id],
+                              key=lambda x: x["seed"])
+        return [participant["id"] for participant in participants]
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        parts = self.start("GET")
+        if parts is None:
+            return
+        if len(parts) != 4 or parts[3] != "participants.json" \
+                or parts[2] not in self.server.tournaments:
+            self.reply(404, {"errors": ["Not found"]})
+            return
+        self.reply(200, [{"participant": participant} for participant
+                         in self.server.tournaments[parts[2]]])
+
+    def do_PUT(self):
+        parts = self.start("PUT")
+        if parts is None:
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qs(self.rfile.read(length).decode("utf-8"))
+        participants = self.server.tournaments.get(parts[2], [])
+        pid = parts[-1][:-len(".json")]
+        moved = [p for p in participants if str(p["id"]) == pid]
+        if len(parts) != 5 or not moved:
+            self.reply(404, {"errors": ["Not found"]})
+            return
+        with self.server.lock:
+            order = apply_updates(
+                self.server.seeds(parts[2]),
+                [(moved[0]["id"], int(form["participant[seed]"][0]))])
+            for participant in participants:
+                participant["seed"] = order.index(participant["id"]) + 1
+        self.reply(200, {"participant": moved[0]})
+
+    def start(self, method):
+        """
+        Record a request and check it, returning the parts of its path.
+        """
+        with self.server.lock:
+            self.server.requests.append((method, self.path))
+            failing = self.server.failures > 0
+            self.server.failures -= failing
+        if failing:
+            self.reply(503, {"errors": ["Overloaded"]})
+            return None
+        if self.headers.get("Authorization") is None:
+            self.reply(401, {"errors": ["Unauthorized"]})
+            return None
+        return self.path.split("?")[0].split("/")[1:]
+
+    def reply(self, status, obj):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def elos(data):
+    calculator = EloCalculator(resolver=NameResolver({}, []))
+    calculator.calculate_data(*data)
+    elos = EloList()
+    elos.elolist = calculator.get_elo_list()
+    return elos
+
+
+@pytest.fixture
+def server(data):
+    """
+    A fake server with three tournaments of synthetic players, seeded in
+    a random order, with a newcomer nobody has an elo for.
+    """
+    rng = random.Random(2)
+    tournaments = {}
+    for number, participants in enumerate(data[1][:3]):
+        names = [participant["name"] for participant in participants]
+        names.insert(rng.randrange(len(names)), "NEWCOMER %d" % number)
+        rng.shuffle(names)
+        tournaments["pool%d" % number] = [
+            {"id": 500 + 100 * number + i, "name": name, "seed": i + 1}
+            for i, name in enumerate(names)]
+    server = FakeChallonge(tournaments)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def expected(server, elos, tourney_id):
+    participants = sorted(server.tournaments[tourney_id],
+                          key=lambda x: x["seed"])
+    return [participant["id"] for participant
+            in elos.seed_order(participants, lambda x: x["name"])]
+
+
+def test_seed_updates_reach_the_desired_order():
+    rng = random.Random(3)
+    for size in (0, 1, 2, 5, 16, 40):
+        for _ in range(50):
+            current = list(range(size))
+            rng.shuffle(current)
+            desired = list(range(size))
+            rng.shuffle(desired)
+            updates = seed.seed_updates(current, desired)
+            assert apply_updates(current, updates) == desired
+            assert len(updates) < max(size, 1)
+
+
+def test_seed_updates_skip_participants_in_place():
+    assert seed.seed_updates([1, 2, 3, 4], [1, 2, 3, 4]) == []
+    # Moving the last participant up shifts everyone else into place
+    assert seed.seed_updates([1, 2, 3, 4], [4, 1, 2, 3]) == [(4, 1)]
+    assert seed.seed_updates([2, 1, 3, 4], [1, 2, 3, 4]) == [(1, 1)]
+
+
+def test_seed(server, elos):
+    session = seed.ChallongeSession(server.url, 0, CREDENTIALS)
+    before = server.seeds("pool0")
+    want = expected(server, elos, "pool0")
+    assert before != want
+    seed.seed("pool0", elos, session)
+    assert server.seeds("pool0") == want
+    puts = [request for request in server.requests if request[0] == "PUT"]
+    assert len(puts) == len(seed.seed_updates(before, want))
+    # Seeding again finds everyone in place
+    seed.seed("pool0", elos, session)
+    assert len([request for request in server.requests
+                if request[0] == "PUT"]) == len(puts)
+
+
+def test_seed_all(server, elos, monkeypatch):
+    monkeypatch.setattr(seed, "open_players", lambda: elos)
+    monkeypatch.setattr(seed, "get_credentials", lambda: CREDENTIALS)
+    want = {tourney_id: expected(server, elos, tourney_id)
+            for tourney_id in server.tournaments}
+    seed.seed_all(list(server.tournaments), jobs=3, rate=0,
+                  api_url=server.url)
+    for tourney_id in server.tournaments:
+        assert server.seeds(tourney_id) == want[tourney_id]
+
+
+def test_retries_when_overloaded(server, elos, monkeypatch):
+    monkeypatch.setattr(seed, "BACKOFF", 0)
+    server.failures = seed.RETRIES - 1
+    session = seed.ChallongeSession(server.url, 0, CREDENTIALS)
+    want = expected(server, elos, "pool1")
+    seed.seed("pool1", elos, session)
+    assert server.seeds("pool1") == want
+
+
+def test_gives_up(server, monkeypatch):
+    monkeypatch.setattr(seed, "BACKOFF", 0)
+    server.failures = seed.RETRIES
+    session = seed.ChallongeSession(server.url, 0, CREDENTIALS)
+    with pytest.raises(requests.HTTPError):
+        session.participants("pool1")
+    assert len(server.requests) == seed.RETRIES
+
+
+def test_client_errors_are_not_retried(server):
+    session = seed.ChallongeSession(server.url, 0, CREDENTIALS)
+    with pytest.raises(requests.HTTPError):
+        session.participants("missing")
+    assert len(server.requests) == 1
@@ -0,0 +1,115 @@
+"""
+Tests of snapshot.py: what a snapshot reads back, byte order, and when
+open_players uses it instead of loading the players.
+"""
+
+import os
+
+import pytest
+
+import snapshot
+from elo_calculator import EloCalculator
+from elo_list import EloList
+from name_resolver import NameResolver
+from test_engines import results
+from test_incremental import head
+
+
+def calculate(data):
+    calculator = EloCalculator(resolver=NameResolver({}, []))
+    calculator.calculate_data(*data)
+    elos = EloList()
+    elos.elolist = calculator.get_elo_list()
+    # A name that is longer in UTF-8 than in characters
+    elos.roster()[0].name = "JOSÉ"
+    return elos
+
+
+@pytest.fixture(scope="module")
+def elos(data):
+    return calculate(data)
+
+
+def paths(directory):
+    return {name: str(directory / name) for name in
+            ("players.pkl", "h2h.bin", "history.bin", "snapshot.bin")}
+
+
+def save(elos, files):
+    elos.save(files["players.pkl"], files["h2h.bin"], files["history.bin"],
+              files["snapshot.bin"])
+
+
+def open_players(files):
+    return snapshot.open_players(files["snapshot.bin"], files["players.pkl"],
+                                 files["h2h.bin"])
+
+
+def check(opened, elos):
+    roster = elos.roster()
+    assert opened.names == [player.name for player in roster]
+    assert list(opened.elos) == [player.elo for player in roster]
+    assert list(opened.won) == [player.won for player in roster]
+    assert list(opened.played) == [player.played for player in roster]
+    assert list(opened.ranking) == [player.id for player in elos.ranked()]
+    assert results([opened.load_player(pid) for pid in range(len(roster))]) \
+        == results(roster)
+    assert opened.player("josé").name == "JOSÉ"
+    names = [player.name for player in roster[::7]]
+    assert opened.seed_order(names) == elos.seed_order(names)
+
+
+def test_round_trip(elos, tmp_path):
+    files = paths(tmp_path)
+    snapshot.write(elos, files["snapshot.bin"])
+    with snapshot.Snapshot(files["snapshot.bin"]) as opened:
+        check(opened, elos)
+
+
+def test_byte_swapped(elos, tmp_path, monkeypatch):
+    files = paths(tmp_path)
+    snapshot.write(elos, files["snapshot.bin"])
+    native = (tmp_path / "snapshot.bin").read_bytes()
+    # Written and read the way a machine of the other byte order would
+    monkeypatch.setattr(snapshot, "SWAP", not snapshot.SWAP)
+    snapshot.write(elos, files["snapshot.bin"])
+    assert (tmp_path / "snapshot.bin").read_bytes() != native
+    with snapshot.Snapshot(files["snapshot.bin"]) as opened:
+        check(opened, elos)
+
+
+def test_open_players(data, elos, tmp_path):
+    files = paths(tmp_path)
+    save(elos, files)
+    opened = open_players(files)
+    assert isinstance(opened, snapshot.Snapshot)
+    opened.close()
+    # Modification times don't matter
+    os.utime(files["snapshot.bin"], (0, 0))
+    opened = open_players(files)
+    assert isinstance(opened, snapshot.Snapshot)
+    opened.close()
+    # Other players saved without a new snapshot
+    other = calculate(head(data, 20))
+    other.save(files["players.pkl"], files["h2h.bin"], files["history.bin"],
+               str(tmp_path / "other.bin"))
+    opened = open_players(files)
+    assert isinstance(opened, EloList)
+    assert results(opened.roster()) == results(other.roster())
+
+
+def test_open_players_without_snapshot(elos, tmp_path):
+    files = paths(tmp_path)
+    save(elos, files)
+    with open(files["snapshot.bin"], "wb") as f:
+        f.write(b"CESNAPSH")
+    assert isinstance(open_players(files), EloList)
+    os.remove(files["snapshot.bin"])
+    assert isinstance(open_players(files), EloList)
+    # Nothing to compare the snapshot with
+    save(elos, files)
+    os.remove(files["h2h.bin"])
+    assert isinstance(open_players(files), EloList)
+    save(elos, files)
+    os.remove(files["players.pkl"])
+    assert isinstance(open_players(files), snapshot.Snapshot)
@@ -0,0 +1,165 @@
+"""
+Tests of tourney_db.py: calculating elos from the database must give what
+calculating them from the pickles does, and its queries must agree with
+the players.
+"""
+
+import os
+from datetime import date, datetime, time, timedelta
+
+import pytest
+
+import synthetic
+import tourney_db
+from elo_list import EloList
+from name_resolver import NameResolver
+from rating_history import to_time
+from test_engines import results
+from test_incremental import head
+
+
+def pickles(directory):
+    return [str(directory / "obj" / (name + ".pkl"))
+            for name in ("tournaments", "participants", "matches")]
+
+
+@pytest.fixture
+def saved(data, tmp_path, monkeypatch):
+    """
+    Path of a database of the synthetic data, with the same data pickled
+    next to it. Checkpoints go under tmp_path too.
+    """
+    monkeypatch.chdir(tmp_path)
+    synthetic.write(data, str(tmp_path))
+    dbfile = str(tmp_path / "obj" / "tourneys.db")
+    tourney_db.write(*data, dbfile=dbfile)
+    return dbfile
+
+
+def from_pickles(directory, **options):
+    elos = EloList()
+    elos.calculate_elos(*pickles(directory), **options)
+    return elos
+
+
+def from_database(dbfile, **options):
+    elos = EloList()
+    elos.calculate_elos_from_database(dbfile, **options)
+    return elos
+
+
+def same(elos, other):
+    assert results(elos.elolist) == results(other.elolist)
+    assert [player.name for player in elos.ranked()] \
+        == [player.name for player in other.ranked()]
+    assert [list(map(str, player.placings)) for player in elos.roster()] \
+        == [list(map(str, player.placings)) for player in other.roster()]
+
+
+@pytest.mark.parametrize("order", ("file", "started"))
+@pytest.mark.parametrize("engine", ("object", "array"))
+def test_same_as_pickles(saved, tmp_path, engine, order):
+    same(from_database(saved, engine=engine, order=order),
+         from_pickles(tmp_path, engine=engine, order=order))
+
+
+def test_incremental(data, saved, tmp_path):
+    tourney_db.write(*head(data, 10), dbfile=saved)
+    from_database(saved, incremental=True)
+    assert os.path.exists(os.path.join("obj", "checkpoint.pkl"))
+    # Upserted over the first ten, then replayed from the checkpoint
+    tourney_db.write(*data, dbfile=saved)
+    same(from_database(saved, incremental=True), from_pickles(tmp_path))
+
+
+def test_rewrite(data, saved):
+    tourney_db.write(*head(data, 10), dbfile=saved)
+    with tourney_db.TourneyDatabase(saved) as database:
+        tournaments, participants, all_matches = database.load()
+        assert tournaments == data[0][:10]
+        assert [list(rows) for rows in participants] == data[1][:10]
+        assert [len(rows) for rows in all_matches] \
+            == [len(matches) for matches in data[2][:10]]
+        # Nothing is left of the tournaments no longer listed
+        for table in ("tournaments", "participants", "matches"):
+            assert database.connection.execute(
+                "SELECT COUNT(DISTINCT revision) FROM "
+                + table).fetchone()[0] == 1
+
+
+def test_streamed_matches(data, saved):
+    with tourney_db.TourneyDatabase(saved) as database:
+        all_matches = database.load()[2]
+        assert len(all_matches) == len(data[2])
+        for rows, matches in zip(all_matches[::5], data[2][::5]):
+            assert list(rows) == [
+                {key: match[key] for key in
+                 ("id", "tournament-id", "winner-id", "loser-id",
+                  "scores-csv", "started-at", "completed-at")}
+                for match in matches]
+
+
+def test_h2h_details(saved, tmp_path):
+    elos = from_pickles(tmp_path)
+    players = elos.ranked()[:12]
+    with tourney_db.TourneyDatabase(saved) as database:
+        for player in players:
+            for other in players:
+                assert database.h2h_details(player.name, other.name) \
+                    == player.h2h_details(other)
+        assert database.h2h_details(players[0].name, "NOBODY") \
+            == "No matches against NOBODY recorded."
+
+
+@pytest.mark.parametrize("bounds", ("times", "dates"))
+def test_matches_between(data, saved, bounds):
+    tournaments, participants, all_matches = data
+    names = {participant["id"]: participant["display-name"].upper()
+             for participantlist in participants
+             for participant in participantlist}
+    if bounds == "times":
+        # Half of one tournament's sets
+        start = tournaments[5]["started-at"] + timedelta(hours=1)
+        end = start + timedelta(hours=2)
+    else:
+        # Dates are days in local time, from the start of one to the end
+        # of the other
+        start = tournaments[5]["started-at"].date().isoformat()
+        end = tournaments[7]["started-at"].date().isoformat()
+    first = datetime.combine(date.fromisoformat(start), time.min) \
+        if bounds == "dates" else start
+    expected = sorted(
+        ((match["id"], names[match["winner-id"]], names[match["loser-id"]])
+         for matches in all_matches for match in matches
+         if to_time(first) <= to_time(match["started-at"]) <= to_time(end)),
+        key=lambda x: x[0])
+    assert expected
+    with tourney_db.TourneyDatabase(saved) as database:
+        found = database.matches_between(start, end)
+    assert [match["started-at"] for match, winner, loser in found] \
+        == sorted(match["started-at"] for match, winner, loser in found)
+    assert sorted((match["id"], winner, loser)
+                  for match, winner, loser in found) == expected
+
+
+def test_update_names(data, saved):
+    name = data[1][0][0]["display-name"].upper()
+    resolver = NameResolver({name: "SOMEONE ELSE"}, [])
+    assert tourney_db.update_names(saved, resolver) \
+        == sum(participant["display-name"].upper() == name
+               for participantlist in data[1]
+               for participant in participantlist)
+    with tourney_db.TourneyDatabase(saved) as database:
+        assert database.connection.execute(
+            "SELECT COUNT(*) FROM participants WHERE player = ?",
+            (name,)).fetchone()[0] == 0
+    assert tourney_db.update_names(saved, resolver) == 0
+
+
+def test_other_version(tmp_path):
+    dbfile = str(tmp_path / "other.db")
+    connection = tourney_db.connect(dbfile)
+    connection.execute("PRAGMA user_version = 99")
+    connection.close()
+    with pytest.raises(ValueError):
+        tourney_db.TourneyDatabase(dbfile)
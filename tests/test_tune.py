@@ -0,0 +1,91 @@
+"""
+Tests of tune.py: with the parameters in player.py, replaying the encoded
+history must give EloCalculator's elos, and the scores of predicting each
+match from the Player objects.
+"""
+
+import math
+
+import pytest
+
+import tune
+from elo_calculator import EloCalculator
+
+# The parameters player.py uses
+DEFAULTS = {"schedule": "constant", "k": 32, "weights": "current",
+            "default": 1200, "ignoregames": False}
+
+
+@pytest.fixture(scope="module")
+def history(data):
+    return tune.MatchHistory.from_data(*data)
+
+
+def direct(data, skip=0):
+    """
+    Replay matches through Player objects, predicting each from the elos
+    before it.
+
+    Returns:
+        tuple: (players, average log-loss, average Brier score)
+    """
+    calculator = EloCalculator()
+    calculator.read_tournaments(data[0])
+    calculator.read_participants(data[1])
+    logloss = 0.0
+    brier = 0.0
+    scored = 0
+    played = 0
+    for tournament in data[2]:
+        for match in tournament:
+            if match["winner-id"] is not None:
+                winner = calculator.players_by_name[
+                    calculator.names_by_id[match["winner-id"]]]
+                loser = calculator.players_by_name[
+                    calculator.names_by_id[match["loser-id"]]]
+                if played >= skip and winner is not loser:
+                    R1 = 10**(winner.elo/400)
+                    R2 = 10**(loser.elo/400)
+                    logloss -= math.log(R1/(R1+R2))
+                    brier += (1 - R1/(R1+R2))**2
+                    scored += 1
+                played += 1
+            calculator.parse_match(match)
+    return calculator.roster, logloss / scored, brier / scored
+
+
+def test_default_parameters_match_elo_calculator(data, history):
+    players, logloss, brier = direct(data)
+    elos, *_ = tune.replay(history, DEFAULTS)
+    assert elos == [player.elo for player in players]
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_sweep(data, history, jobs):
+    grid = tune.parameter_grid(kvalues=(16, 32), schedules=("constant",
+                                                            "bands"),
+                               weights=("current", "legacy"),
+                               ignoregames=(False, True))
+    # Two schedules by two values of k by two weights, or by ignoring
+    # game counts
+    assert len(grid) == 12
+    scores = tune.sweep(history, grid, skip=50, jobs=jobs)
+    assert [row["logloss"] for row in scores] \
+        == sorted(row["logloss"] for row in scores)
+    default = [row for row in scores
+               if {key: row[key] for key in DEFAULTS} == DEFAULTS]
+    assert len(default) == 1
+    players, logloss, brier = direct(data, skip=50)
+    assert default[0]["logloss"] == pytest.approx(logloss, rel=1e-12)
+    assert default[0]["brier"] == pytest.approx(brier, rel=1e-12)
+    # Other parameters predict differently
+    assert len({row["logloss"] for row in scores}) == len(scores)
+
+
+def test_report(history):
+    grid = tune.parameter_grid(kvalues=(32,), schedules=("constant",),
+                               weights=("current",))
+    lines = list(tune.iter_report(tune.sweep(history, grid, jobs=1)))
+    assert len(lines) == 2
+    assert lines[1].split()[3:] == ["constant", "32", "current", "1200",
+                                    "no"]
@@ -0,0 +1,190 @@
+"""
+Keep a per-tournament cache of data downloaded from Challonge.
+
+Every tournament is stored in its own pair of files under obj/cache, named
+after the id used in tournamentlist.py: the tournament and its participants
+as a (tournament, participants) tuple, and its matches in a file of their
+own, so that they are only unpickled when they are needed. An index file
+records the order of the tournaments so that the cache can be assembled
+into the same lists that save_tourneys.py writes to obj/*.pkl.
+"""
+
+import os
+import pickle
+
+CACHEDIR = os.path.join("obj", "cache")
+INDEXFILE = "index.pkl"
+# Added to a tournament id for the name of the file of its matches
+MATCHESSUFFIX = ".matches"
+
+
+def entry_path(tourney_id, cachedir=CACHEDIR):
+    """
+    Return the path of the cache entry for a tournament.
+    """
+    return os.path.join(cachedir, tourney_id + ".pkl")
+
+
+def matches_path(tourney_id, cachedir=CACHEDIR):
+    """
+    Return the path of the cached matches of a tournament.
+    """
+    return os.path.join(cachedir, tourney_id + MATCHESSUFFIX + ".pkl")
+
+
+def _load(path):
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+
+def read_entry(tourney_id, cachedir=CACHEDIR, with_matches=True):
+    """
+    Read a cached tournament.
+
+    Args:
+        with_matches (bool): if False, matches is None and they are not
+                             read at all
+
+    Returns:
+        tuple: (tournament, participants, matches) json objects,
+               or None if the tournament has not been cached yet
+    """
+    entry = _load(entry_path(tourney_id, cachedir))
+    if entry is None:
+        return None
+    if len(entry) == 3:
+        # Written before matches had a file of their own
+        return entry if with_matches else entry[:2] + (None,)
+    if not with_matches:
+        return entry + (None,)
+    matches = _load(matches_path(tourney_id, cachedir))
+    if matches is None:
+        return None
+    return entry + (matches,)
+
+
+def read_matches(tourney_id, cachedir=CACHEDIR):
+    """
+    Read only the matches of a cached tournament.
+
+    Returns:
+        list: match json objects, or None if they have not been cached
+    """
+    matches = _load(matches_path(tourney_id, cachedir))
+    if matches is None:
+        entry = _load(entry_path(tourney_id, cachedir))
+        if entry is not None and len(entry) == 3:
+            matches = entry[2]
+    return matches
+
+
+def _dump(obj, path):
+    """
+    Pickle an object to a file without ever leaving a partial file behind.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temppath = path + ".tmp"
+    with open(temppath, "wb") as f:
+        pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(temppath, path)
+
+
+def write_entry(tourney_id, entry, cachedir=CACHEDIR):
+    """
+    Save a (tournament, participants, matches) tuple to the cache.
+
+    Matches are written first, so if the run is interrupted in between,
+    the tournament is still the old one and is fetched again next time.
+    """
+    _dump(entry[2], matches_path(tourney_id, cachedir))
+    _dump(tuple(entry[:2]), entry_path(tourney_id, cachedir))
+
+
+def is_current(cached, tournament):
+    """
+    Check whether a cached tournament is still up to date.
+
+    Args:
+        cached (tuple): Cache entry as returned by read_entry, or None
+        tournament (json object): Freshly fetched tournament
+
+    Returns:
+        bool: True if the tournament has not changed since it was cached
+    """
+    if cached is None:
+        return False
+    old = cached[0]
+    return (old.get("updated-at") == tournament.get("updated-at")
+            and old.get("state") == tournament.get("state"))
+
+
+def write_index(tourney_ids, cachedir=CACHEDIR):
+    """
+    Record which tournaments make up the cache, and in which order.
+    """
+    _dump(list(tourney_ids), os.path.join(cachedir, INDEXFILE))
+
+
+def has_index(cachedir=CACHEDIR):
+    """
+    Return True if the cache has been written by save_tourneys.py.
+    """
+    return os.path.exists(os.path.join(cachedir, INDEXFILE))
+
+
+def read_index(cachedir=CACHEDIR):
+    """
+    Return the ids of the tournaments in the cache, in order.
+    """
+    with open(os.path.join(cachedir, INDEXFILE), "rb") as f:
+        return pickle.load(f)
+
+
+def load_all(cachedir=CACHEDIR, with_matches=True):
+    """
+    Assemble the cache into the lists that save_tourneys.py pickles.
+
+    Args:
+        cachedir (str): path to the cache directory
+        with_matches (bool): if False, matches is None and no match is
+                             unpickled, e.g. when they will be read from a
+                             match_store file instead (see load_matches)
+
+    Returns:
+        tuple: (tournaments, participants, matches), where participants and
+               matches are lists of lists grouped by tournament
+    """
+    tournaments = []
+    participants = []
+    matches = []
+    for tourney_id in read_index(cachedir):
+        entry = read_entry(tourney_id, cachedir, with_matches)
+        if entry is None:
+            raise FileNotFoundError("Tournament " + tourney_id
+                                    + " is missing from " + cachedir)
+        tournaments.append(entry[0])
+        participants.append(entry[1])
+        matches.append(entry[2])
+    if not with_matches:
+        matches = None
+    return tournaments, participants, matches
+
+
+def load_matches(cachedir=CACHEDIR):
+    """
+    Assemble only the matches of the cache, grouped by tournament.
+
+    Used after load_all(with_matches=False), so that nothing is read
+    twice.
+    """
+    all_matches = []
+    for tourney_id in read_index(cachedir):
+        matches = read_matches(tourney_id, cachedir)
+        if matches is None:
+            raise FileNotFoundError("Matches of " + tourney_id
+                                    + " are missing from " + cachedir)
+        all_matches.append(matches)
+    return all_matches
@@ -0,0 +1,480 @@
+#!/usr/bin/python3
+"""
+Keep tournaments, participants and matches in an indexed SQLite database.
+
+The pickles written by save_tourneys.py have to be loaded in full to answer
+anything. The database holds the same data with indexes on tournament id,
+participant id, player name (after aliases), winner and loser id and
+date, so that questions such as every set between two players, or every
+set played in a month, are answered without loading anything else.
+
+Tournaments and participants are kept whole as pickled json objects next
+to the columns that are indexed. Matches only keep the fields the
+calculations use, the same ones as match_store.py.
+
+Only the standard library's sqlite3 is used.
+
+Usage: tourney_db.py [options] [database]
+"""
+
+import os
+import sys
+import getopt
+import pickle
+from datetime import date, datetime, time
+import sqlite3
+from player import classify_score
+from rating_history import to_time
+
+DBFILE = os.path.join("obj", "tourneys.db")
+# Changed whenever the tables change
+SCHEMAVERSION = 1
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tournaments (
+    id INTEGER PRIMARY KEY,
+    position INTEGER NOT NULL,
+    name TEXT,
+    started_at REAL,
+    revision INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tournaments_position ON tournaments (position);
+CREATE INDEX IF NOT EXISTS tournaments_started ON tournaments (started_at);
+CREATE TABLE IF NOT EXISTS participants (
+    id INTEGER PRIMARY KEY,
+    tournament_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    player TEXT NOT NULL,
+    revision INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS participants_tournament
+    ON participants (tournament_id, position);
+CREATE INDEX IF NOT EXISTS participants_player ON participants (player);
+CREATE TABLE IF NOT EXISTS matches (
+    id INTEGER PRIMARY KEY,
+    tournament_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    winner_id INTEGER,
+    loser_id INTEGER,
+    scores_csv TEXT,
+    started_at REAL,
+    started_text TEXT,
+    completed_at REAL,
+    completed_text TEXT,
+    revision INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS matches_tournament
+    ON matches (tournament_id, position);
+CREATE INDEX IF NOT EXISTS matches_winner ON matches (winner_id);
+CREATE INDEX IF NOT EXISTS matches_loser ON matches (loser_id);
+CREATE INDEX IF NOT EXISTS matches_started ON matches (started_at);
+"""
+MATCHCOLUMNS = ("id, tournament_id, winner_id, loser_id, scores_csv, "
+                "started_text, completed_text")
+USAGE = "tourney_db.py [options] [database]\nOptions:"\
+        "\n\t-h\tDisplay this help"\
+        "\n\t-w\tWrite the database from obj/*.pkl (or the cache)"\
+        "\n\t-n\tResolve player names again, e.g. after changing aliases"\
+        "\n\t-H\tPrint the sets between two players, as NAME,NAME"\
+        "\n\t-d\tPrint the sets played between two dates, as FROM,TO"\
+        " (YYYY-MM-DD)"
+
+
+def _timestamp(when):
+    # Column value of a time, None if there isn't one
+    if when is None:
+        return None
+    return to_time(when)
+
+
+def _text(when):
+    # Exact form of a time, from which it is read back
+    if when is None or isinstance(when, str):
+        return when
+    return when.isoformat()
+
+
+def _parse(text):
+    if text is None:
+        return None
+    return datetime.fromisoformat(text)
+
+
+def _blob(obj):
+    return pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+
+
+def connect(dbfile=DBFILE, readonly=False):
+    """
+    Open the database, creating its tables unless it is opened read-only.
+
+    Raises:
+        ValueError: if the database has tables of another version
+    """
+    if readonly:
+        connection = sqlite3.connect(
+            "file:" + os.path.abspath(dbfile) + "?mode=ro", uri=True)
+    else:
+        dirpath = os.path.dirname(dbfile)
+        if dirpath:
+            os.makedirs(dirpath, exist_ok=True)
+        connection = sqlite3.connect(dbfile)
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    if version == 0 and not readonly:
+        connection.executescript(SCHEMA)
+        connection.execute("PRAGMA user_version = " + str(SCHEMAVERSION))
+    elif version != SCHEMAVERSION:
+        connection.close()
+        raise ValueError(dbfile + " is not a version " + str(SCHEMAVERSION)
+                         + " tournament database")
+    return connection
+
+
+def write(tournaments, participants, all_matches, dbfile=DBFILE,
+          resolver=None):
+    """
+    Save tournaments, participants and matches to the database.
+
+    Everything is upserted in one transaction, so readers see either the
+    old or the new data. Rows of tournaments, participants or matches that
+    are no longer in the lists are deleted.
+
+    Args:
+        tournaments (list): tournament json objects, in order
+        participants (list of lists): participants grouped by tournament
+        all_matches (list of lists): matches grouped by tournament
+        dbfile (str): path of the database
+        resolver (NameResolver): Turns display names into player names,
+                                 default from aliases.py
+    """
+    if resolver is None:
+        import name_resolver
+        resolver = name_resolver.default()
+    connection = connect(dbfile)
+    try:
+        with connection:
+            revision = connection.execute(
+                "SELECT COALESCE(MAX(revision), 0) + 1 FROM tournaments"
+            ).fetchone()[0]
+            connection.executemany(
+                "INSERT INTO tournaments VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET position = excluded.position,"
+                " name = excluded.name, started_at = excluded.started_at,"
+                " revision = excluded.revision, data = excluded.data",
+                ((tournament["id"], position, tournament.get("name"),
+                  _timestamp(tournament.get("started-at")), revision,
+                  _blob(tournament))
+                 for position, tournament in enumerate(tournaments)))
+            connection.executemany(
+                "INSERT INTO participants VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET"
+                " tournament_id = excluded.tournament_id,"
+                " position = excluded.position, player = excluded.player,"
+                " revision = excluded.revision, data = excluded.data",
+                ((participant["id"], tournament["id"], position,
+                  resolver.resolve(participant["display-name"]), revision,
+                  _blob(participant))
+                 for tournament, participantlist in zip(tournaments,
+                                                        participants)
+                 for position, participant in enumerate(participantlist)))
+            connection.executemany(
+                "INSERT INTO matches VALUES "
+                "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET"
+                " tournament_id = excluded.tournament_id,"
+                " position = excluded.position,"
+                " winner_id = excluded.winner_id,"
+                " loser_id = excluded.loser_id,"
+                " scores_csv = excluded.scores_csv,"
+                " started_at = excluded.started_at,"
+                " started_text = excluded.started_text,"
+                " completed_at = excluded.completed_at,"
+                " completed_text = excluded.completed_text,"
+                " revision = excluded.revision",
+                ((match["id"], tournament["id"], position, match["winner-id"],
+                  match["loser-id"], match["scores-csv"],
+                  _timestamp(match.get("started-at")),
+                  _text(match.get("started-at")),
+                  _timestamp(match.get("completed-at")),
+                  _text(match.get("completed-at")), revision)
+                 for tournament, matches in zip(tournaments, all_matches)
+                 for position, match in enumerate(matches)))
+            for table in ("tournaments", "participants", "matches"):
+                connection.execute("DELETE FROM " + table
+                                   + " WHERE revision != ?", (revision,))
+    finally:
+        connection.close()
+
+
+def update_names(dbfile=DBFILE, resolver=None):
+    """
+    Resolve the player name of every participant again.
+
+    Returns:
+        int: Number of participants whose player changed
+    """
+    if resolver is None:
+        import name_resolver
+        resolver = name_resolver.default()
+    connection = connect(dbfile)
+    try:
+        with connection:
+            changed = []
+            for pid, data, old in connection.execute(
+                    "SELECT id, data, player FROM participants").fetchall():
+                name = resolver.resolve(pickle.loads(data)["display-name"])
+                if name != old:
+                    changed.append((name, pid))
+            connection.executemany(
+                "UPDATE participants SET player = ? WHERE id = ?", changed)
+    finally:
+        connection.close()
+    return len(changed)
+
+
+def _match(row):
+    # A match json object with the fields the calculations use
+    return {"id": row[0], "tournament-id": row[1], "winner-id": row[2],
+            "loser-id": row[3], "scores-csv": row[4],
+            "started-at": _parse(row[5]), "completed-at": _parse(row[6])}
+
+
+class TournamentRows:
+    """
+    The participants or matches of one tournament, read from the database
+    each time they are iterated over.
+    """
+
+    def __init__(self, database, table, tournament_id, count):
+        self.database = database
+        self.table = table
+        self.tournament_id = tournament_id
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return self.database.rows(self.table, self.tournament_id)
+
+
+class Grouped:
+    """
+    Participants or matches grouped by tournament, in the same form as the
+    lists save_tourneys.py pickles.
+
+    Supports len, indexing, slicing and iteration. Nothing is read until a
+    tournament's rows are iterated over, and then they are streamed from a
+    cursor.
+    """
+
+    def __init__(self, database, table):
+        self.database = database
+        self.table = table
+        counts = dict(database.connection.execute(
+            "SELECT tournament_id, COUNT(*) FROM " + table
+            + " GROUP BY tournament_id"))
+        self.tournament_ids = database.tournament_ids
+        self.counts = [counts.get(tid, 0) for tid in self.tournament_ids]
+
+    def __len__(self):
+        return len(self.tournament_ids)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("tournament index out of range")
+        return TournamentRows(self.database, self.table,
+                              self.tournament_ids[i], self.counts[i])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class TourneyDatabase:
+    """
+    A tournament database opened for reading.
+
+    Fields include:
+    connection      sqlite3.Connection (read-only)
+    tournament_ids  list of int (in the order of the tournament list)
+    """
+
+    def __init__(self, dbfile=DBFILE):
+        """
+        Raises:
+            ValueError: if the file is not a database of this version
+        """
+        self.connection = connect(dbfile, readonly=True)
+        self.tournament_ids = [row[0] for row in self.connection.execute(
+            "SELECT id FROM tournaments ORDER BY position")]
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def tournaments(self):
+        """
+        Return every tournament json object, in order.
+        """
+        return [pickle.loads(row[0]) for row in self.connection.execute(
+            "SELECT data FROM tournaments ORDER BY position")]
+
+    def rows(self, table, tournament_id):
+        """
+        Generate the participants or matches of one tournament, in order.
+        """
+        if table == "participants":
+            cursor = self.connection.execute(
+                "SELECT data FROM participants WHERE tournament_id = ?"
+                " ORDER BY position", (tournament_id,))
+            for row in cursor:
+                yield pickle.loads(row[0])
+        else:
+            cursor = self.connection.execute(
+                "SELECT " + MATCHCOLUMNS + " FROM matches"
+                " WHERE tournament_id = ? ORDER BY position",
+                (tournament_id,))
+            for row in cursor:
+                yield _match(row)
+
+    def load(self):
+        """
+        Return the data in the same form as elo_calculator.load_files.
+
+        Participants and matches are streamed from the database as they
+        are read.
+
+        Returns:
+            tuple: (tournaments, participants, matches)
+        """
+        return (self.tournaments(), Grouped(self, "participants"),
+                Grouped(self, "matches"))
+
+    def h2h(self, name, other):
+        """
+        Return every set between two players, in the order of the
+        tournament list (the order they are replayed in by default).
+
+        Args:
+            name (str): Player name, after aliases
+            other (str): Player name of the opponent
+
+        Returns:
+            list of tuples: (match json object, True if name won)
+        """
+        query = ("SELECT " + ", ".join("m." + column for column
+                                       in MATCHCOLUMNS.split(", "))
+                 + ", ?, t.position, m.position FROM participants w"
+                 " JOIN matches m ON m.winner_id = w.id"
+                 " JOIN participants l ON l.id = m.loser_id"
+                 " JOIN tournaments t ON t.id = m.tournament_id"
+                 " WHERE w.player = ? AND l.player = ?")
+        rows = self.connection.execute(
+            query + " UNION ALL " + query + " ORDER BY 9, 10",
+            (1, name, other, 0, other, name)).fetchall()
+        return [(_match(row), bool(row[7])) for row in rows]
+
+    def h2h_details(self, name, other):
+        """
+        Return the same text as Player.h2h_details between two players.
+
+        Sets with a score that isn't counted are left out, as they are
+        from head-to-head records.
+        """
+        sets = [(match, won) for match, won in self.h2h(name, other)
+                if classify_score(match["scores-csv"]) is not None]
+        if not sets:
+            return "No matches against " + other + " recorded."
+        lines = [name + "'s detailed head-to-head against " + other + ":\n",
+                 "Wins:\n"]
+        for result in (True, False):
+            if not result:
+                lines.append("Losses:\n")
+            for match, won in sets:
+                if won == result:
+                    lines.append(str(match["started-at"])[0:10] + ": "
+                                 + str(match["scores-csv"]) + "\n")
+        return "".join(lines)
+
+    def matches_between(self, start, end):
+        """
+        Return every set started between two points in time, in order.
+
+        Args:
+            start: A timestamp, datetime, ISO 8601 string or date; a date
+                   means the start of that day
+            end: The same; a date means the end of that day
+
+        Returns:
+            list of tuples: (match json object, winner name, loser name)
+        """
+        if isinstance(start, str) and len(start) == 10:
+            start = date.fromisoformat(start)
+        if isinstance(start, date) and not isinstance(start, datetime):
+            start = datetime.combine(start, time.min)
+        cursor = self.connection.execute(
+            "SELECT " + ", ".join("m." + column for column
+                                  in MATCHCOLUMNS.split(", "))
+            + ", w.player, l.player FROM matches m"
+            " LEFT JOIN participants w ON w.id = m.winner_id"
+            " LEFT JOIN participants l ON l.id = m.loser_id"
+            " WHERE m.started_at BETWEEN ? AND ?"
+            " ORDER BY m.started_at, m.id", (to_time(start), to_time(end)))
+        return [(_match(row), row[7], row[8]) for row in cursor]
+
+
+def load(dbfile=DBFILE):
+    """
+    Open a database and return its data as TourneyDatabase.load does.
+    """
+    return TourneyDatabase(dbfile).load()
+
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hwnH:d:")
+    except getopt.GetoptError:
+        print(USAGE)
+        sys.exit(2)
+    dbfile = args[0] if args else DBFILE
+    for opt, arg in opts:
+        if opt == "-h":
+            print(USAGE)
+            sys.exit()
+        if opt == "-w":
+            import tourney_cache
+            if tourney_cache.has_index():
+                data = tourney_cache.load_all()
+            else:
+                from elo_calculator import load_files
+                data = load_files("obj/tournaments.pkl",
+                                  "obj/participants.pkl", "obj/matches.pkl")
+            write(*data, dbfile=dbfile)
+        if opt == "-n":
+            print(str(update_names(dbfile)) + " participants renamed")
+        if opt == "-H":
+            name, other = (part.strip().upper() for part in arg.split(","))
+            with TourneyDatabase(dbfile) as database:
+                print(database.h2h_details(name, other))
+        if opt == "-d":
+            start, end = (part.strip() for part in arg.split(","))
+            with TourneyDatabase(dbfile) as database:
+                for match, winner, loser in database.matches_between(start,
+                                                                     end):
+                    if winner is None:
+                        continue
+                    print("{} {} def. {} {}".format(
+                        str(match["started-at"])[0:16], winner, loser,
+                        match["scores-csv"]))
@@ -0,0 +1,352 @@
+#!/usr/bin/python3
+"""
+Compare elo parameters by how well they predict our own match history.
+
+Every match is replayed in order under each set of parameters: the K
+schedule and its constant, the score weights, the starting elo and whether
+game counts are ignored. Before each match, the winner's expected score
+(as in Player.calculateWin) is taken as the prediction that they win, and
+the parameters are scored by the average log-loss and Brier score of those
+predictions. Lower is better for both.
+
+The matches are read and encoded into arrays once, then shared with a pool
+of processes that each replay them under different parameters.
+
+Usage: tune.py [options]
+"""
+
+import sys
+import os
+import math
+import getopt
+import itertools
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from elo_calculator import EloCalculator, load_files
+from elo_list import openFile
+import player
+import tourney_cache
+
+
+def _constant(k, elo, played, default):
+    return k
+
+
+def _distance(k, elo, played, default):
+    # Lower k the further a player is from the starting elo
+    return 1.5 * k - 1.5 * math.sqrt(abs(default - elo))
+
+
+def _bands(k, elo, played, default):
+    # Lower k the higher the elo; k is used for 1300-1400
+    if elo <= 1200:
+        return 2 * k
+    if elo <= 1300:
+        return 4 * k / 3
+    if elo <= 1400:
+        return k
+    if elo <= 1500:
+        return 2 * k / 3
+    return k / 3
+
+
+def _provisional(k, elo, played, default):
+    # Lower k the more sets a player has played
+    return 3 * k / math.sqrt(played)
+
+
+# K schedules, called with (k, elo, sets played including this one,
+# starting elo) and returning the k to use for that player's next change
+KSCHEDULES = {
+    "constant": _constant,
+    "distance": _distance,
+    "bands": _bands,
+    "provisional": _provisional,
+}
+# Tables of (winner result, loser result) by set score, see SCOREWEIGHTS
+WEIGHTSETS = {
+    "current": player.SCOREWEIGHTS,
+    "legacy": {  # Weights elotomorrow.py used to use
+        "1-0": (1.25, 0), "2-0": (1.25, 0), "3-1": (1.25, 0),
+        "2-1": (1, .33), "3-2": (1, .33),
+        "3-0": (1.5, -.25),
+    },
+    "margin": {  # Every game of difference counts
+        "1-0": (1, 0), "0-1": (1, 0),
+        "2-1": (.9, .1), "1-2": (.9, .1), "3-2": (.9, .1), "2-3": (.9, .1),
+        "2-0": (1, 0), "0-2": (1, 0), "3-1": (1, 0), "1-3": (1, 0),
+        "3-0": (1.1, -.1), "0-3": (1.1, -.1),
+    },
+}
+USAGE = "tune.py [options]\nOptions:"\
+        "\n\t-h\tDisplay this help"\
+        "\n\t-k\tComma separated values of k to try (default 16,24,32,40,48)"\
+        "\n\t-s\tComma separated K schedules to try (default: "\
+        + ",".join(KSCHEDULES) + ")"\
+        "\n\t-w\tComma separated score weights to try (default: "\
+        + ",".join(WEIGHTSETS) + ")"\
+        "\n\t-d\tComma separated starting elos to try (default 1200)"\
+        "\n\t-g\tAlso try ignoring game counts (IGNOREGAMES)"\
+        "\n\t-b\tRank by Brier score instead of log-loss"\
+        "\n\t-n\tNumber of early matches to replay without scoring"\
+        "\n\t-j\tNumber of processes (default: one per CPU)"\
+        "\n\t-o\tAlso write the report to this file"
+
+
+class MatchHistory:
+    """
+    Every match with a winner, encoded as arrays in the order played.
+
+    Fields include:
+    players         int (number of players)
+    winners         array of int (id of the winner)
+    losers          array of int (id of the loser)
+    scores          array of int (index into strings, -1 if not reported)
+    strings         list of str (every distinct scores-csv)
+    """
+
+    def __init__(self, players=0):
+        self.players = players
+        self.winners = array("l")
+        self.losers = array("l")
+        self.scores = array("l")
+        self.strings = []
+
+    def __len__(self):
+        return len(self.winners)
+
+    @classmethod
+    def from_data(cls, tournaments, participants, all_matches):
+        """
+        Encode the lists saved by save_tourneys.py.
+
+        Players are named exactly as EloCalculator names them.
+        """
+        calculator = EloCalculator()
+        calculator.read_tournaments(tournaments)
+        calculator.read_participants(participants)
+        history = cls(len(calculator.roster))
+        ids = {name: p.id for name, p in calculator.players_by_name.items()}
+        index = {}
+        for tournament in all_matches:
+            for match in tournament:
+                if match["winner-id"] is None:
+                    continue
+                history.winners.append(
+                    ids[calculator.names_by_id[match["winner-id"]]])
+                history.losers.append(
+                    ids[calculator.names_by_id[match["loser-id"]]])
+                score = match["scores-csv"]
+                if score is None:
+                    history.scores.append(-1)
+                    continue
+                if score not in index:
+                    index[score] = len(history.strings)
+                    history.strings.append(score)
+                history.scores.append(index[score])
+        return history
+
+
+def load_data():
+    """
+    Read the tournaments the same way calculate_elos.py does.
+    """
+    if tourney_cache.has_index():
+        return tourney_cache.load_all()
+    return load_files("obj/tournaments.pkl", "obj/participants.pkl",
+                      "obj/matches.pkl")
+
+
+def parameter_grid(kvalues=(16, 24, 32, 40, 48), schedules=tuple(KSCHEDULES),
+                   weights=tuple(WEIGHTSETS), defaults=(1200,),
+                   ignoregames=(False,)):
+    """
+    Return every combination of the given parameters.
+
+    Score weights are not combined with ignoring game counts, since they
+    would have no effect.
+
+    Returns:
+        list of dicts: with keys schedule, k, weights, default, ignoregames
+    """
+    grid = []
+    for schedule, k, default, ignore in itertools.product(
+            schedules, kvalues, defaults, ignoregames):
+        for table in ((None,) if ignore else weights):
+            grid.append({"schedule": schedule, "k": k, "weights": table,
+                         "default": default, "ignoregames": ignore})
+    return grid
+
+
+def _results(history, params):
+    """
+    Return the (winner, loser) results for each score string, and for
+    unreported scores at the end of the list, None for uncounted sets.
+
+    Unreported scores count as 1-0, the same as in classify_score.
+    """
+    table = WEIGHTSETS[params["weights"] or "current"]
+    results = []
+    for score in history.strings + ["1-0"]:
+        if score not in table:
+            results.append(None)
+        elif params["ignoregames"]:
+            results.append((1, 0))
+        else:
+            results.append(table[score])
+    return results
+
+
+def replay(history, params, skip=0):
+    """
+    Replay every match under a set of parameters.
+
+    The updates are the same as Player.calculateWin followed by
+    Player.calculateLoss, so with the parameters in player.py the final
+    elos are identical to EloCalculator's.
+
+    Args:
+        history (MatchHistory): Matches to replay
+        params (dict): Parameters, as made by parameter_grid
+        skip (int): Number of early matches to replay without scoring
+
+    Returns:
+        tuple: (final elos, sum of log-loss, sum of Brier score,
+                number of matches scored)
+    """
+    results = _results(history, params)
+    schedule = KSCHEDULES[params["schedule"]]
+    k = params["k"]
+    default = params["default"]
+    constant = schedule is _constant
+    elos = [float(default)] * history.players
+    played = [0] * history.players
+    logloss = 0.0
+    brier = 0.0
+    scored = 0
+    for i, (w, l, score) in enumerate(zip(history.winners, history.losers,
+                                          history.scores)):
+        R1 = 10**(elos[w]/400)
+        R2 = 10**(elos[l]/400)
+        if i >= skip and w != l:
+            expected = R1/(R1+R2)
+            logloss -= math.log(max(expected, 1e-15))
+            brier += (1 - expected)**2
+            scored += 1
+        result = results[score]
+        if result is None:
+            continue
+        played[w] += 1
+        kw = k if constant else schedule(k, elos[w], played[w], default)
+        elos[w] = elos[w] + kw*(result[0] - R1/(R1+R2))
+        R1 = 10**(elos[w]/400)
+        if l == w:
+            R2 = R1
+        played[l] += 1
+        kl = k if constant else schedule(k, elos[l], played[l], default)
+        elos[l] = elos[l] + kl*(result[1] - R2/(R1+R2))
+    return elos, logloss, brier, scored
+
+
+# The history each process replays, set once per process
+_history = None
+
+
+def _set_history(history):
+    global _history
+    _history = history
+
+
+def _evaluate(params, skip):
+    elos, logloss, brier, scored = replay(_history, params, skip)
+    scored = scored or 1
+    return dict(params, logloss=logloss/scored, brier=brier/scored)
+
+
+def sweep(history, grid, skip=0, jobs=None, order="logloss"):
+    """
+    Score every set of parameters, several at a time.
+
+    Args:
+        history (MatchHistory): Matches to replay
+        grid (list of dicts): Parameter sets, as made by parameter_grid
+        skip (int): Number of early matches to replay without scoring
+        jobs (int): Number of processes, 1 to run in this one
+        order (str): "logloss" or "brier", the score to rank by
+
+    Returns:
+        list of dicts: the parameter sets with their average logloss and
+                       brier scores added, best first
+    """
+    if jobs == 1 or len(grid) == 1:
+        _set_history(history)
+        scores = [_evaluate(params, skip) for params in grid]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs,
+                                 initializer=_set_history,
+                                 initargs=(history,)) as pool:
+            scores = list(pool.map(_evaluate, grid, [skip] * len(grid),
+                                   chunksize=max(1, len(grid) // 64)))
+    scores.sort(key=lambda x: x[order])
+    return scores
+
+
+def iter_report(scores):
+    """
+    Generate the lines of a ranked report of parameter sets.
+    """
+    yield "      LOGLOSS   BRIER  SCHEDULE      K  WEIGHTS  START  IGNORE\n"
+    for rank, row in enumerate(scores, 1):
+        yield "{:>4d}  {:.5f}  {:.5f}  {:11s} {:>3}  {:8s} {:>5}  {}\n"\
+            .format(rank, row["logloss"], row["brier"], row["schedule"],
+                    row["k"], row["weights"] or "-", row["default"],
+                    "yes" if row["ignoregames"] else "no")
+
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hk:s:w:d:gbn:j:o:")
+    except getopt.GetoptError:
+        print(USAGE)
+        sys.exit(2)
+    grid = {}
+    skip = 0
+    jobs = None
+    order = "logloss"
+    outputfile = None
+    for opt, arg in opts:
+        if opt == "-h":
+            print(USAGE)
+            sys.exit()
+        if opt == "-k":
+            grid["kvalues"] = [float(x) if "." in x else int(x)
+                               for x in arg.split(",")]
+        if opt == "-s":
+            grid["schedules"] = arg.split(",")
+        if opt == "-w":
+            grid["weights"] = arg.split(",")
+        if opt == "-d":
+            grid["defaults"] = [int(x) for x in arg.split(",")]
+        if opt == "-g":
+            grid["ignoregames"] = (False, True)
+        if opt == "-b":
+            order = "brier"
+        if opt == "-n":
+            skip = int(arg)
+        if opt == "-j":
+            jobs = int(arg)
+        if opt == "-o":
+            outputfile = arg
+    if not (all(s in KSCHEDULES for s in grid.get("schedules", ()))
+            and all(w in WEIGHTSETS for w in grid.get("weights", ()))):
+        print(USAGE)
+        sys.exit(2)
+    history = MatchHistory.from_data(*load_data())
+    grid = parameter_grid(**grid)
+    print("Replaying " + str(len(history)) + " matches under "
+          + str(len(grid)) + " sets of parameters...")
+    lines = list(iter_report(sweep(history, grid, skip, jobs, order)))
+    if outputfile is not None:
+        with openFile(os.path.abspath(outputfile), "w") as f:
+            f.writelines(lines)
+    sys.stdout.writelines(lines)